@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Compares two result files from orm_benchmark.py, case by case, and exits non-zero if anything got
+slower by more than the threshold.
+
+    python3 benchmarks/compare_benchmarks.py before.json after.json --threshold 0.1
+"""
+
+import argparse
+import json
+import sys
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare(baseline, current, threshold=0.1):
+    '''
+    Returns a list of (name, baseline seconds, current seconds, ratio, status), one per case in both runs.
+    Ratios are of the fastest runs; status is "slower", "faster" or "" depending on the threshold.
+    '''
+    rows = []
+    for name in sorted(set(baseline["results"]) & set(current["results"])):
+        before = baseline["results"][name]["min"]
+        after = current["results"][name]["min"]
+        ratio = after / before if before else float("inf")
+        if ratio > 1 + threshold:
+            status = "slower"
+        elif ratio < 1 / (1 + threshold):
+            status = "faster"
+        else:
+            status = ""
+        rows.append((name, before, after, ratio, status))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares two orm_benchmark.py result files.")
+    parser.add_argument("baseline", help="Results from the earlier run.")
+    parser.add_argument("current", help="Results from the run being checked.")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Fraction slower that counts as a regression.")
+    args = parser.parse_args()
+    baseline = load(args.baseline)
+    current = load(args.current)
+    for label, results in [("baseline", baseline), ("current", current)]:
+        meta = results.get("meta", {})
+        print("{:<9} {} python {} on {}".format(label, meta.get("revision") or "(unknown revision)", meta.get("python"), meta.get("machine")))
+    rows = compare(baseline, current, threshold=args.threshold)
+    print("{:<36} {:>12} {:>12} {:>8}".format("case", "before ms", "after ms", "ratio"))
+    for name, before, after, ratio, status in rows:
+        print("{:<36} {:12.3f} {:12.3f} {:8.2f} {}".format(name, before * 10**3, after * 10**3, ratio, status))
+    missing = sorted(set(baseline["results"]) ^ set(current["results"]))
+    if missing:
+        print("Only in one of the runs: {}".format(", ".join(missing)))
+    regressions = [row for row in rows if row[4] == "slower"]
+    if regressions:
+        print("{} case(s) slower by more than {:.0%}.".format(len(regressions), args.threshold))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Compares the old json-round-trip version of orm.ensure_ddbsafe with the current single-pass one.
+
+    PYTHONPATH=src python3 benchmarks/ensure_ddbsafe_benchmark.py
+"""
+
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from datetime import datetime, timedelta
+import decimal
+import json
+import random
+import timeit
+
+from sneks.ddb import orm
+
+def legacy_ensure_ddbsafe(d):
+    def _ensure_ddbsafe(d):
+        if isinstance(d, dict):
+            return {k:_ensure_ddbsafe(d[k]) for k in d}
+        elif isinstance(d, list):
+            return [_ensure_ddbsafe(e) for e in d]
+        elif isinstance(d, decimal.Decimal):
+            return float(d)
+        elif isinstance(d, datetime):
+            return d.strftime(orm.DATETIME_FORMAT)
+        elif isinstance(d, str) and "" == d:
+            return None
+        else:
+            return d
+    return json.loads(json.dumps(_ensure_ddbsafe(d)), parse_float=decimal.Decimal)
+
+def make_item(rng, width=20, depth=3):
+    start = datetime(2020, 1, 1)
+    item = {
+        "id": "item-{}".format(rng.randint(0, 10**9)),
+        "created": start + timedelta(seconds=rng.randint(0, 10**8)),
+        "score": rng.random() * 100,
+        "count": rng.randint(0, 1000),
+        "price": decimal.Decimal("{:.2f}".format(rng.random() * 1000)),
+        "note": "",
+        "active": rng.random() > 0.5,
+        "tags": ["tag{}".format(rng.randint(0, 50)) for _ in range(5)],
+    }
+    for i in range(width):
+        item["attr{}".format(i)] = rng.choice(["value", rng.random(), rng.randint(0, 100), None, ""])
+    if depth > 0:
+        item["children"] = [make_item(rng, width=width//2, depth=depth-1) for _ in range(2)]
+    return item
+
+def run(number=200):
+    rng = random.Random(42)
+    items = [make_item(rng) for _ in range(10)]
+    assert all(legacy_ensure_ddbsafe(i) == orm.ensure_ddbsafe(i) for i in items)
+    results = {}
+    for name, func in [("legacy", legacy_ensure_ddbsafe), ("single_pass", orm.ensure_ddbsafe)]:
+        seconds = min(timeit.repeat(lambda: [func(i) for i in items], number=number, repeat=5))
+        results[name] = seconds / (number * len(items))
+    return results
+
+if __name__ == "__main__":
+    results = run()
+    for name in results:
+        print("{:<12} {:8.1f} us/item".format(name, results[name] * 10**6))
+    print("speedup      {:8.2f}x".format(results["legacy"] / results["single_pass"]))
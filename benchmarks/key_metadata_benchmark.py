@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Per-call cost of resolving a CFObject's hash/range key names, re-reading the
+CloudFormation template every time (the old behavior) versus the per-class KEY_METADATA.
+
+    PYTHONPATH=src python3 benchmarks/key_metadata_benchmark.py
+"""
+
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import timeit
+
+from sneks.ddb import orm
+
+TEMPLATE = {
+    "Resources": {
+        "BenchTable": {
+            "Type": "AWS::DynamoDB::Table",
+            "Properties": {
+                "AttributeDefinitions": [
+                    {"AttributeName": "id", "AttributeType": "S"},
+                    {"AttributeName": "created", "AttributeType": "S"},
+                    {"AttributeName": "owner", "AttributeType": "S"},
+                    {"AttributeName": "email", "AttributeType": "S"}
+                ],
+                "KeySchema": [
+                    {"AttributeName": "id", "KeyType": "HASH"},
+                    {"AttributeName": "created", "KeyType": "RANGE"}
+                ],
+                "GlobalSecondaryIndexes": [
+                    {
+                        "IndexName": "index-{}".format(i),
+                        "KeySchema": [{"AttributeName": "owner", "KeyType": "HASH"}],
+                        "Projection": {"ProjectionType": "ALL"}
+                    } for i in range(4)
+                ] + [
+                    {
+                        "IndexName": "by-email",
+                        "KeySchema": [
+                            {"AttributeName": "email", "KeyType": "HASH"},
+                            {"AttributeName": "created", "KeyType": "RANGE"}
+                        ],
+                        "Projection": {"ProjectionType": "ALL"}
+                    }
+                ]
+            }
+        }
+    }
+}
+
+class BenchObject(orm.CFObject):
+    _CF_STACK_NAME = "bench-stack"
+    _CF_LOGICAL_NAME = "BenchTable"
+    _CF_TEMPLATE = TEMPLATE
+    _CF_RESOURCES = {"BenchTable": {"PhysicalResourceId": "bench-stack-BenchTable-1234"}}
+
+def legacy_hash_and_range_keys(cls, index_name=None):
+    schema = cls._SCHEMA()
+    key_schema = schema['KeySchema']
+    if index_name:
+        gsis = schema.get("GlobalSecondaryIndexes", [])
+        matches = [gsi for gsi in gsis if gsi["IndexName"] == index_name]
+        if len(matches) == 0:
+            raise RuntimeError("No index with the name '{index_name}' found!".format(index_name=index_name))
+        key_schema = matches[0]["KeySchema"]
+    hash = [h['AttributeName'] for h in key_schema if h['KeyType']=='HASH'][0]
+    ranges = [r['AttributeName'] for r in key_schema if r['KeyType']=='RANGE']
+    range = ranges[0] if ranges else None
+    return hash, range
+
+def run(number=20000):
+    cases = [
+        ("legacy table", lambda: legacy_hash_and_range_keys(BenchObject)),
+        ("legacy index", lambda: legacy_hash_and_range_keys(BenchObject, "by-email")),
+        ("cached table", lambda: BenchObject._HASH_AND_RANGE_KEYS()),
+        ("cached index", lambda: BenchObject._HASH_AND_RANGE_KEYS("by-email")),
+    ]
+    assert cases[0][1]() == cases[2][1]() and cases[1][1]() == cases[3][1]()
+    return {name: min(timeit.repeat(func, number=number, repeat=5)) / number for name, func in cases}
+
+if __name__ == "__main__":
+    for name, seconds in run().items():
+        print("{:<14} {:8.2f} us/call".format(name, seconds * 10**6))
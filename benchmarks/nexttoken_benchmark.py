@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Size and speed of NextToken encoding: the old json+base64 path versus sneks.ddb.nexttoken.
+
+    PYTHONPATH=src python3 benchmarks/nexttoken_benchmark.py
+"""
+
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import base64
+from decimal import Decimal
+import json
+import timeit
+
+from sneks.ddb import nexttoken
+from sneks.ddb.orm import _fix_types, ensure_ddbsafe
+
+KEYS = {
+    "hash only": {"id": "8c5a4f7e-2b9d-4c1a-9e3f-6a7b8c9d0e1f"},
+    "hash+range": {"id": "8c5a4f7e-2b9d-4c1a-9e3f-6a7b8c9d0e1f", "created": Decimal("1700000000123")},
+    "gsi": {
+        "id": "8c5a4f7e-2b9d-4c1a-9e3f-6a7b8c9d0e1f",
+        "created": Decimal("1700000000123"),
+        "owner": "someone@example.com",
+        "score": Decimal("98.25")
+    },
+}
+
+def legacy_encode(key):
+    key = json.dumps(_fix_types(key))
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("utf-8").replace("=","")
+
+def legacy_decode(key):
+    key = key + "=" * ((-1*len(key))%16)
+    return ensure_ddbsafe(json.loads(base64.urlsafe_b64decode(key.encode("utf-8")).decode("utf-8")))
+
+def run(number=20000):
+    results = {}
+    for name, key in KEYS.items():
+        old_token = legacy_encode(key)
+        new_token = nexttoken.encode(key)
+        signed_token = nexttoken.encode(key, secret="s3cret")
+        assert legacy_decode(old_token) == nexttoken.decode(new_token) == key
+        cases = {
+            "legacy encode": lambda: legacy_encode(key),
+            "legacy decode": lambda: legacy_decode(old_token),
+            "binary encode": lambda: nexttoken.encode(key),
+            "binary decode": lambda: nexttoken.decode(new_token),
+            "signed encode": lambda: nexttoken.encode(key, secret="s3cret"),
+            "signed decode": lambda: nexttoken.decode(signed_token, secret="s3cret"),
+        }
+        results[name] = {
+            "sizes": {"legacy": len(old_token), "binary": len(new_token), "signed": len(signed_token)},
+            "timings": {case: min(timeit.repeat(func, number=number, repeat=5)) / number for case, func in cases.items()}
+        }
+    return results
+
+if __name__ == "__main__":
+    for name, result in run().items():
+        print("{} (token length: {})".format(name, ", ".join("{} {}".format(k, v) for k, v in result["sizes"].items())))
+        for case, seconds in result["timings"].items():
+            print("    {:<14} {:8.2f} us/call".format(case, seconds * 10**6))
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Timings for the ORM's per-item hot paths, on result pages of small, wide and deeply nested items:
+
+    fix_types          orm._fix_types on each raw item in a page
+    ensure_ddbsafe     orm.ensure_ddbsafe on each python item in a page
+    parse_items        BaseDynamoObject._parse_items on a whole page
+    parse_structured   _parse_items for a StructuredObject whose DataFields declare the top-level types
+    getitem            DynamoObject.__getitem__ on stored, _DEFAULT_ITEMS and _META_ITEMS keys of every object in a page
+    encode_nexttoken   BaseDynamoObject._encode_nexttoken on one LastEvaluatedKey per item
+    query_all          query_all through every page of the in-memory backend (sneks.ddb.memory)
+
+Results are written as JSON, so runs can be compared across releases with compare_benchmarks.py:
+
+    PYTHONPATH=src python3 benchmarks/orm_benchmark.py --output before.json
+    PYTHONPATH=src python3 benchmarks/orm_benchmark.py --output after.json --sizes 1000,10000,100000
+    python3 benchmarks/compare_benchmarks.py before.json after.json
+
+The data comes from a fixed seed, so every run times the same items.
+"""
+
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import argparse
+from datetime import datetime, timedelta
+import decimal
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+from sneks.ddb import orm
+from sneks.ddb.memory import MemoryDynamoDB
+
+SEED = 42
+SHAPES = ["small", "wide", "nested"]
+DEFAULT_SIZES = [1000, 10000]
+CASES = ["fix_types", "ensure_ddbsafe", "parse_items", "parse_structured", "getitem", "encode_nexttoken", "query_all"]
+
+def small_item(rng, i):
+    return {
+        "id": "item-{:08d}".format(i),
+        "created": datetime(2020, 1, 1) + timedelta(seconds=rng.randint(0, 10**8)),
+        "score": rng.random() * 100,
+        "count": rng.randint(0, 1000),
+        "name": "name-{}".format(rng.randint(0, 10**6)),
+    }
+
+def wide_item(rng, i, width=200):
+    item = small_item(rng, i)
+    for n in range(width):
+        item["attr{:03d}".format(n)] = rng.choice(["value-{}".format(n), rng.random() * 1000, rng.randint(0, 10**6), True])
+    return item
+
+def nested_item(rng, i, depth=5):
+    item = small_item(rng, i)
+    node = item
+    for level in range(depth):
+        node["child"] = {
+            "level": level,
+            "when": datetime(2021, 1, 1) + timedelta(days=level),
+            "values": [rng.random() for _ in range(4)],
+            "labels": ["label-{}".format(n) for n in range(3)],
+        }
+        node = node["child"]
+    return item
+
+MAKERS = {"small": small_item, "wide": wide_item, "nested": nested_item}
+
+def make_page(shape, size):
+    rng = random.Random("{}:{}:{}".format(SEED, shape, size))
+    return [MAKERS[shape](rng, i) for i in range(size)]
+
+class BenchObject(orm.DynamoObject):
+    _DEFAULT_ITEMS = {"missing": "default"}
+    _META_ITEMS = {"label": lambda self: "{}:{}".format(self["id"], self["count"])}
+
+    @classmethod
+    def _SCHEMA(cls):
+        return {
+            "TableName": "orm-benchmark",
+            "KeySchema": [{"AttributeName": "id", "KeyType": "HASH"}],
+            "AttributeDefinitions": [{"AttributeName": "id", "AttributeType": "S"}],
+        }
+
+class StructuredBenchObject(orm.StructuredObject):
+    _DATA_FIELDS = [
+        orm.DataField("id"),
+        orm.DataField("created", data_type="datetime"),
+        orm.DataField("count", data_type="int"),
+        orm.DataField("name"),
+    ]
+
+    @classmethod
+    def _SCHEMA(cls):
+        return BenchObject._SCHEMA()
+
+class RangeBenchObject(BenchObject):
+    @classmethod
+    def _SCHEMA(cls):
+        return {
+            "TableName": "orm-benchmark-range",
+            "KeySchema": [{"AttributeName": "owner", "KeyType": "HASH"}, {"AttributeName": "id", "KeyType": "RANGE"}],
+            "AttributeDefinitions": [{"AttributeName": "owner", "AttributeType": "S"}, {"AttributeName": "id", "AttributeType": "S"}],
+        }
+
+def getitem_all(objs):
+    for obj in objs:
+        obj["id"]
+        obj["score"]
+        obj["name"]
+        obj["missing"]
+        obj["label"]
+
+def prepare(shape, size):
+    '''
+    Builds everything the cases need for one shape and page size, outside of the timed code.
+    Returns a dict of case name to a zero-argument function that runs the case once.
+    '''
+    page = make_page(shape, size)
+    raw = [orm.ensure_ddbsafe(item) for item in page]
+    response = {"Items": raw}
+    objs = BenchObject._parse_items(response)
+    keys = [{"owner": "benchmark", "id": item["id"]} for item in raw]
+
+    db = MemoryDynamoDB()
+    with orm.use_backend(db):
+        RangeBenchObject.create_table()
+    table = db.Table("orm-benchmark-range")
+    for item in raw:
+        table.put_item(Item=dict(item, owner="benchmark"))
+
+    def query_all():
+        with orm.use_backend(db):
+            for obj in RangeBenchObject.query_all(HashKey="benchmark"):
+                pass
+
+    return {
+        "fix_types": lambda: [orm._fix_types(item) for item in raw],
+        "ensure_ddbsafe": lambda: [orm.ensure_ddbsafe(item) for item in page],
+        "parse_items": lambda: BenchObject._parse_items(response),
+        "parse_structured": lambda: StructuredBenchObject._parse_items(response),
+        "getitem": lambda: getitem_all(objs),
+        "encode_nexttoken": lambda: [BenchObject._encode_nexttoken(key) for key in keys],
+        "query_all": query_all,
+    }
+
+def time_case(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__))).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sizes=DEFAULT_SIZES, shapes=SHAPES, cases=CASES, repeat=5, log=None):
+    results = {}
+    for shape in shapes:
+        for size in sizes:
+            funcs = prepare(shape, size)
+            for case in cases:
+                timings = time_case(funcs[case], repeat)
+                best = min(timings)
+                name = "{}/{}/{}".format(case, shape, size)
+                results[name] = {
+                    "case": case,
+                    "shape": shape,
+                    "items": size,
+                    "repeat": repeat,
+                    "min": best,
+                    "median": statistics.median(timings),
+                    "per_item": best / size,
+                }
+                if log:
+                    log("{:<36} {:10.3f} ms {:10.3f} us/item".format(name, best * 10**3, best / size * 10**6))
+    return {
+        "meta": {
+            "created": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "seed": SEED,
+        },
+        "results": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the sneks ORM's serialization and materialization hot paths.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES), help="Comma-separated page sizes.")
+    parser.add_argument("--shapes", default=",".join(SHAPES), help="Comma-separated item shapes, out of {}.".format(", ".join(SHAPES)))
+    parser.add_argument("--cases", default=",".join(CASES), help="Comma-separated cases, out of {}.".format(", ".join(CASES)))
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each case; the fastest is the one that counts.")
+    args = parser.parse_args()
+    shapes = args.shapes.split(",")
+    cases = args.cases.split(",")
+    for name, chosen, known in [("shape", shapes, SHAPES), ("case", cases, CASES)]:
+        unknown = [c for c in chosen if c not in known]
+        if unknown:
+            parser.error("Unknown {}(s): {}".format(name, ", ".join(unknown)))
+    results = run(
+        sizes=[int(s) for s in args.sizes.split(",")],
+        shapes=shapes,
+        cases=cases,
+        repeat=args.repeat,
+        log=lambda line: print(line, file=sys.stderr)
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+if __name__ == "__main__":
+    main()
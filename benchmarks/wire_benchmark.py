@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Turning a query page of wire-format items into objects: the resource layer's TypeDeserializer followed
+by _fix_types (the default path) versus sneks.ddb.wire's single-pass decoder (_WIRE_READS = True).
+Botocore's own JSON parsing is the same either way, so it's left out.
+
+    PYTHONPATH=src python3 benchmarks/wire_benchmark.py --sizes 1000,10000,100000
+"""
+
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import argparse
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+import time
+
+from sneks.ddb import orm, wire
+from orm_benchmark import BenchObject, SHAPES, make_page
+
+def resource_path(page):
+    # What the resource layer's after-call handler does to a response, then _parse_items.
+    deserializer = TypeDeserializer()
+    items = [{k: deserializer.deserialize(v) for k, v in item.items()} for item in page]
+    return BenchObject._parse_items({"Items": items})
+
+def wire_path(page):
+    return BenchObject._parse_items({"Items": [wire.decode_item(item) for item in page]}, decoded=True)
+
+def run(sizes, shapes=SHAPES, repeat=3):
+    serializer = TypeSerializer()
+    results = {}
+    for shape in shapes:
+        for size in sizes:
+            page = [{k: serializer.serialize(v) for k, v in orm.ensure_ddbsafe(item).items()} for item in make_page(shape, size)]
+            assert resource_path(page[:100]) == wire_path(page[:100])
+            for name, func in [("resource", resource_path), ("wire", wire_path)]:
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    func(page)
+                    timings.append(time.perf_counter() - start)
+                results[(shape, size, name)] = min(timings)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+    results = run(sizes, repeat=args.repeat)
+    for shape in SHAPES:
+        for size in sizes:
+            before, after = results[(shape, size, "resource")], results[(shape, size, "wire")]
+            print("{:<7} {:>7} items   resource {:9.1f} ms   wire {:9.1f} ms   speedup {:5.2f}x".format(shape, size, before * 10**3, after * 10**3, before / after))
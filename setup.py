@@ -31,7 +31,8 @@ def main():
         classifiers = [],
         install_requires=[
             'beautifulsoup4',
-            'boto3',
+            # ReturnValuesOnConditionCheckFailure on single-item writes.
+            'boto3>=1.26.164',
             'jinja2'
         ],
         scripts = scripts,
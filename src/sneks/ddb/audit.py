@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+'''
+Scan efficiency auditing: for every page of a scan, query or count, how many items DynamoDB read
+(ScannedCount) against how many it returned (Count), along with the capacity and latency it took,
+added up per call site and search shape.  A search that reads 100k items to return 10 shows up here
+with a ratio of 10000, next to the line of code that ran it.
+
+Shapes are (operation, table, index, key condition, filter), with the values left out the same way
+sneks.ddb.selectivity does it, so the same search with different arguments is counted together.
+
+Once a call site and shape has scanned at least MIN_SCANNED items at a ratio of RATIO_THRESHOLD or
+worse, it's logged as a warning (once; see AUDITOR.reset).  AUDITOR.report() has all of it, worst first.
+Like sneks.ddb.metrics, AUDITOR.scope() collects just one unit of work's searches, which is what
+sneks.sam.decorators.add_ddb_capacity_args uses to log each request's offenders.  Reports dumped with
+AUDITOR.dump() can be read back and summarized with the sneks_scan-audit script.
+'''
+
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+
+from sneks.ddb import selectivity
+from sneks.ddb.metrics import LatencyHistogram, consumed_capacity_units, find_call_site
+
+logger = logging.getLogger(__name__)
+
+# Scanned items per item returned at which a search is an offender.
+RATIO_THRESHOLD = 10
+# Don't bother reporting searches that haven't read at least this many items in total.
+MIN_SCANNED = 1000
+
+_ACTIVE_SCOPES = contextvars.ContextVar("sneks_ddb_audit_scopes", default=())
+
+def search_shape(operation, table_name, params):
+    return (
+        operation,
+        table_name,
+        params.get("IndexName"),
+        selectivity.filter_shape(params.get("KeyConditionExpression")),
+        selectivity.filter_shape(params.get("FilterExpression"))
+    )
+
+def ratio(count, scanned_count):
+    # A search that returns nothing still read what it read, so it's counted as returning one item.
+    return float(scanned_count) / max(count, 1)
+
+class _Stats(object):
+    __slots__ = ["pages", "count", "scanned", "capacity", "latency", "reported"]
+
+    def __init__(self):
+        self.pages = 0
+        self.count = 0
+        self.scanned = 0
+        self.capacity = 0.0
+        self.latency = LatencyHistogram()
+        self.reported = False
+
+class ScanAuditor(object):
+    def __init__(self, ratio_threshold=RATIO_THRESHOLD, min_scanned=MIN_SCANNED):
+        self.ratio_threshold = ratio_threshold
+        self.min_scanned = min_scanned
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _targets(self):
+        return (self,) + _ACTIVE_SCOPES.get()
+
+    def is_offender(self, count, scanned_count):
+        return scanned_count >= self.min_scanned and ratio(count, scanned_count) >= self.ratio_threshold
+
+    def observe(self, operation, table_name, params, response, latency=None, call_site=None):
+        '''
+        Records one page of results.
+
+        :param response: The raw response from DynamoDB.
+        :param latency: Seconds the call took.
+        '''
+        if call_site is None:
+            call_site = find_call_site()
+        key = (call_site,) + search_shape(operation, table_name, params)
+        count = response.get("Count", 0)
+        scanned = response.get("ScannedCount", 0)
+        capacity = consumed_capacity_units(response)
+        for auditor in self._targets():
+            with auditor._lock:
+                stats = auditor._stats.get(key)
+                if stats is None:
+                    stats = auditor._stats[key] = _Stats()
+                stats.pages += 1
+                stats.count += count
+                stats.scanned += scanned
+                stats.capacity += capacity
+                if latency is not None:
+                    stats.latency.add(latency * 1000.0)
+                report = auditor is self and not stats.reported and auditor.is_offender(stats.count, stats.scanned)
+                if report:
+                    stats.reported = True
+                    entry = self._entry(key, stats)
+            if report:
+                logger.warning("Inefficient {Operation} on {TableName} (index {IndexName}, key {KeyCondition}, filter {Filter}) at {CallSite}: scanned {ScannedCount} items to return {Count} ({Ratio:.1f}x) over {Pages} pages, using {ConsumedCapacity:.1f} capacity units".format(**entry))
+
+    @staticmethod
+    def _entry(key, stats):
+        call_site, operation, table_name, index_name, key_condition, filter_shape = key
+        return {
+            "CallSite": call_site,
+            "Operation": operation,
+            "TableName": table_name,
+            "IndexName": index_name,
+            "KeyCondition": key_condition,
+            "Filter": filter_shape,
+            "Pages": stats.pages,
+            "Count": stats.count,
+            "ScannedCount": stats.scanned,
+            "Ratio": ratio(stats.count, stats.scanned),
+            "ConsumedCapacity": stats.capacity,
+            "Latency": stats.latency.to_dict()
+        }
+
+    def report(self, offenders_only=False):
+        '''
+        Everything seen so far, as a list of dicts, most items scanned for nothing first.
+        '''
+        with self._lock:
+            entries = [self._entry(key, stats) for key, stats in self._stats.items()]
+        if offenders_only:
+            entries = [e for e in entries if self.is_offender(e["Count"], e["ScannedCount"])]
+        return sorted(entries, key=lambda e: (e["ScannedCount"] - e["Count"], e["Ratio"]), reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    @contextlib.contextmanager
+    def scope(self):
+        '''
+        Collects every search inside the with block (in this context) into a fresh auditor, which is what gets yielded.
+        Offenders are still only logged by the auditor they were recorded on.
+        '''
+        scoped = ScanAuditor(ratio_threshold=self.ratio_threshold, min_scanned=self.min_scanned)
+        token = _ACTIVE_SCOPES.set(_ACTIVE_SCOPES.get() + (scoped,))
+        try:
+            yield scoped
+        finally:
+            _ACTIVE_SCOPES.reset(token)
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.report(), **kwargs)
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            f.write(self.to_json(indent=2))
+
+def merge_reports(reports):
+    '''
+    Adds up entries from several reports (say, dumps from a few processes) that share a call site and shape.
+    '''
+    merged = {}
+    for report in reports:
+        for entry in report:
+            key = tuple(entry.get(k) for k in ["CallSite", "Operation", "TableName", "IndexName", "KeyCondition", "Filter"])
+            total = merged.get(key)
+            if total is None:
+                merged[key] = dict(entry)
+                continue
+            for k in ["Pages", "Count", "ScannedCount", "ConsumedCapacity"]:
+                total[k] += entry.get(k, 0)
+            total["Ratio"] = ratio(total["Count"], total["ScannedCount"])
+            # Histograms don't survive being dumped, so only the worst case carries over.
+            total["Latency"] = {"MaxMs": max(total.get("Latency", {}).get("MaxMs", 0), entry.get("Latency", {}).get("MaxMs", 0))}
+    return sorted(merged.values(), key=lambda e: (e["ScannedCount"] - e["Count"], e["Ratio"]), reverse=True)
+
+AUDITOR = ScanAuditor()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+'''
+Bulk export and import of DynamoDB tables.
+
+Exports go to gzipped NDJSON, one file per parallel scan segment.  After every page, each segment's file
+is brought to a clean gzip member boundary and the checkpoint records the segment's NextToken and the
+file offset, so an interrupted export can be re-run into the same directory and it'll pick up where every
+segment left off.  (gzip readers treat the members as one continuous stream.)
+
+Imports stream records from NDJSON or CSV (optionally gzipped) and hand them to parallel batch writers.
+The checkpoint holds the byte offset up to which every record has been written or rejected, so a re-run
+skips straight past it.  Records that can't be mapped or written go to a dead-letter NDJSON file.
+'''
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextvars
+import csv
+from decimal import Decimal
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+from sneks.ddb.metrics import consumed_capacity_units
+
+CHECKPOINT_FILE = "checkpoint.json"
+CHECKPOINT_VERSION = 1
+
+# How many write batches each import worker may have queued up, which is what bounds an import's memory use.
+BATCHES_BUFFERED_PER_WORKER = 2
+
+logger = logging.getLogger(__name__)
+
+def segment_filename(segment, total_segments):
+    return "segment-{:05d}-of-{:05d}.ndjson.gz".format(segment, total_segments)
+
+def _save_json(path, state):
+    # Write-then-rename, so a crash can't leave a half-written checkpoint behind.
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+class Checkpoint(object):
+    '''
+    Progress of each segment of an export, rewritten (atomically) every time a segment finishes a page.
+    '''
+    def __init__(self, path, total_segments):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {"Version": CHECKPOINT_VERSION, "TotalSegments": total_segments, "Segments": {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state.get("TotalSegments") != total_segments:
+                raise RuntimeError("Checkpoint {} is for {} segments, not {}.".format(path, state.get("TotalSegments"), total_segments))
+            self.state = state
+
+    def segment(self, segment):
+        with self.lock:
+            return dict(self.state["Segments"].get(str(segment), {}))
+
+    def update(self, segment, **values):
+        with self.lock:
+            self.state["Segments"].setdefault(str(segment), {}).update(values)
+            _save_json(self.path, self.state)
+
+class Progress(object):
+    '''
+    Running totals for an export or import, with items and capacity per second worked out from them.
+    Logged (and passed to the callback, if there is one) every time something's added.
+    '''
+    def __init__(self, label, callback=None, **totals):
+        self.label = label
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.totals = dict(totals)
+        self.totals.setdefault("Items", 0)
+        self.totals.setdefault("ConsumedCapacity", 0.0)
+
+    def add(self, **amounts):
+        with self.lock:
+            for k, v in amounts.items():
+                self.totals[k] = self.totals.get(k, 0) + v
+        snapshot = self.snapshot()
+        logger.info("{}: {}".format(self.label, ", ".join("{} {}".format(k, snapshot[k]) for k in sorted(snapshot))))
+        if self.callback:
+            self.callback(snapshot)
+
+    def snapshot(self):
+        with self.lock:
+            snapshot = dict(self.totals)
+        elapsed = max(time.time() - self.start, 1e-9)
+        snapshot["Elapsed"] = elapsed
+        snapshot["ItemsPerSecond"] = snapshot["Items"] / elapsed
+        snapshot["CapacityPerSecond"] = snapshot["ConsumedCapacity"] / elapsed
+        return snapshot
+
+def _export_segment(scan, directory, segment, total_segments, checkpoint, progress, serialize, stop, kwargs):
+    state = checkpoint.segment(segment)
+    if state.get("Finished"):
+        progress.add(SegmentsFinished=1)
+        return
+    token = state.get("NextToken")
+    # Without a token there's nothing to resume, so anything already in the file gets thrown away.
+    offset = state.get("Offset", 0) if token else 0
+    item_count = state.get("Items", 0) if token else 0
+    path = os.path.join(directory, segment_filename(segment, total_segments))
+    params = dict(kwargs, Segment=segment, TotalSegments=total_segments)
+    with open(path, "r+b" if os.path.exists(path) else "wb") as raw:
+        # Drop anything written after the last checkpoint.
+        raw.truncate(offset)
+        raw.seek(offset)
+        while not stop.is_set():
+            response = scan(NextToken=token, **params) if token else scan(**params)
+            items = response.get("Items", [])
+            if items:
+                with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as gz:
+                    gz.write("".join(serialize(item) + "\n" for item in items).encode("utf-8"))
+                raw.flush()
+                os.fsync(raw.fileno())
+            token = response.get("NextToken")
+            item_count += len(items)
+            checkpoint.update(segment, NextToken=token, Offset=raw.tell(), Items=item_count, Finished=not token)
+            raw_response = response.get("RawResponse", response)
+            progress.add(Pages=1, Items=len(items), ScannedCount=response.get("ScannedCount", 0), ConsumedCapacity=consumed_capacity_units(raw_response), SegmentsFinished=0 if token else 1)
+            if not token:
+                return
+
+def export_segments(scan, directory, Segments, Workers=None, serialize=json.dumps, ProgressCallback=None, **kwargs):
+    '''
+    Exports everything scan (a search function like BaseDynamoObject.scan, returning Items and NextToken)
+    finds into directory, as a parallel scan of Segments segments run by up to Workers threads.
+    Any other kwargs are passed to every scan call.  Returns the final progress totals.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    checkpoint = Checkpoint(os.path.join(directory, CHECKPOINT_FILE), Segments)
+    progress = Progress("Export", callback=ProgressCallback, TotalSegments=Segments, SegmentsFinished=0, Pages=0, ScannedCount=0)
+    stop = threading.Event()
+    workers = min(Workers if Workers else Segments, Segments)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, _export_segment, scan, directory, segment, Segments, checkpoint, progress, serialize, stop, kwargs)
+            for segment in range(Segments)
+        ]
+        try:
+            for future in as_completed(futures):
+                future.result()
+        except BaseException:
+            # Let the other segments finish the page they're on (so the checkpoint stays good) and then stop.
+            stop.set()
+            raise
+    return progress.snapshot()
+
+def _open_source(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+def _source_format(path, Format=None):
+    if Format:
+        return Format.lower()
+    name = path[:-3] if path.endswith(".gz") else path
+    return "csv" if name.lower().endswith(".csv") else "ndjson"
+
+def read_records(path, Format=None, offset=0):
+    '''
+    Streams the records in an NDJSON or CSV file (gzipped if the name ends in .gz), starting at byte offset
+    (in the uncompressed data).  Yields (end_offset, record, error) for each one: the offset just past it,
+    the parsed record (or the raw text, if it couldn't be parsed), and why it couldn't be parsed (or None).
+    CSV files must start with a header row, and their values all come through as strings.
+    '''
+    fmt = _source_format(path, Format)
+    with _open_source(path) as f:
+        if fmt == "csv":
+            header_line = f.readline()
+            header = next(csv.reader([header_line.decode("utf-8")]))
+            offset = max(offset, len(header_line))
+        f.seek(offset)
+        position = [offset]
+        def lines():
+            for line in f:
+                position[0] += len(line)
+                yield line.decode("utf-8")
+        if fmt == "csv":
+            for row in csv.reader(lines()):
+                if not row:
+                    continue
+                if len(row) != len(header):
+                    yield position[0], row, "Expected {} columns but found {}.".format(len(header), len(row))
+                else:
+                    yield position[0], dict(zip(header, row)), None
+        else:
+            for line in lines():
+                if not line.strip():
+                    continue
+                try:
+                    yield position[0], json.loads(line, parse_float=Decimal), None
+                except ValueError as e:
+                    yield position[0], line.rstrip("\n"), str(e)
+
+class _ContiguousOffset(object):
+    '''
+    Work is handed out in file order but finishes in any order.  This tracks the offset up to which
+    everything has finished, which is the only safe place to resume from.
+    '''
+    def __init__(self, offset):
+        self.offset = offset
+        self.lock = threading.Lock()
+        self.ends = {}
+        self.finished = set()
+        self.next_ticket = 0
+        self.first_open = 0
+
+    def open(self, end_offset):
+        with self.lock:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            self.ends[ticket] = end_offset
+            return ticket
+
+    def close(self, ticket):
+        # Returns the new safe offset.
+        with self.lock:
+            self.finished.add(ticket)
+            while self.first_open in self.finished:
+                self.finished.remove(self.first_open)
+                self.offset = self.ends.pop(self.first_open)
+                self.first_open += 1
+            return self.offset
+
+class _DeadLetters(object):
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+
+    def add(self, offset, record, error):
+        line = json.dumps({"Offset": offset, "Error": str(error), "Record": record}, default=str)
+        with self.lock:
+            if not self.file:
+                self.file = open(self.path, "a")
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+def import_records(path, map_record, write_batch, batch_size=25, Format=None, Workers=4, CheckpointPath=None, DeadLetterPath=None, ProgressCallback=None):
+    '''
+    Imports the records in path (see read_records).
+
+    map_record(record) returns (key, item) for each record, or raises to reject it.  Items are grouped into
+    batches of batch_size (a batch never holds the same key twice) and write_batch(items), which should
+    return the capacity consumed, writes each batch on one of Workers threads.  Only a few batches per
+    worker are ever waiting, so memory use doesn't grow with the file.  If write_batch raises, the whole
+    batch goes to the dead-letter file.
+
+    The checkpoint defaults to path + ".checkpoint.json" and the dead-letter file to path + ".rejects.ndjson".
+    Returns the final progress totals.
+    '''
+    checkpoint_path = CheckpointPath if CheckpointPath else path + ".checkpoint.json"
+    state = {"Version": CHECKPOINT_VERSION, "Source": os.path.abspath(path), "Offset": 0, "Imported": 0, "Rejected": 0}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            state.update(json.load(f))
+    dead_letters = _DeadLetters(DeadLetterPath if DeadLetterPath else path + ".rejects.ndjson")
+    progress = Progress("Import", callback=ProgressCallback, Rejected=0, Batches=0)
+    tracker = _ContiguousOffset(state["Offset"])
+    state_lock = threading.Lock()
+    slots = threading.Semaphore(Workers * BATCHES_BUFFERED_PER_WORKER)
+
+    def finish(ticket, imported=0, rejected=0):
+        offset = tracker.close(ticket)
+        with state_lock:
+            state["Imported"] += imported
+            state["Rejected"] += rejected
+            state["Offset"] = offset
+            _save_json(checkpoint_path, state)
+
+    def reject(end_offset, record, error):
+        dead_letters.add(end_offset, record, error)
+        finish(tracker.open(end_offset), rejected=1)
+        progress.add(Rejected=1)
+
+    def run_batch(ticket, batch, rejects):
+        # rejects are the records rejected while the batch was filling up, which are checkpointed along with it.
+        imported = 0
+        capacity = 0.0
+        try:
+            try:
+                capacity = write_batch([item for _, _, item in batch]) or 0.0
+                imported = len(batch)
+            except Exception as e:
+                logger.warning("Batch of {} items failed: {}".format(len(batch), e))
+                rejects = rejects + [(end_offset, record, e) for end_offset, record, _ in batch]
+            for end_offset, record, error in rejects:
+                dead_letters.add(end_offset, record, error)
+            finish(ticket, imported=imported, rejected=len(rejects))
+            progress.add(Items=imported, Batches=1 if imported else 0, Rejected=len(rejects), ConsumedCapacity=capacity)
+        finally:
+            slots.release()
+
+    executor = ThreadPoolExecutor(max_workers=Workers)
+    futures = []
+
+    def submit(batch, rejects):
+        slots.acquire()
+        ticket = tracker.open(max(batch[-1][0], rejects[-1][0]) if rejects else batch[-1][0])
+        # Run each batch in a copy of this context, so metric scopes follow it.
+        futures.append(executor.submit(contextvars.copy_context().run, run_batch, ticket, batch, rejects))
+
+    try:
+        batch = []
+        rejects = []
+        keys = set()
+        for end_offset, record, error in read_records(path, Format=Format, offset=state["Offset"]):
+            if error is None:
+                try:
+                    key, item = map_record(record)
+                except Exception as e:
+                    error = e
+            if error is not None:
+                if batch:
+                    # Records ahead of this one haven't been written yet, so the checkpoint can't move past it until they are.
+                    rejects.append((end_offset, record, error))
+                else:
+                    reject(end_offset, record, error)
+                continue
+            if key in keys:
+                submit(batch, rejects)
+                batch = []
+                rejects = []
+                keys = set()
+            batch.append((end_offset, record, item))
+            keys.add(key)
+            if len(batch) >= batch_size:
+                submit(batch, rejects)
+                batch = []
+                rejects = []
+                keys = set()
+            # Check on (and let go of) the finished batches now and then, so a long import doesn't hang on to them all.
+            if len(futures) > Workers * BATCHES_BUFFERED_PER_WORKER * 4:
+                done = set(f for f in futures if f.done())
+                for future in done:
+                    future.result()
+                futures[:] = [f for f in futures if f not in done]
+        if batch:
+            submit(batch, rejects)
+    finally:
+        executor.shutdown(wait=True)
+        dead_letters.close()
+    for future in futures:
+        future.result()
+    return progress.snapshot()
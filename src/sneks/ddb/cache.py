@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+from boto3.dynamodb.types import Binary
+import collections
+import decimal
+import math
+import threading
+import time
+
+# What an eventually-consistent GetItem costs per 4KB chunk of item.
+RCU_PER_READ_UNIT = 0.5
+READ_UNIT_BYTES = 4096
+
+def _number_size(n):
+    digits = decimal.Decimal(n).normalize().as_tuple().digits
+    return int(math.ceil(len(digits) / 2.0)) + 1
+
+def value_size(v):
+    '''
+    Approximate number of bytes DynamoDB bills for a single attribute value, per the rules in the developer guide.
+    '''
+    if isinstance(v, str):
+        return len(v.encode("utf-8"))
+    elif isinstance(v, bool) or v is None:
+        return 1
+    elif isinstance(v, (int, float, decimal.Decimal)):
+        try:
+            return _number_size(v)
+        except:
+            return 21
+    elif isinstance(v, Binary):
+        return len(v.value)
+    elif isinstance(v, (bytes, bytearray)):
+        return len(v)
+    elif isinstance(v, dict):
+        return 3 + sum(1 + len(str(k).encode("utf-8")) + value_size(v[k]) for k in v)
+    elif isinstance(v, (list, tuple)):
+        return 3 + sum(1 + value_size(e) for e in v)
+    elif isinstance(v, (set, frozenset)):
+        return sum(value_size(e) for e in v)
+    return len(str(v).encode("utf-8"))
+
+def item_size(item):
+    '''
+    Approximate size in bytes of an item as DynamoDB sees it: attribute names plus their values.
+    '''
+    return sum(len(str(k).encode("utf-8")) + value_size(item[k]) for k in item)
+
+def read_units(size):
+    return max(1, int(math.ceil(size / float(READ_UNIT_BYTES))))
+
+class ItemCache(object):
+    '''
+    Thread-safe LRU cache of raw DynamoDB items, bounded by item count and total (approximate) item size,
+    with entries expiring after ttl seconds.  on_hit, if given, is called with the read capacity each hit saved.
+
+    Items are stored exactly as they came back from DynamoDB, so each hit gets run through the usual
+    type fixing and nobody ends up sharing mutable state with the cache.
+    '''
+    def __init__(self, max_items=1000, max_bytes=16*1024*1024, ttl=300, on_hit=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.on_hit = on_hit
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.read_capacity_saved = 0.0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry["size"]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry["expires"] <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if not entry:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            saved = read_units(entry["size"]) * RCU_PER_READ_UNIT
+            self.read_capacity_saved += saved
+        if self.on_hit:
+            self.on_hit(saved)
+        return entry["item"]
+
+    def put(self, key, item):
+        size = item_size(item)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = {"item": item, "size": size, "expires": time.time() + self.ttl}
+            self._bytes += size
+            while len(self._entries) > self.max_items or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "Items": len(self._entries),
+                "Bytes": self._bytes,
+                "Hits": self.hits,
+                "Misses": self.misses,
+                "Evictions": self.evictions,
+                "Expirations": self.expirations,
+                "ReadCapacitySaved": self.read_capacity_saved
+            }
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+'''
+Column-at-a-time results, for pulling a few attributes out of a lot of items without building an
+object (or even a dict) per item.
+
+Each column's type is decided by the first value that isn't missing or null: numbers go into an
+array('d') (or a numpy float64 array, with Arrays="numpy"), with NaN wherever an item doesn't have
+the attribute, and anything else goes into a list, with None for missing values.  A numeric column
+that later turns up a non-number is switched over to a list.  Datetime strings become datetimes,
+the same as they would on an object.
+'''
+
+from array import array
+import decimal
+
+from sneks.ddb import wire
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NAN = float("nan")
+ARRAY_TYPES = ["array", "numpy"]
+
+def projection(attrs, names=None):
+    '''
+    A ProjectionExpression for attrs (which may be dotted paths into maps), using "#c" placeholders
+    added to a copy of names.
+
+    :rtype: (ProjectionExpression, ExpressionAttributeNames)
+    '''
+    names = dict(names or {})
+    paths = []
+    for i, attr in enumerate(attrs):
+        parts = []
+        for j, part in enumerate(attr.split(".")):
+            placeholder = "#c{}_{}".format(i, j)
+            names[placeholder] = part
+            parts.append(placeholder)
+        paths.append(".".join(parts))
+    return ", ".join(paths), names
+
+def _is_number(value):
+    return isinstance(value, (decimal.Decimal, int, float)) and not isinstance(value, bool)
+
+def _decode(value):
+    if isinstance(value, str):
+        return wire.decode_string(value)
+    return value
+
+class ColumnBuilder(object):
+    def __init__(self, attrs, Arrays="array", MaxRows=None):
+        if Arrays not in ARRAY_TYPES:
+            raise RuntimeError("Invalid Arrays '{}' specified; must be one of {}.".format(Arrays, ", ".join(ARRAY_TYPES)))
+        if Arrays == "numpy" and numpy is None:
+            raise RuntimeError("Arrays='numpy' needs numpy, which isn't installed.")
+        self.arrays = Arrays
+        self.max_rows = MaxRows
+        self.paths = [(attr, tuple(attr.split("."))) for attr in attrs]
+        # None until the column's type is known, with pending counting the missing values before then.
+        self.columns = {attr: None for attr in attrs}
+        self.pending = {attr: 0 for attr in attrs}
+        self.rows = 0
+
+    def full(self):
+        return self.max_rows is not None and self.rows >= self.max_rows
+
+    def add_items(self, items):
+        '''
+        Adds a page of raw items.  Returns False once MaxRows have been added, and ignores anything past that.
+        '''
+        columns = self.columns
+        for item in items:
+            if self.full():
+                return False
+            for attr, path in self.paths:
+                value = item.get(path[0])
+                for part in path[1:]:
+                    value = value.get(part) if isinstance(value, dict) else None
+                column = columns[attr]
+                if value is None:
+                    if column is None:
+                        self.pending[attr] += 1
+                    elif isinstance(column, array):
+                        column.append(NAN)
+                    else:
+                        column.append(None)
+                elif _is_number(value):
+                    if column is None:
+                        column = columns[attr] = array("d", [NAN]) * self.pending[attr]
+                    column.append(float(value))
+                else:
+                    if column is None:
+                        column = columns[attr] = [None] * self.pending[attr]
+                    elif isinstance(column, array):
+                        column = columns[attr] = [None if v != v else v for v in column]
+                    column.append(_decode(value))
+            self.rows += 1
+        return not self.full()
+
+    def result(self):
+        '''
+        The columns, as a dict of attribute name to array or list, all self.rows long.
+        '''
+        result = {}
+        for attr, column in self.columns.items():
+            if column is None:
+                column = [None] * self.pending[attr]
+            if isinstance(column, array) and self.arrays == "numpy":
+                # Shares the array's buffer rather than copying it.
+                column = numpy.frombuffer(column, dtype=numpy.float64)
+            result[attr] = column
+        return result
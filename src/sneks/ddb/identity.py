@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import contextlib
+import contextvars
+
+_CURRENT_MAP = contextvars.ContextVar("sneks_ddb_identity_map", default=None)
+
+class IdentityMap(object):
+    '''
+    Unit-of-work map from (class, table, key) to the one object materialized for that item.
+
+    While one is open, the ORMs hand back the object already in the map instead of
+    fetching or building a second copy of the same item.
+    '''
+    def __init__(self):
+        self._objects = {}
+
+    def get(self, key):
+        return self._objects.get(key)
+
+    def add(self, key, obj):
+        # The first object in wins, so everyone keeps sharing the same instance.
+        return self._objects.setdefault(key, obj)
+
+    def discard(self, key):
+        self._objects.pop(key, None)
+
+    def __len__(self):
+        return len(self._objects)
+
+def returns_whole_items(params):
+    '''
+    Whether a scan/query with these params returns complete items, which is the only time
+    it's safe to add what comes back to the identity map.
+    '''
+    if params.get("IndexName") or params.get("ProjectionExpression") or params.get("AttributesToGet"):
+        return False
+    return params.get("Select", "ALL_ATTRIBUTES") == "ALL_ATTRIBUTES"
+
+def current_identity_map():
+    return _CURRENT_MAP.get()
+
+@contextlib.contextmanager
+def identity_map():
+    '''
+    Opens an identity map for the duration of the with block.  If one is already open, it's reused,
+    so nesting these (or stacking the decorator) is harmless.  The map is thrown away on exit.
+
+    Threads the ORM starts on its own (parallel scan workers, the page prefetcher) run in a copy of
+    this context, so they share the map.  Threads started any other way don't see it.
+    '''
+    existing = _CURRENT_MAP.get()
+    if existing is not None:
+        yield existing
+        return
+    token = _CURRENT_MAP.set(IdentityMap())
+    try:
+        yield _CURRENT_MAP.get()
+    finally:
+        _CURRENT_MAP.reset(token)
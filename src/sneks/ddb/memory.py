@@ -0,0 +1,1038 @@
+#!/usr/bin/env python3
+'''
+An in-memory stand-in for DynamoDB, for unit tests and for benchmarking the ORM without a network.
+
+    db = MemoryDynamoDB(latency=0.005)
+    with orm.use_backend(db):
+        MyObject.create_table()
+        MyObject({"id": "a"}).save()
+
+It takes the same python values the boto3 resource layer does (Decimals, Binary, sets, ...), gives
+back what it would (every number a Decimal and every binary value a Binary, however it was written), and
+supports get/put/update/delete, query (on the table and its indexes) and scan (including parallel
+segments) with Limit/ExclusiveStartKey pagination and the 1MB page cap, batch get/write, transactional
+writes, condition/filter/key-condition/update/projection expressions (as strings with placeholders or
+as boto3 condition objects), and simulated ConsumedCapacity that follows DynamoDB's billing rules.
+
+It's meant to be faithful for the things the ORM relies on rather than complete: there's no support for
+the legacy Expected/KeyConditions/QueryFilter/AttributeUpdates parameters, TTL, streams or throttling.
+Queries and scans on secondary indexes look at every item, so they're O(table size).
+'''
+
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+from boto3.dynamodb.types import Binary
+from botocore.exceptions import ClientError
+import bisect
+import contextlib
+from decimal import Decimal
+import math
+import random
+import re
+import threading
+import time
+import types
+import zlib
+
+from sneks.ddb.cache import item_size
+from sneks.ddb.schema import key_metadata
+
+READ_UNIT_BYTES = 4096
+WRITE_UNIT_BYTES = 1024
+PAGE_BYTES = 1024 * 1024
+BATCH_GET_LIMIT = 100
+BATCH_WRITE_LIMIT = 25
+TRANSACT_WRITE_LIMIT = 100
+
+_MISSING = object()
+
+def _error(operation, code, message, **extra):
+    response = {"Error": {"Code": code, "Message": message}}
+    response.update(extra)
+    return ClientError(response, operation)
+
+def _copy(value):
+    # Items are copied on the way in and out, the same as serializing them would, but much faster.
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return set(value)
+    return value
+
+def _stored(value):
+    # Copies a value the way it comes back from the resource layer: numbers as Decimals and binary as Binary.
+    if isinstance(value, dict):
+        return {k: _stored(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_stored(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return set(_stored(v) for v in value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return Decimal(value)
+    if isinstance(value, (bytes, bytearray)):
+        return Binary(bytes(value))
+    return value
+
+def _type_code(value):
+    if isinstance(value, str):
+        return "S"
+    if isinstance(value, bool):
+        return "BOOL"
+    if isinstance(value, (int, Decimal)):
+        return "N"
+    if isinstance(value, (Binary, bytes, bytearray)):
+        return "B"
+    if value is None:
+        return "NULL"
+    if isinstance(value, dict):
+        return "M"
+    if isinstance(value, (list, tuple)):
+        return "L"
+    if isinstance(value, (set, frozenset)):
+        return _type_code(next(iter(value))) + "S" if value else "SS"
+    return type(value).__name__
+
+def _check_value(value, operation):
+    t = _type_code(value)
+    if isinstance(value, float):
+        raise TypeError("Float types are not supported. Use Decimal types instead.")
+    if t == "M":
+        for v in value.values():
+            _check_value(v, operation)
+    elif t == "L":
+        for v in value:
+            _check_value(v, operation)
+    elif isinstance(value, (set, frozenset)):
+        if not value:
+            raise _error(operation, "ValidationException", "One or more parameter values were invalid: An empty set is not allowed")
+        if len(set(_type_code(v) for v in value)) > 1 or t not in ("SS", "NS", "BS"):
+            raise _error(operation, "ValidationException", "Sets must hold strings, numbers or binary values of a single type.")
+    elif t not in ("S", "N", "B", "BOOL", "NULL"):
+        raise TypeError("Unsupported type \"{}\" for value \"{}\"".format(type(value), value))
+
+def _comparable(value):
+    # Numbers, strings and binary compare within their own type only.
+    t = _type_code(value)
+    if t == "N":
+        return t, Decimal(value)
+    if t == "B":
+        return t, bytes(value.value if isinstance(value, Binary) else value)
+    if t == "S":
+        return t, value
+    return t, None
+
+def _equal(a, b):
+    ta, tb = _type_code(a), _type_code(b)
+    if ta != tb:
+        return False
+    if ta in ("N", "B", "S"):
+        return _comparable(a) == _comparable(b)
+    if ta == "NS":
+        return set(Decimal(v) for v in a) == set(Decimal(v) for v in b)
+    if ta == "BS":
+        return set(_comparable(v) for v in a) == set(_comparable(v) for v in b)
+    if ta == "L":
+        return len(a) == len(b) and all(_equal(x, y) for x, y in zip(a, b))
+    if ta == "M":
+        return a.keys() == b.keys() and all(_equal(a[k], b[k]) for k in a)
+    return a == b
+
+def _key_value(value):
+    # The sortable form of a key attribute's value.
+    return _comparable(value)[1]
+
+_TOKEN_RE = re.compile(r"\s*(?:(#[A-Za-z0-9_]+)|(:[A-Za-z0-9_]+)|(<>|<=|>=|=|<|>)|([(),.\[\]+\-])|(\d+)|([A-Za-z_][A-Za-z0-9_]*))")
+_KEYWORDS = {"AND", "OR", "NOT", "BETWEEN", "IN", "SET", "REMOVE", "ADD", "DELETE"}
+
+class _Parser(object):
+    '''
+    Parses condition, key condition, update and projection expressions into nested tuples.
+    Placeholders are resolved as they're read, so evaluating never needs the name/value maps.
+    '''
+    def __init__(self, expression, names, values, operation):
+        self.operation = operation
+        self.names = names or {}
+        self.values = values or {}
+        self.tokens = []
+        pos = 0
+        expression = expression.rstrip()
+        while pos < len(expression):
+            match = _TOKEN_RE.match(expression, pos)
+            if not match or match.end() == pos:
+                raise self.error("Invalid expression: unexpected text at '{}'".format(expression[pos:]))
+            kind = match.lastindex
+            text = match.group(kind)
+            if kind == 6 and text.upper() in _KEYWORDS:
+                self.tokens.append(("keyword", text.upper()))
+            else:
+                self.tokens.append((["name", "value", "op", "punct", "number", "ident"][kind - 1], text))
+            pos = match.end()
+        self.pos = 0
+
+    def error(self, message):
+        return _error(self.operation, "ValidationException", message)
+
+    def peek(self, offset=0):
+        if self.pos + offset < len(self.tokens):
+            return self.tokens[self.pos + offset]
+        return (None, None)
+
+    def take(self, kind=None, text=None):
+        token = self.peek()
+        if (kind and token[0] != kind) or (text and token[1] != text):
+            raise self.error("Invalid expression: expected {} but found {}".format(text or kind, token[1]))
+        self.pos += 1
+        return token
+
+    def accept(self, kind, text=None):
+        token = self.peek()
+        if token[0] == kind and (text is None or token[1] == text):
+            self.pos += 1
+            return True
+        return False
+
+    def done(self):
+        if self.pos != len(self.tokens):
+            raise self.error("Invalid expression: unexpected '{}'".format(self.peek()[1]))
+
+    def path(self):
+        path = [self.name()]
+        while True:
+            if self.accept("punct", "."):
+                path.append(self.name())
+            elif self.accept("punct", "["):
+                path.append(int(self.take("number")[1]))
+                self.take("punct", "]")
+            else:
+                return tuple(path)
+
+    def name(self):
+        kind, text = self.take()
+        if kind == "name":
+            if text not in self.names:
+                raise self.error("An expression attribute name used in the document path is not defined; attribute name: {}".format(text))
+            return self.names[text]
+        if kind == "ident":
+            return text
+        raise self.error("Invalid expression: expected an attribute name but found {}".format(text))
+
+    def operand(self):
+        kind, text = self.peek()
+        if kind == "value":
+            self.pos += 1
+            if text not in self.values:
+                raise self.error("An expression attribute value used in expression is not defined; attribute value: {}".format(text))
+            return ("value", self.values[text])
+        if kind == "ident" and self.peek(1) == ("punct", "("):
+            function = text
+            self.pos += 2
+            if function == "size":
+                result = ("size", self.path())
+            elif function == "if_not_exists":
+                path = self.path()
+                self.take("punct", ",")
+                result = ("if_not_exists", path, self.operand())
+            elif function == "list_append":
+                first = self.operand()
+                self.take("punct", ",")
+                result = ("list_append", first, self.operand())
+            else:
+                raise self.error("Invalid function name; function: {}".format(function))
+            self.take("punct", ")")
+            return result
+        return ("path", self.path())
+
+    def condition(self):
+        left = self.conjunction()
+        while self.accept("keyword", "OR"):
+            left = ("or", left, self.conjunction())
+        return left
+
+    def conjunction(self):
+        left = self.negation()
+        while self.accept("keyword", "AND"):
+            left = ("and", left, self.negation())
+        return left
+
+    def negation(self):
+        if self.accept("keyword", "NOT"):
+            return ("not", self.negation())
+        return self.predicate()
+
+    def predicate(self):
+        if self.accept("punct", "("):
+            result = self.condition()
+            self.take("punct", ")")
+            return result
+        kind, text = self.peek()
+        if kind == "ident" and text in ("attribute_exists", "attribute_not_exists", "attribute_type", "begins_with", "contains") and self.peek(1) == ("punct", "("):
+            self.pos += 2
+            args = [self.operand()]
+            while self.accept("punct", ","):
+                args.append(self.operand())
+            self.take("punct", ")")
+            return ("func", text, args)
+        left = self.operand()
+        if self.accept("keyword", "BETWEEN"):
+            low = self.operand()
+            self.take("keyword", "AND")
+            return ("between", left, low, self.operand())
+        if self.accept("keyword", "IN"):
+            self.take("punct", "(")
+            options = [self.operand()]
+            while self.accept("punct", ","):
+                options.append(self.operand())
+            self.take("punct", ")")
+            return ("in", left, options)
+        op = self.take("op")[1]
+        return ("cmp", op, left, self.operand())
+
+    def update(self):
+        actions = []
+        seen = set()
+        while self.peek()[0]:
+            clause = self.take("keyword")[1]
+            if clause in seen or clause not in ("SET", "REMOVE", "ADD", "DELETE"):
+                raise self.error("Invalid UpdateExpression: unexpected or repeated clause {}".format(clause))
+            seen.add(clause)
+            while True:
+                path = self.path()
+                if clause == "SET":
+                    self.take("op", "=")
+                    value = self.operand()
+                    if self.peek() in (("punct", "+"), ("punct", "-")):
+                        value = (self.take()[1], value, self.operand())
+                    actions.append(("SET", path, value))
+                elif clause == "REMOVE":
+                    actions.append(("REMOVE", path, None))
+                else:
+                    actions.append((clause, path, self.operand()))
+                if not self.accept("punct", ","):
+                    break
+        return actions
+
+    def projection(self):
+        paths = [self.path()]
+        while self.accept("punct", ","):
+            paths.append(self.path())
+        return paths
+
+def _get(item, path):
+    value = item
+    for part in path:
+        if isinstance(part, int):
+            if not isinstance(value, list) or part >= len(value):
+                return _MISSING
+            value = value[part]
+        else:
+            if not isinstance(value, dict) or part not in value:
+                return _MISSING
+            value = value[part]
+    return value
+
+def _parent(item, path, operation):
+    parent = _get(item, path[:-1])
+    if parent is _MISSING or not isinstance(parent, (dict, list)):
+        raise _error(operation, "ValidationException", "The document path provided in the update expression is invalid for update")
+    return parent
+
+def _set(item, path, value, operation):
+    parent = _parent(item, path, operation)
+    last = path[-1]
+    if isinstance(parent, list):
+        if not isinstance(last, int):
+            raise _error(operation, "ValidationException", "The document path provided in the update expression is invalid for update")
+        if last >= len(parent):
+            parent.append(value)
+        else:
+            parent[last] = value
+    else:
+        parent[last] = value
+
+def _remove(item, path, operation):
+    parent = _get(item, path[:-1])
+    last = path[-1]
+    if isinstance(parent, list) and isinstance(last, int) and last < len(parent):
+        del parent[last]
+    elif isinstance(parent, dict):
+        parent.pop(last, None)
+
+def _value(operand, item, operation):
+    kind = operand[0]
+    if kind == "value":
+        return operand[1]
+    if kind == "path":
+        return _get(item, operand[1])
+    if kind == "size":
+        value = _get(item, operand[1])
+        if value is _MISSING:
+            return _MISSING
+        if isinstance(value, Binary):
+            return Decimal(len(value.value))
+        if isinstance(value, (str, bytes, list, dict, set, frozenset)):
+            return Decimal(len(value))
+        return _MISSING
+    if kind == "if_not_exists":
+        value = _get(item, operand[1])
+        return _value(operand[2], item, operation) if value is _MISSING else value
+    if kind == "list_append":
+        first, second = _value(operand[1], item, operation), _value(operand[2], item, operation)
+        if not isinstance(first, list) or not isinstance(second, list):
+            raise _error(operation, "ValidationException", "An operand in the update expression has an incorrect data type")
+        return first + second
+    if kind in ("+", "-"):
+        first, second = _value(operand[1], item, operation), _value(operand[2], item, operation)
+        if _type_code(first) != "N" or _type_code(second) != "N":
+            raise _error(operation, "ValidationException", "An operand in the update expression has an incorrect data type")
+        return Decimal(first) + Decimal(second) if kind == "+" else Decimal(first) - Decimal(second)
+    raise _error(operation, "ValidationException", "Invalid operand")
+
+def _compare(op, left, right):
+    if left is _MISSING or right is _MISSING:
+        return False
+    if op == "=":
+        return _equal(left, right)
+    if op == "<>":
+        return not _equal(left, right)
+    (ta, a), (tb, b) = _comparable(left), _comparable(right)
+    if ta != tb or ta not in ("N", "S", "B"):
+        return False
+    if op == "<":
+        return a < b
+    if op == "<=":
+        return a <= b
+    if op == ">":
+        return a > b
+    return a >= b
+
+def _evaluate(condition, item, operation):
+    kind = condition[0]
+    if kind == "and":
+        return _evaluate(condition[1], item, operation) and _evaluate(condition[2], item, operation)
+    if kind == "or":
+        return _evaluate(condition[1], item, operation) or _evaluate(condition[2], item, operation)
+    if kind == "not":
+        return not _evaluate(condition[1], item, operation)
+    if kind == "cmp":
+        return _compare(condition[1], _value(condition[2], item, operation), _value(condition[3], item, operation))
+    if kind == "between":
+        value = _value(condition[1], item, operation)
+        return _compare(">=", value, _value(condition[2], item, operation)) and _compare("<=", value, _value(condition[3], item, operation))
+    if kind == "in":
+        value = _value(condition[1], item, operation)
+        return any(_compare("=", value, _value(option, item, operation)) for option in condition[2])
+    name, args = condition[1], condition[2]
+    value = _value(args[0], item, operation)
+    if name == "attribute_exists":
+        return value is not _MISSING
+    if name == "attribute_not_exists":
+        return value is _MISSING
+    if value is _MISSING:
+        return False
+    other = _value(args[1], item, operation)
+    if name == "attribute_type":
+        return _type_code(value) == other
+    if name == "begins_with":
+        if isinstance(value, str) and isinstance(other, str):
+            return value.startswith(other)
+        if _type_code(value) == "B" and _type_code(other) == "B":
+            return _comparable(value)[1].startswith(_comparable(other)[1])
+        return False
+    if name == "contains":
+        if isinstance(value, str):
+            return isinstance(other, str) and other in value
+        if isinstance(value, (set, frozenset, list)):
+            return any(_equal(v, other) for v in value)
+        return False
+    raise _error(operation, "ValidationException", "Invalid function name; function: {}".format(name))
+
+def _project(item, paths):
+    result = {}
+    for path in paths:
+        value = _get(item, path)
+        if value is _MISSING:
+            continue
+        target = result
+        source = item
+        for i, part in enumerate(path[:-1]):
+            source = source[part]
+            # Lists come back with just the selected elements, in order, the way DynamoDB does it.
+            key = part if isinstance(target, dict) else len(target)
+            if isinstance(target, dict):
+                target = target.setdefault(key, [] if isinstance(source, list) else {})
+            else:
+                target.append([] if isinstance(source, list) else {})
+                target = target[-1]
+        if isinstance(target, dict):
+            target[path[-1]] = _copy(value)
+        else:
+            target.append(_copy(value))
+    return result
+
+class _Request(object):
+    '''
+    The expressions in one request.  Condition objects all go through the same builder, the way the
+    boto3 resource layer does it, so their placeholders can't collide with each other.
+    '''
+    def __init__(self, params, operation):
+        self.operation = operation
+        self.names = dict(params.get("ExpressionAttributeNames") or {})
+        self.values = dict(params.get("ExpressionAttributeValues") or {})
+        self.builder = ConditionExpressionBuilder()
+        for legacy in ("Expected", "KeyConditions", "QueryFilter", "ScanFilter", "AttributeUpdates", "ConditionalOperator"):
+            if legacy in params:
+                raise _error(operation, "ValidationException", "{} isn't supported by the in-memory backend; use expressions instead.".format(legacy))
+
+    def _text(self, expression, is_key_condition=False):
+        if isinstance(expression, ConditionBase):
+            built = self.builder.build_expression(expression, is_key_condition=is_key_condition)
+            self.names.update(built.attribute_name_placeholders)
+            self.values.update(built.attribute_value_placeholders)
+            return built.condition_expression
+        return expression
+
+    def condition(self, expression, is_key_condition=False):
+        if expression is None:
+            return None
+        parser = _Parser(self._text(expression, is_key_condition=is_key_condition), self.names, self.values, self.operation)
+        condition = parser.condition()
+        parser.done()
+        return condition
+
+    def update(self, expression):
+        parser = _Parser(expression, self.names, self.values, self.operation)
+        actions = parser.update()
+        parser.done()
+        return actions
+
+    def projection(self, params):
+        if params.get("ProjectionExpression"):
+            parser = _Parser(params["ProjectionExpression"], self.names, self.values, self.operation)
+            paths = parser.projection()
+            parser.done()
+            return paths
+        if params.get("AttributesToGet"):
+            return [(name,) for name in params["AttributesToGet"]]
+        return None
+
+def _capacity(table, units, kind, params, index_units=None):
+    '''
+    The ConsumedCapacity entry for a call, in whatever detail ReturnConsumedCapacity asked for.
+    index_units maps index name to (kind, units) for the indexes the call touched.
+    '''
+    mode = params.get("ReturnConsumedCapacity", "NONE")
+    if mode not in ("TOTAL", "INDEXES"):
+        return None
+    index_units = index_units or {}
+    units_key = "ReadCapacityUnits" if kind == "READ" else "WriteCapacityUnits"
+    total = units + sum(u for _, u in index_units.values())
+    capacity = {"TableName": table.name, "CapacityUnits": total, units_key: total}
+    if mode == "INDEXES":
+        capacity["Table"] = {"CapacityUnits": units, units_key: units}
+        for name, (index_kind, u) in index_units.items():
+            listname = "GlobalSecondaryIndexes" if index_kind == "GSI" else "LocalSecondaryIndexes"
+            capacity.setdefault(listname, {})[name] = {"CapacityUnits": u, units_key: u}
+    return capacity
+
+def _read_units(size, consistent):
+    return max(1, int(math.ceil(size / float(READ_UNIT_BYTES)))) * (1.0 if consistent else 0.5)
+
+def _write_units(size):
+    return float(max(1, int(math.ceil(size / float(WRITE_UNIT_BYTES)))))
+
+class MemoryTable(object):
+    def __init__(self, db, schema):
+        self.db = db
+        self.name = schema["TableName"]
+        self.schema = schema
+        self.metadata = key_metadata(schema)
+        self.hash = self.metadata.hash
+        self.range = self.metadata.range
+        self.items = {}
+        self.order = []
+        self.included = {}
+        for listname in ("GlobalSecondaryIndexes", "LocalSecondaryIndexes"):
+            for index in schema.get(listname) or []:
+                projection = index.get("Projection", {})
+                if projection.get("ProjectionType") == "INCLUDE":
+                    self.included[index["IndexName"]] = projection.get("NonKeyAttributes", [])
+        # Table calls that the real service only offers on the client are passed back to the database.
+        self.meta = types.SimpleNamespace(client=db)
+
+    def describe(self):
+        description = dict(self.schema)
+        description["ItemCount"] = len(self.items)
+        description["TableStatus"] = "ACTIVE"
+        return description
+
+    def _key(self, item, operation, require_exact=False):
+        key = []
+        for name in (self.hash, self.range):
+            if not name:
+                continue
+            value = item.get(name, _MISSING)
+            expected = self.metadata.attribute_types.get(name)
+            if value is _MISSING or value == "" or (expected and _type_code(value) != expected):
+                raise _error(operation, "ValidationException", "The provided key element does not match the schema")
+            key.append(_key_value(value))
+        if require_exact and len(item) != len(key):
+            raise _error(operation, "ValidationException", "The provided key element does not match the schema")
+        return tuple(key)
+
+    def _key_dict(self, item):
+        return {name: item[name] for name in (self.hash, self.range) if name}
+
+    def _index_keys(self, index_name, operation):
+        if index_name is None:
+            return self.hash, self.range, None
+        index = self.metadata.indexes.get(index_name)
+        if not index:
+            raise _error(operation, "ValidationException", "The table does not have the specified index: {}".format(index_name))
+        return index.hash, index.range, index
+
+    def _index_item(self, item, index_name, index):
+        # What an index would hold for this item.
+        if index.projection == "ALL":
+            return item
+        names = set(k for k in (self.hash, self.range, index.hash, index.range) if k)
+        names.update(self.included.get(index_name, []))
+        return {k: v for k, v in item.items() if k in names}
+
+    def _index_units(self, old, new):
+        # Writes to an item also write to every index it's in (or was in).
+        units = {}
+        for name, index in self.metadata.indexes.items():
+            sizes = [item_size(self._index_item(i, name, index)) for i in (old, new) if i and index.hash in i and (not index.range or index.range in i)]
+            if sizes:
+                units[name] = (index.kind, _write_units(max(sizes)) * len(sizes))
+        return units
+
+    def _check_condition(self, request, params, item, operation):
+        condition = request.condition(params.get("ConditionExpression"))
+        if condition is not None and not _evaluate(condition, item or {}, operation):
+            extra = {}
+            if params.get("ReturnValuesOnConditionCheckFailure") == "ALL_OLD" and item:
+                extra["Item"] = _copy(item)
+            raise _error(operation, "ConditionalCheckFailedException", "The conditional request failed", **extra)
+
+    def _write(self, key, item):
+        if key not in self.items:
+            bisect.insort(self.order, key)
+        self.items[key] = item
+
+    def _delete(self, key):
+        if key in self.items:
+            del self.items[key]
+            del self.order[bisect.bisect_left(self.order, key)]
+
+    def _validate_item(self, item, operation):
+        for v in item.values():
+            _check_value(v, operation)
+        if item_size(item) > 400 * 1024:
+            raise _error(operation, "ValidationException", "Item size has exceeded the maximum allowed size")
+
+    # The individual operations.  Each one is called with the database lock held.
+
+    def _put(self, params, operation="PutItem"):
+        item = _stored(params["Item"])
+        self._validate_item(item, operation)
+        key = self._key(item, operation)
+        old = self.items.get(key)
+        self._check_condition(_Request(params, operation), params, old, operation)
+        self._write(key, item)
+        units = _write_units(max(item_size(item), item_size(old) if old else 0))
+        response = {}
+        if params.get("ReturnValues", "NONE") == "ALL_OLD" and old:
+            response["Attributes"] = _copy(old)
+        return response, units, self._index_units(old, item)
+
+    def _update(self, params, operation="UpdateItem"):
+        key = self._key(params["Key"], operation, require_exact=True)
+        request = _Request(params, operation)
+        actions = request.update(params.get("UpdateExpression", "")) if params.get("UpdateExpression") else []
+        old = self.items.get(key)
+        self._check_condition(request, params, old, operation)
+        item = _copy(old) if old else _stored(params["Key"])
+        touched = []
+        for action, path, operand in actions:
+            if path[0] in (self.hash, self.range):
+                raise _error(operation, "ValidationException", "Cannot update attribute {}. This attribute is part of the key".format(path[0]))
+            touched.append(path[0])
+            if action == "SET":
+                value = _value(operand, item, operation)
+                if value is _MISSING:
+                    raise _error(operation, "ValidationException", "The provided expression refers to an attribute that does not exist in the item")
+                _set(item, path, _stored(value), operation)
+            elif action == "REMOVE":
+                _remove(item, path, operation)
+            else:
+                value = _value(operand, item, operation)
+                current = _get(item, path)
+                if action == "ADD":
+                    if _type_code(value) == "N":
+                        if current is not _MISSING and _type_code(current) != "N":
+                            raise _error(operation, "ValidationException", "An operand in the update expression has an incorrect data type")
+                        _set(item, path, (Decimal(current) if current is not _MISSING else Decimal(0)) + Decimal(value), operation)
+                    elif isinstance(value, (set, frozenset)):
+                        _set(item, path, set(current if current is not _MISSING else ()) | _stored(value), operation)
+                    else:
+                        raise _error(operation, "ValidationException", "An operand in the update expression has an incorrect data type")
+                else:
+                    if not isinstance(value, (set, frozenset)):
+                        raise _error(operation, "ValidationException", "An operand in the update expression has an incorrect data type")
+                    if current is not _MISSING:
+                        remaining = set(current) - set(value)
+                        if remaining:
+                            _set(item, path, remaining, operation)
+                        else:
+                            _remove(item, path, operation)
+        self._validate_item(item, operation)
+        self._write(key, item)
+        units = _write_units(max(item_size(item), item_size(old) if old else 0))
+        response = {}
+        returns = params.get("ReturnValues", "NONE")
+        if returns == "ALL_NEW":
+            response["Attributes"] = _copy(item)
+        elif returns == "ALL_OLD" and old:
+            response["Attributes"] = _copy(old)
+        elif returns in ("UPDATED_NEW", "UPDATED_OLD"):
+            source = item if returns == "UPDATED_NEW" else (old or {})
+            attributes = {k: _copy(source[k]) for k in touched if k in source}
+            if attributes:
+                response["Attributes"] = attributes
+        return response, units, self._index_units(old, item)
+
+    def _delete_item(self, params, operation="DeleteItem"):
+        key = self._key(params["Key"], operation, require_exact=True)
+        old = self.items.get(key)
+        self._check_condition(_Request(params, operation), params, old, operation)
+        self._delete(key)
+        response = {}
+        if params.get("ReturnValues", "NONE") == "ALL_OLD" and old:
+            response["Attributes"] = _copy(old)
+        return response, _write_units(item_size(old) if old else 0), self._index_units(old, None)
+
+    def _condition_check(self, params, operation="ConditionCheck"):
+        key = self._key(params["Key"], operation, require_exact=True)
+        self._check_condition(_Request(params, operation), params, self.items.get(key), operation)
+        return {}, 0.0, {}
+
+    def _get_item(self, params, operation="GetItem"):
+        key = self._key(params["Key"], operation, require_exact=True)
+        item = self.items.get(key)
+        consistent = params.get("ConsistentRead", False)
+        response = {}
+        if item:
+            paths = _Request(params, operation).projection(params)
+            response["Item"] = _project(item, paths) if paths else _copy(item)
+        return response, _read_units(item_size(item) if item else 0, consistent)
+
+    def _order_key(self, item, hash_name, range_name, index):
+        # Where an item falls in a query/scan of the table or index.
+        table_key = self._key(item, "Query")
+        if index is None:
+            return table_key
+        index_key = tuple(_key_value(item[k]) for k in (hash_name, range_name) if k)
+        return index_key + table_key
+
+    def _search(self, params, operation):
+        request = _Request(params, operation)
+        index_name = params.get("IndexName")
+        hash_name, range_name, index = self._index_keys(index_name, operation)
+        if index and index.kind == "GSI" and params.get("ConsistentRead"):
+            raise _error(operation, "ValidationException", "Consistent reads are not supported on global secondary indexes")
+        key_condition = request.condition(params.get("KeyConditionExpression"), is_key_condition=True)
+        filter_condition = request.condition(params.get("FilterExpression"))
+        paths = request.projection(params)
+        forward = params.get("ScanIndexForward", True)
+        start = params.get("ExclusiveStartKey")
+
+        if operation == "Query":
+            if key_condition is None:
+                raise _error(operation, "ValidationException", "Either the KeyConditions or KeyConditionExpression parameter must be specified in the request.")
+            hash_value = self._hash_value(key_condition, hash_name, operation)
+            if index is None:
+                lo = bisect.bisect_left(self.order, (hash_value,))
+                candidates = []
+                for key in self.order[lo:]:
+                    if key[0] != hash_value:
+                        break
+                    candidates.append(key)
+                candidates = [self.items[key] for key in candidates]
+            else:
+                candidates = [i for i in self.items.values() if hash_name in i and _key_value(i[hash_name]) == hash_value and (not range_name or range_name in i)]
+                candidates.sort(key=lambda i: self._order_key(i, hash_name, range_name, index))
+            candidates = [i for i in candidates if _evaluate(key_condition, i, operation)]
+            if not forward:
+                candidates.reverse()
+        else:
+            if index is None:
+                candidates = [self.items[key] for key in self.order]
+            else:
+                candidates = [i for i in self.items.values() if hash_name in i and (not range_name or range_name in i)]
+                candidates.sort(key=lambda i: self._order_key(i, hash_name, range_name, index))
+            total_segments = params.get("TotalSegments")
+            if total_segments:
+                segment = params.get("Segment", 0)
+                candidates = [i for i in candidates if zlib.crc32(repr(_key_value(i[self.hash])).encode("utf-8")) % total_segments == segment]
+
+        if start:
+            start_key = self._order_key(start, hash_name, range_name, index)
+            if forward:
+                candidates = [i for i in candidates if self._order_key(i, hash_name, range_name, index) > start_key]
+            else:
+                candidates = [i for i in candidates if self._order_key(i, hash_name, range_name, index) < start_key]
+
+        limit = params.get("Limit")
+        evaluated = []
+        size = 0
+        for item in candidates:
+            if limit and len(evaluated) >= limit:
+                break
+            if size >= PAGE_BYTES:
+                break
+            stored = self._index_item(item, index_name, index) if index else item
+            evaluated.append(stored)
+            size += item_size(stored)
+        matched = [i for i in evaluated if filter_condition is None or _evaluate(filter_condition, i, operation)]
+        response = {"Count": len(matched), "ScannedCount": len(evaluated)}
+        if params.get("Select") != "COUNT":
+            response["Items"] = [_project(i, paths) if paths else _copy(i) for i in matched]
+        if evaluated and len(evaluated) < len(candidates):
+            last = evaluated[-1]
+            last_key = self._key_dict(last)
+            if index:
+                last_key.update({k: last[k] for k in (hash_name, range_name) if k})
+            response["LastEvaluatedKey"] = _copy(last_key)
+        units = _read_units(size, params.get("ConsistentRead", False))
+        return response, units, ({index_name: (index.kind, units)} if index else None)
+
+    def _hash_value(self, condition, hash_name, operation):
+        if condition[0] == "cmp" and condition[1] == "=":
+            for a, b in ((condition[2], condition[3]), (condition[3], condition[2])):
+                if a == ("path", (hash_name,)) and b[0] == "value":
+                    return _key_value(b[1])
+        if condition[0] == "and":
+            for part in condition[1:]:
+                try:
+                    return self._hash_value(part, hash_name, operation)
+                except ClientError:
+                    pass
+        raise _error(operation, "ValidationException", "Query condition missed key schema element: {}".format(hash_name))
+
+    # The public API, matching boto3's Table resource.
+
+    def get_item(self, **params):
+        with self.db.call("GetItem"):
+            response, units = self._get_item(params)
+            return self.db.respond(response, _capacity(self, units, "READ", params))
+
+    def put_item(self, **params):
+        with self.db.call("PutItem"):
+            response, units, index_units = self._put(params)
+            return self.db.respond(response, _capacity(self, units, "WRITE", params, index_units))
+
+    def update_item(self, **params):
+        with self.db.call("UpdateItem"):
+            response, units, index_units = self._update(params)
+            return self.db.respond(response, _capacity(self, units, "WRITE", params, index_units))
+
+    def delete_item(self, **params):
+        with self.db.call("DeleteItem"):
+            response, units, index_units = self._delete_item(params)
+            return self.db.respond(response, _capacity(self, units, "WRITE", params, index_units))
+
+    def query(self, **params):
+        with self.db.call("Query"):
+            response, units, index_units = self._search(params, "Query")
+            if index_units:
+                units = 0.0
+            return self.db.respond(response, _capacity(self, units, "READ", params, index_units))
+
+    def scan(self, **params):
+        with self.db.call("Scan"):
+            response, units, index_units = self._search(params, "Scan")
+            if index_units:
+                units = 0.0
+            return self.db.respond(response, _capacity(self, units, "READ", params, index_units))
+
+class MemoryDynamoDB(object):
+    '''
+    A set of in-memory tables.  Use it anywhere a boto3 DynamoDB resource would go: Table(name) for a
+    table, and meta.client (which is this object too) for create_table, describe_table, and the batch
+    and transaction calls.
+
+    :param latency: Seconds every call sleeps, to model the network round trip.
+    :param jitter: Up to this many extra seconds are added to each call's sleep, at random.
+    '''
+    def __init__(self, latency=0.0, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tables = {}
+        self.lock = threading.RLock()
+        self.meta = types.SimpleNamespace(client=self)
+        self.calls = {}
+
+    @contextlib.contextmanager
+    def call(self, operation):
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+        with self.lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            yield
+
+    def respond(self, response, *capacities):
+        capacities = [c for c in capacities if c]
+        if len(capacities) == 1:
+            response["ConsumedCapacity"] = capacities[0]
+        elif capacities:
+            response["ConsumedCapacity"] = capacities
+        return response
+
+    def create_table(self, **schema):
+        with self.call("CreateTable"):
+            name = schema.get("TableName")
+            if name in self.tables:
+                raise _error("CreateTable", "ResourceInUseException", "Table already exists: {}".format(name))
+            table = MemoryTable(self, schema)
+            self.tables[name] = table
+            return {"TableDescription": table.describe()}
+
+    def delete_table(self, TableName):
+        with self.call("DeleteTable"):
+            table = self._table(TableName, "DeleteTable")
+            del self.tables[TableName]
+            return {"TableDescription": table.describe()}
+
+    def describe_table(self, TableName):
+        with self.call("DescribeTable"):
+            return {"Table": self._table(TableName, "DescribeTable").describe()}
+
+    def Table(self, name):
+        return self._table(name, "DescribeTable")
+
+    def _table(self, name, operation):
+        table = self.tables.get(name)
+        if table is None:
+            raise _error(operation, "ResourceNotFoundException", "Requested resource not found: Table: {} not found".format(name))
+        return table
+
+    def batch_get_item(self, RequestItems, ReturnConsumedCapacity="NONE"):
+        with self.call("BatchGetItem"):
+            if sum(len(r.get("Keys", [])) for r in RequestItems.values()) > BATCH_GET_LIMIT:
+                raise _error("BatchGetItem", "ValidationException", "Too many items requested for the BatchGetItem call")
+            responses = {}
+            capacities = []
+            for name, request in RequestItems.items():
+                table = self._table(name, "BatchGetItem")
+                keys = set()
+                units = 0.0
+                responses[name] = []
+                for key in request.get("Keys", []):
+                    key_tuple = table._key(key, "BatchGetItem", require_exact=True)
+                    if key_tuple in keys:
+                        raise _error("BatchGetItem", "ValidationException", "Provided list of item keys contains duplicates")
+                    keys.add(key_tuple)
+                    params = dict(request, Key=key)
+                    params.pop("Keys")
+                    response, u = table._get_item(params, "BatchGetItem")
+                    units += u
+                    if "Item" in response:
+                        responses[name].append(response["Item"])
+                capacities.append(_capacity(table, units, "READ", {"ReturnConsumedCapacity": ReturnConsumedCapacity}))
+            response = {"Responses": responses, "UnprocessedKeys": {}}
+            capacities = [c for c in capacities if c]
+            if capacities:
+                response["ConsumedCapacity"] = capacities
+            return response
+
+    def batch_write_item(self, RequestItems, ReturnConsumedCapacity="NONE", **kwargs):
+        with self.call("BatchWriteItem"):
+            if sum(len(r) for r in RequestItems.values()) > BATCH_WRITE_LIMIT:
+                raise _error("BatchWriteItem", "ValidationException", "Too many items requested for the BatchWriteItem call")
+            # Check everything before writing anything, since a bad request fails as a whole.
+            for name, requests in RequestItems.items():
+                table = self._table(name, "BatchWriteItem")
+                keys = set()
+                for request in requests:
+                    if "PutRequest" in request:
+                        table._validate_item(request["PutRequest"]["Item"], "BatchWriteItem")
+                        key = table._key(request["PutRequest"]["Item"], "BatchWriteItem")
+                    else:
+                        key = table._key(request["DeleteRequest"]["Key"], "BatchWriteItem", require_exact=True)
+                    if key in keys:
+                        raise _error("BatchWriteItem", "ValidationException", "Provided list of item keys contains duplicates")
+                    keys.add(key)
+            capacities = []
+            for name, requests in RequestItems.items():
+                table = self.tables[name]
+                units = 0.0
+                index_units = {}
+                for request in requests:
+                    if "PutRequest" in request:
+                        _, u, iu = table._put(request["PutRequest"], "BatchWriteItem")
+                    else:
+                        _, u, iu = table._delete_item(request["DeleteRequest"], "BatchWriteItem")
+                    units += u
+                    for index, (kind, n) in iu.items():
+                        index_units[index] = (kind, index_units.get(index, (kind, 0.0))[1] + n)
+                capacities.append(_capacity(table, units, "WRITE", {"ReturnConsumedCapacity": ReturnConsumedCapacity}, index_units))
+            response = {"UnprocessedItems": {}}
+            capacities = [c for c in capacities if c]
+            if capacities:
+                response["ConsumedCapacity"] = capacities
+            return response
+
+    def transact_write_items(self, TransactItems, ReturnConsumedCapacity="NONE", **kwargs):
+        with self.call("TransactWriteItems"):
+            if len(TransactItems) > TRANSACT_WRITE_LIMIT:
+                raise _error("TransactWriteItems", "ValidationException", "Member must have length less than or equal to {}".format(TRANSACT_WRITE_LIMIT))
+            operations = []
+            keys = set()
+            for entry in TransactItems:
+                (kind, params), = entry.items()
+                table = self._table(params["TableName"], "TransactWriteItems")
+                key = table._key(params["Item"] if kind == "Put" else params["Key"], "TransactWriteItems")
+                if (table.name, key) in keys:
+                    raise _error("TransactWriteItems", "ValidationException", "Transaction request cannot include multiple operations on one item")
+                keys.add((table.name, key))
+                operations.append((kind, table, params, key))
+            # Check every condition against the current state first; only if they all pass does anything get written.
+            reasons = []
+            for kind, table, params, key in operations:
+                try:
+                    if params.get("ConditionExpression"):
+                        table._check_condition(_Request(params, "TransactWriteItems"), params, table.items.get(key), "TransactWriteItems")
+                    if kind == "Put":
+                        table._validate_item(params["Item"], "TransactWriteItems")
+                    reasons.append({"Code": "None"})
+                except ClientError as e:
+                    reason = {"Code": e.response["Error"]["Code"].replace("Exception", ""), "Message": e.response["Error"]["Message"]}
+                    if "Item" in e.response:
+                        reason["Item"] = e.response["Item"]
+                    reasons.append(reason)
+            if any(r["Code"] != "None" for r in reasons):
+                raise _error("TransactWriteItems", "TransactionCanceledException",
+                             "Transaction cancelled, please refer cancellation reasons for specific reasons [{}]".format(", ".join(r["Code"] for r in reasons)),
+                             CancellationReasons=reasons)
+            units = {}
+            for kind, table, params, key in operations:
+                params = {k: v for k, v in params.items() if k not in ("ConditionExpression", "ReturnValuesOnConditionCheckFailure")}
+                if kind == "Put":
+                    _, u, _ = table._put(params, "TransactWriteItems")
+                elif kind == "Update":
+                    _, u, _ = table._update(params, "TransactWriteItems")
+                elif kind == "Delete":
+                    _, u, _ = table._delete_item(params, "TransactWriteItems")
+                else:
+                    u = 0.0
+                # Transactional writes cost double.
+                units[table.name] = units.get(table.name, 0.0) + 2 * u
+            response = {}
+            capacities = [_capacity(self.tables[name], u, "WRITE", {"ReturnConsumedCapacity": ReturnConsumedCapacity}) for name, u in units.items()]
+            capacities = [c for c in capacities if c]
+            if capacities:
+                response["ConsumedCapacity"] = capacities
+            return response
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+
+# Upper bounds (in milliseconds) of the latency histogram buckets.  Anything slower lands in the last one.
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float("inf")]
+
+EMF_NAMESPACE = "sneks/DynamoDB"
+
+_SNEKS_DDB_DIR = os.path.dirname(os.path.abspath(__file__))
+# Frames in these files are never the interesting caller.
+_SKIPPED_FILES = (_SNEKS_DDB_DIR, threading.__file__, contextlib.__file__)
+
+_ACTIVE_SCOPES = contextvars.ContextVar("sneks_ddb_metric_scopes", default=())
+
+def find_call_site():
+    '''
+    The first stack frame outside sneks.ddb (and the threading plumbing), as "file:line:function".
+    '''
+    frame = sys._getframe(1)
+    while frame and (frame.f_code.co_filename.startswith(_SKIPPED_FILES) or "concurrent/futures" in frame.f_code.co_filename):
+        frame = frame.f_back
+    if not frame:
+        return None
+    return "{}:{}:{}".format(os.path.basename(frame.f_code.co_filename), frame.f_lineno, frame.f_code.co_name)
+
+def consumed_capacity_units(response):
+    '''
+    Total CapacityUnits reported in a response, whether it has one ConsumedCapacity or a list of them.
+    '''
+    capacity = response.get("ConsumedCapacity") or {}
+    if isinstance(capacity, dict):
+        capacity = [capacity]
+    return sum(c.get("CapacityUnits", 0) for c in capacity)
+
+class LatencyHistogram(object):
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS_MS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        # Upper bound of the bucket the p'th percentile falls in; good enough for spotting trouble.
+        if not self.count:
+            return 0.0
+        target = p / 100.0 * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "Count": self.count,
+            "AverageMs": self.total / self.count if self.count else 0.0,
+            "MaxMs": self.max,
+            "P50Ms": self.percentile(50),
+            "P99Ms": self.percentile(99),
+            "Buckets": {str(b):c for b, c in zip(LATENCY_BUCKETS_MS, self.counts) if c}
+        }
+
+class _Stats(object):
+    __slots__ = ["calls", "read", "write", "throttles", "latency"]
+
+    def __init__(self):
+        self.calls = 0
+        self.read = 0.0
+        self.write = 0.0
+        self.throttles = 0
+        self.latency = LatencyHistogram()
+
+class MetricsRegistry(object):
+    '''
+    Thread-safe DynamoDB usage counters and latency histograms, keyed by (table, index, operation, call site).
+
+    There's one process-wide registry (REGISTRY).  Wrap a unit of work in REGISTRY.scope() to also
+    collect just that work's numbers in a separate registry.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._read_saved = 0.0
+
+    def _stats_for(self, key):
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = _Stats()
+        return stats
+
+    def _targets(self):
+        return (self,) + _ACTIVE_SCOPES.get()
+
+    def record(self, table=None, operation=None, index=None, call_site=None, read=0.0, write=0.0, latency=None, calls=0, throttles=0):
+        '''
+        :param latency: Seconds the call took, if this record is for the call itself.
+        '''
+        key = (table, index, operation, call_site)
+        for registry in self._targets():
+            with registry._lock:
+                stats = registry._stats_for(key)
+                stats.calls += calls
+                stats.read += read
+                stats.write += write
+                stats.throttles += throttles
+                if latency is not None:
+                    stats.latency.add(latency * 1000.0)
+
+    def record_throttle(self, table=None, operation=None, call_site=None):
+        # A call DynamoDB throttled; it doesn't count as a call, since it'll be retried (or fail) as one.
+        if call_site is None:
+            call_site = find_call_site()
+        self.record(table=table, operation=operation, call_site=call_site, throttles=1)
+
+    def record_saved_read(self, capacity):
+        for registry in self._targets():
+            with registry._lock:
+                registry._read_saved += capacity
+
+    def record_response(self, response, operation=None, kind=None, latency=None, call_site=None, table=None):
+        '''
+        Records a DynamoDB response's ConsumedCapacity (broken down by table and index, if it was
+        requested with ReturnConsumedCapacity="INDEXES") plus the call's latency.
+
+        :param kind: "READ" or "WRITE", used when the response only has a CapacityUnits total.
+        '''
+        if call_site is None:
+            call_site = find_call_site()
+        capacities = response.get("ConsumedCapacity") or []
+        if isinstance(capacities, dict):
+            capacities = [capacities]
+        if table is None and capacities:
+            table = capacities[0].get("TableName")
+        self.record(table=table, operation=operation, call_site=call_site, latency=latency, calls=1)
+        for capacity in capacities:
+            table_name = capacity.get("TableName", table)
+            parts = []
+            if "Table" in capacity:
+                parts.append((None, capacity["Table"]))
+                for listname in ["GlobalSecondaryIndexes", "LocalSecondaryIndexes"]:
+                    parts.extend(capacity.get(listname, {}).items())
+            else:
+                parts.append((None, capacity))
+            for index, units in parts:
+                read = units.get("ReadCapacityUnits", 0)
+                write = units.get("WriteCapacityUnits", 0)
+                if not read and not write:
+                    if kind == "READ":
+                        read = units.get("CapacityUnits", 0)
+                    elif kind == "WRITE":
+                        write = units.get("CapacityUnits", 0)
+                self.record(table=table_name, index=index, operation=operation, call_site=call_site, read=read, write=write)
+
+    def totals(self):
+        with self._lock:
+            return {
+                "Calls": sum(s.calls for s in self._stats.values()),
+                "ReadCapacity": sum(s.read for s in self._stats.values()),
+                "WriteCapacity": sum(s.write for s in self._stats.values()),
+                "Throttles": sum(s.throttles for s in self._stats.values()),
+                "ReadCapacitySaved": self._read_saved
+            }
+
+    def snapshot(self):
+        with self._lock:
+            entries = []
+            for (table, index, operation, call_site), stats in sorted(self._stats.items(), key=lambda kv: tuple(str(k) for k in kv[0])):
+                entries.append({
+                    "TableName": table,
+                    "IndexName": index,
+                    "Operation": operation,
+                    "CallSite": call_site,
+                    "Calls": stats.calls,
+                    "ReadCapacity": stats.read,
+                    "WriteCapacity": stats.write,
+                    "Throttles": stats.throttles,
+                    "Latency": stats.latency.to_dict()
+                })
+        totals = self.totals()
+        return {"Totals": totals, "Entries": entries}
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._read_saved = 0.0
+
+    @contextlib.contextmanager
+    def scope(self):
+        '''
+        Collects everything recorded inside the with block (in this context, including worker threads
+        the ORM starts on its behalf) into a fresh registry, which is what gets yielded.
+        '''
+        scoped = MetricsRegistry()
+        token = _ACTIVE_SCOPES.set(_ACTIVE_SCOPES.get() + (scoped,))
+        try:
+            yield scoped
+        finally:
+            _ACTIVE_SCOPES.reset(token)
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def to_emf(self, namespace=EMF_NAMESPACE, timestamp=None):
+        '''
+        CloudWatch embedded metric format log lines, one per table/index/operation.
+        Call sites go in as plain properties rather than dimensions to keep the metric count down.
+
+        :rtype: List of strings, each ready to be printed as its own log line.
+        '''
+        timestamp = int((timestamp if timestamp else time.time()) * 1000)
+        grouped = {}
+        with self._lock:
+            for (table, index, operation, call_site), stats in self._stats.items():
+                if table is None and operation is None:
+                    continue
+                group = grouped.setdefault((table, index, operation), {"stats": _Stats(), "call_sites": set()})
+                group["stats"].calls += stats.calls
+                group["stats"].read += stats.read
+                group["stats"].write += stats.write
+                group["stats"].throttles += stats.throttles
+                group["stats"].latency.merge(stats.latency)
+                if call_site:
+                    group["call_sites"].add(call_site)
+        lines = []
+        for (table, index, operation), group in sorted(grouped.items(), key=lambda kv: tuple(str(k) for k in kv[0])):
+            stats = group["stats"]
+            dimensions = ["TableName", "Operation"] + (["IndexName"] if index else [])
+            metrics = [
+                {"Name": "Calls", "Unit": "Count"},
+                {"Name": "ReadCapacityUnits", "Unit": "Count"},
+                {"Name": "WriteCapacityUnits", "Unit": "Count"}
+            ]
+            record = {
+                "TableName": str(table),
+                "Operation": str(operation),
+                "Calls": stats.calls,
+                "ReadCapacityUnits": stats.read,
+                "WriteCapacityUnits": stats.write,
+                "CallSites": sorted(group["call_sites"])
+            }
+            if index:
+                record["IndexName"] = index
+            if stats.throttles:
+                metrics.append({"Name": "Throttles", "Unit": "Count"})
+                record["Throttles"] = stats.throttles
+            if stats.latency.count:
+                metrics.append({"Name": "LatencyAverage", "Unit": "Milliseconds"})
+                metrics.append({"Name": "LatencyMax", "Unit": "Milliseconds"})
+                record["LatencyAverage"] = stats.latency.total / stats.latency.count
+                record["LatencyMax"] = stats.latency.max
+            record["_aws"] = {
+                "Timestamp": timestamp,
+                "CloudWatchMetrics": [{"Namespace": namespace, "Dimensions": [dimensions], "Metrics": metrics}]
+            }
+            lines.append(json.dumps(record, separators=(',',':')))
+        return lines
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+'''
+Compact, lossless encoding of DynamoDB LastEvaluatedKeys into URL-safe NextTokens.
+
+A token is urlsafe base64 (without padding) of:
+
+    header byte | value | [16-byte HMAC-SHA256 of everything before it]
+
+The header's low 7 bits are the format version, and the top bit says whether a signature follows.
+Values are tag-length-value: one tag byte, then (for variable-length types) a varint length or count.
+Numbers are stored as their decimal string, so Decimals come back exactly as they went in.
+
+Tokens from the old JSON format (base64 of a JSON object) are still accepted when decoding.
+
+The savings are modest (see benchmarks/nexttoken_benchmark.py): unsigned tokens are only 5-12% shorter than
+the old JSON ones, and encoding and decoding take roughly two thirds of the time the JSON path did.  What
+the format is really for is keeping Decimals exact and tokens signable; a signature adds 16 bytes
+(21 characters) and makes decoding somewhat slower than the old unsigned path.
+'''
+
+import base64
+import binascii
+from boto3.dynamodb.types import Binary
+from decimal import Decimal
+import hashlib
+import hmac
+import json
+
+VERSION = 1
+_SIGNED = 0x80
+_SIGNATURE_BYTES = 16
+
+_S = 0x01
+_N = 0x02
+_B = 0x03
+_TRUE = 0x04
+_FALSE = 0x05
+_NULL = 0x06
+_SS = 0x07
+_NS = 0x08
+_BS = 0x09
+_L = 0x0A
+_M = 0x0B
+
+_LEGACY_PREFIX = ord("{")
+
+def _write_length(out, n):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _write_bytes(out, tag, b):
+    out.append(tag)
+    _write_length(out, len(b))
+    out += b
+
+def _number_bytes(value):
+    if type(value) is float:
+        value = Decimal(repr(value))
+    return str(value).encode("ascii")
+
+def _binary_bytes(value):
+    if isinstance(value, Binary):
+        return value.value
+    return bytes(value)
+
+def _encode_value(value, out):
+    t = type(value)
+    if t is str:
+        _write_bytes(out, _S, value.encode("utf-8"))
+    elif t is bool:
+        out.append(_TRUE if value else _FALSE)
+    elif t is Decimal or t is int or t is float:
+        _write_bytes(out, _N, _number_bytes(value))
+    elif value is None:
+        out.append(_NULL)
+    elif t is dict:
+        out.append(_M)
+        _write_length(out, len(value))
+        for k, v in value.items():
+            b = k.encode("utf-8")
+            _write_length(out, len(b))
+            out += b
+            _encode_value(v, out)
+    elif t is list or t is tuple:
+        out.append(_L)
+        _write_length(out, len(value))
+        for v in value:
+            _encode_value(v, out)
+    elif isinstance(value, (bytes, bytearray, Binary)):
+        _write_bytes(out, _B, _binary_bytes(value))
+    elif isinstance(value, (set, frozenset)):
+        if not value:
+            raise TypeError("DynamoDB doesn't allow empty sets, so they can't be encoded into a NextToken.")
+        sample = next(iter(value))
+        if isinstance(sample, str):
+            tag, convert = _SS, lambda v: v.encode("utf-8")
+        elif isinstance(sample, (Decimal, int, float)) and not isinstance(sample, bool):
+            tag, convert = _NS, _number_bytes
+        elif isinstance(sample, (bytes, bytearray, Binary)):
+            tag, convert = _BS, _binary_bytes
+        else:
+            raise TypeError("Can't encode a set of {} into a NextToken.".format(type(sample).__name__))
+        out.append(tag)
+        _write_length(out, len(value))
+        for v in value:
+            b = convert(v)
+            _write_length(out, len(b))
+            out += b
+    else:
+        raise TypeError("Can't encode a value of type {} into a NextToken.".format(t.__name__))
+
+def _read_length(data, pos):
+    n = data[pos]
+    pos += 1
+    if n < 0x80:
+        return n, pos
+    n &= 0x7F
+    shift = 7
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+def _read_bytes(data, pos):
+    n, pos = _read_length(data, pos)
+    end = pos + n
+    if end > len(data):
+        raise ValueError("Truncated value.")
+    return data[pos:end], end
+
+def _decode_value(data, pos):
+    # Keys are nearly always a map of a few short strings and numbers, so that path has its lengths
+    # (almost always a single varint byte) read inline rather than through _read_length.
+    tag = data[pos]
+    pos += 1
+    if tag == _S or tag == _N or tag == _B:
+        n = data[pos]
+        if n < 0x80:
+            pos += 1
+        else:
+            n, pos = _read_length(data, pos)
+        end = pos + n
+        if end > len(data):
+            raise ValueError("Truncated value.")
+        if tag == _S:
+            return data[pos:end].decode("utf-8"), end
+        if tag == _N:
+            return Decimal(data[pos:end].decode("ascii")), end
+        return Binary(data[pos:end]), end
+    if tag == _M:
+        n, pos = _read_length(data, pos)
+        value = {}
+        for _ in range(n):
+            size = data[pos]
+            if size < 0x80:
+                pos += 1
+            else:
+                size, pos = _read_length(data, pos)
+            end = pos + size
+            if end > len(data):
+                raise ValueError("Truncated value.")
+            value[data[pos:end].decode("utf-8")], pos = _decode_value(data, end)
+        return value, pos
+    if tag == _TRUE:
+        return True, pos
+    if tag == _FALSE:
+        return False, pos
+    if tag == _NULL:
+        return None, pos
+    if tag == _L:
+        n, pos = _read_length(data, pos)
+        value = []
+        for _ in range(n):
+            v, pos = _decode_value(data, pos)
+            value.append(v)
+        return value, pos
+    if tag in (_SS, _NS, _BS):
+        n, pos = _read_length(data, pos)
+        value = set()
+        for _ in range(n):
+            b, pos = _read_bytes(data, pos)
+            if tag == _SS:
+                value.add(b.decode("utf-8"))
+            elif tag == _NS:
+                value.add(Decimal(b.decode("ascii")))
+            else:
+                value.add(Binary(b))
+        return value, pos
+    raise ValueError("Unknown type tag {}.".format(tag))
+
+def _secret_bytes(secret):
+    if isinstance(secret, str):
+        return secret.encode("utf-8")
+    return secret
+
+def _sign(data, secret):
+    return hmac.new(_secret_bytes(secret), data, hashlib.sha256).digest()[:_SIGNATURE_BYTES]
+
+def encode(key, secret=None):
+    '''
+    Encodes a LastEvaluatedKey (or any dict of DynamoDB-storable values) into a NextToken.
+    If secret is given, the token is signed with it and decode() will insist on the same secret.
+    '''
+    out = bytearray((VERSION | (_SIGNED if secret else 0),))
+    _encode_value(key, out)
+    if secret:
+        out += _sign(bytes(out), secret)
+    return base64.urlsafe_b64encode(bytes(out)).decode("ascii").rstrip("=")
+
+def _decode_legacy(data):
+    return json.loads(data.decode("utf-8"), parse_float=Decimal, parse_int=Decimal)
+
+def decode(token, secret=None):
+    '''
+    Decodes a NextToken made by encode() (or by the old JSON-based encoder) back into a key.
+    When a secret is given, unsigned tokens (including all old-format ones) and tokens with
+    a bad signature are rejected.
+    '''
+    try:
+        data = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise RuntimeError("Invalid NextToken: {}".format(e))
+    if not data:
+        raise RuntimeError("Invalid NextToken: empty token.")
+    header = data[0]
+    if header == _LEGACY_PREFIX:
+        if secret:
+            raise RuntimeError("Invalid NextToken: token is not signed.")
+        try:
+            return _decode_legacy(data)
+        except (ValueError, UnicodeDecodeError) as e:
+            raise RuntimeError("Invalid NextToken: {}".format(e))
+    if header & 0x7F != VERSION:
+        raise RuntimeError("Invalid NextToken: unsupported version {}.".format(header & 0x7F))
+    if header & _SIGNED:
+        data, signature = data[:-_SIGNATURE_BYTES], data[-_SIGNATURE_BYTES:]
+        if not secret or not hmac.compare_digest(signature, _sign(data, secret)):
+            raise RuntimeError("Invalid NextToken: bad signature.")
+    elif secret:
+        raise RuntimeError("Invalid NextToken: token is not signed.")
+    try:
+        key, pos = _decode_value(data, 1)
+    except (IndexError, ValueError, UnicodeDecodeError, ArithmeticError) as e:
+        raise RuntimeError("Invalid NextToken: {}".format(e))
+    if pos != len(data):
+        raise RuntimeError("Invalid NextToken: trailing data.")
+    return key
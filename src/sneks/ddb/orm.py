@@ -2,20 +2,41 @@
 
 import base64
 from botocore.exceptions import *
-from boto3.dynamodb.conditions import Key, Attr, Or
-from boto3.dynamodb.types import TypeSerializer
+from boto3.dynamodb.conditions import Key, Attr, Or, ConditionExpressionBuilder
+from boto3.dynamodb.types import TypeSerializer, Binary
 import boto3
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import contextvars
 import copy
 from datetime import datetime
 import decimal
+import functools
 import html
 import inspect
 import json
 import logging
 import os
+import queue
 import random
+import threading
+import time
 import traceback
 
+from sneks import snekjson
+from sneks.ddb import audit
+from sneks.ddb import bulk
+from sneks.ddb.cache import ItemCache
+from sneks.ddb import columns
+from sneks.ddb.metrics import REGISTRY, consumed_capacity_units
+from sneks.ddb import nexttoken
+from sneks.ddb import planner
+from sneks.ddb import ratelimit
+from sneks.ddb import selectivity
+from sneks.ddb import wire
+from sneks.ddb.schema import key_metadata
+from sneks.ddb.identity import current_identity_map, returns_whole_items
+
 VERSION_KEY = '__version__'
 
 DATETIME_FORMAT = "datetime:%Y-%m-%dT%H:%M:%S.%fZ"
@@ -23,8 +44,20 @@ DATETIME_FORMAT = "datetime:%Y-%m-%dT%H:%M:%S.%fZ"
 logger = logging.getLogger(__name__)
 _TRACE_LEVEL = 1
 
-DDB_READ_CALLS = ["get_item","query","scan"]
-DDB_WRITE_CALLS = ["delete_item","put_item","update_item"]
+DDB_READ_CALLS = ["get_item","query","scan","batch_get_item"]
+DDB_WRITE_CALLS = ["delete_item","put_item","update_item","batch_write_item","transact_write_items"]
+# These live on the service client rather than on the Table resource.
+DDB_CLIENT_CALLS = ["batch_get_item","batch_write_item","transact_write_items"]
+
+BATCH_GET_LIMIT = 100
+BATCH_WRITE_LIMIT = 25
+TRANSACT_WRITE_LIMIT = 100
+BATCH_MAX_ATTEMPTS = 8
+BATCH_BACKOFF_BASE = 0.05
+BATCH_BACKOFF_CAP = 5.0
+
+# How many pages each parallel scan worker may have waiting for the consumer before it blocks.
+PAGES_BUFFERED_PER_WORKER = 2
 
 def _TRACE(msg, *args, **kwargs):
     return logger.log(_TRACE_LEVEL, msg, *args, **kwargs)
@@ -34,22 +67,52 @@ def DECIMAL(*args, **kwargs):
     decimal.getcontext().clear_flags()
     return d
 
-def _ensure_ddbsafe(d):
-    if isinstance(d, dict):
-        return {k:_ensure_ddbsafe(d[k]) for k in d}
-    elif isinstance(d, list):
-        return [_ensure_ddbsafe(e) for e in d]
+def _ddbsafe_key(k):
+    # Non-string keys get the same treatment json.dumps would give them.
+    return k if isinstance(k, str) else json.dumps(k)
+
+# Values of these exact types come out of ensure_ddbsafe unchanged, so the loops below skip the call entirely.
+_DDBSAFE_UNCHANGED = {int, bool, type(None)}
+
+def _ddbsafe_dict(d):
+    safe = {}
+    for k, v in d.items():
+        if k.__class__ is not str:
+            k = _ddbsafe_key(k)
+        if v.__class__ is str:
+            safe[k] = v if v else None
+        elif v.__class__ in _DDBSAFE_UNCHANGED:
+            safe[k] = v
+        else:
+            safe[k] = ensure_ddbsafe(v)
+    return safe
+
+def ensure_ddbsafe(d):
+    '''
+    Converts d into something boto3 can write to DynamoDB, building the new structure in a single pass.
+
+    Floats and Decimals become Decimals by way of their float repr (which is what the old JSON round trip did),
+    datetimes become DATETIME_FORMAT strings, empty strings become None, and tuples become lists.
+    '''
+    if isinstance(d, str):
+        return d if d else None
+    elif isinstance(d, dict):
+        return _ddbsafe_dict(d)
+    elif isinstance(d, (list, tuple)):
+        return [ensure_ddbsafe(e) for e in d]
+    elif d is None or isinstance(d, (bool, int)):
+        return d
+    elif isinstance(d, float):
+        return decimal.Decimal(repr(d))
     elif isinstance(d, decimal.Decimal):
-        return float(d)
+        return decimal.Decimal(repr(float(d)))
     elif isinstance(d, datetime):
         return d.strftime(DATETIME_FORMAT)
-    elif isinstance(d, str) and "" == d:
-        return None
-    else:
+    elif isinstance(d, (set, frozenset)):
+        return {ensure_ddbsafe(e) for e in d}
+    elif isinstance(d, (bytes, bytearray, Binary)):
         return d
-
-def ensure_ddbsafe(d):
-    return json.loads(json.dumps(_ensure_ddbsafe(d)), parse_float=decimal.Decimal)
+    raise TypeError("Object of type {} can't be stored in DynamoDB.".format(type(d).__name__))
 
 def _fix_types(d):
     if isinstance(d, dict):
@@ -58,6 +121,9 @@ def _fix_types(d):
         return [_fix_types(e) for e in d]
     elif isinstance(d, decimal.Decimal):
         return float(d)
+    elif isinstance(d, set):
+        # The raw item may be cached, so the object needs a set of its own.
+        return set(d)
     elif isinstance(d, str):
         if d.startswith("datetime:"):
             try:
@@ -66,18 +132,246 @@ def _fix_types(d):
                 pass
     return d
 
+def _copy_value(v):
+    # Containers get copied so objects never share mutable state with the raw item (which may be cached).
+    if v.__class__ is dict:
+        return {k:_copy_value(e) for k, e in v.items()}
+    elif v.__class__ is list:
+        return [_copy_value(e) for e in v]
+    elif v.__class__ is set:
+        return set(v)
+    return v
+
+def _decode_datetime(v):
+    return wire.decode_string(v) if isinstance(v, str) else v
+
+def _decode_int(v):
+    if isinstance(v, decimal.Decimal):
+        return int(v) if v == v.to_integral_value() else float(v)
+    return v
+
+def _decode_boolean(v):
+    return bool(v) if isinstance(v, decimal.Decimal) else v
+
+def _encode_datetime(v):
+    return v.strftime(DATETIME_FORMAT) if isinstance(v, datetime) else ensure_ddbsafe(v)
+
+def _encode_int(v):
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    if isinstance(v, decimal.Decimal) and v.is_finite() and v == v.to_integral_value():
+        return int(v)
+    return ensure_ddbsafe(v)
+
+def _encode_boolean(v):
+    return bool(v) if isinstance(v, (int, float, decimal.Decimal)) else ensure_ddbsafe(v)
+
+# DataField.data_type to the functions that convert a field's value coming out of and going into DynamoDB.
+# Every other type is text, which is read back untouched.
+_FIELD_DECODERS = {"datetime": _decode_datetime, "int": _decode_int, "boolean": _decode_boolean}
+_FIELD_ENCODERS = {"datetime": _encode_datetime, "int": _encode_int, "boolean": _encode_boolean}
+
+class _FieldCodec(object):
+    '''
+    Item conversion compiled from a list of DataFields.  Reading, only fields declared as datetime, int
+    or boolean get converted, and everything else comes through as boto3 returned it.  Writing, those
+    fields skip the generic type checks, and everything else goes through ensure_ddbsafe.
+    '''
+    def __init__(self, fields):
+        self.decoders = {f.key:_FIELD_DECODERS[f.data_type] for f in fields if f.data_type in _FIELD_DECODERS}
+        self.encoders = {f.key:_FIELD_ENCODERS[f.data_type] for f in fields if f.data_type in _FIELD_ENCODERS}
+
+    def decode(self, item):
+        decoders = self.decoders
+        decoded = {}
+        for k, v in item.items():
+            decoder = decoders.get(k)
+            if decoder:
+                decoded[k] = decoder(v)
+            else:
+                decoded[k] = _copy_value(v)
+        return decoded
+
+    def encode(self, item):
+        encoders = self.encoders
+        safe = {}
+        for k, v in item.items():
+            if k.__class__ is not str:
+                k = _ddbsafe_key(k)
+            safe[k] = encoders.get(k, ensure_ddbsafe)(v)
+        return safe
+
+class _hybridmethod(object):
+    '''
+    Like classmethod, but the function also gets the instance it was called on (or None, when called on the class).
+    '''
+    def __init__(self, func):
+        self.func = func
+        functools.update_wrapper(self, func)
+
+    def __get__(self, obj, cls):
+        return functools.partial(self.func, cls, obj)
+
+def _json_default(obj):
+    # For the things _fix_types leaves in an item that JSON has no type for.
+    if isinstance(obj, datetime):
+        return obj.strftime(DATETIME_FORMAT)
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=repr)
+    if isinstance(obj, decimal.Decimal):
+        # Number sets keep their Decimals through _fix_types; make_json_safe does the same for everything else.
+        return float(obj)
+    if isinstance(obj, Binary):
+        obj = obj.value
+    if isinstance(obj, (bytes, bytearray)):
+        return base64.b64encode(obj).decode("ascii")
+    raise TypeError("Object of type {} is not JSON serializable".format(type(obj).__name__))
+
+def _export_line(item):
+    return snekjson.dumps(item, default=_json_default, separators=(",", ":"))
+
+def _backoff(attempt):
+    # "Full jitter" exponential backoff, so a pile of workers retrying at once spreads itself out.
+    time.sleep(random.uniform(0, min(BATCH_BACKOFF_CAP, BATCH_BACKOFF_BASE * 2**attempt)))
+
+def _batch_with_retries(func, request_items, unprocessed_key, **kwargs):
+    """
+    Calls a batch operation, then keeps re-submitting whatever comes back under unprocessed_key
+    (with backoff) until everything has gone through.  Yields each raw response.
+    """
+    attempt = 0
+    while request_items:
+        response = func(RequestItems=request_items, **kwargs)
+        yield response
+        request_items = response.get(unprocessed_key)
+        if request_items:
+            attempt += 1
+            if attempt >= BATCH_MAX_ATTEMPTS:
+                raise RuntimeError("Batch request still had unprocessed items after {} attempts.".format(attempt))
+            _TRACE("Retrying {} after {} attempt(s).".format(unprocessed_key, attempt))
+            _backoff(attempt)
+
+def _put_unless_stopped(q, item, stop):
+    # Blocks until there's room in the queue, but bails out if the consumer has gone away.
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _fetch_pages(func, **kwargs):
+    # Yields one search response per page, only asking for the next page once the caller wants it.
+    response = func(**kwargs)
+    while response:
+        yield response
+        if response.get("NextToken"):
+            response = func(NextToken=response.get("NextToken"), **kwargs)
+        else:
+            response = None
+
+def _prefetch_pages(func, depth, **kwargs):
+    """
+    Same as _fetch_pages, but a background thread fetches up to depth pages ahead of the caller.
+    Closing the generator (or just dropping it) tells the thread to stop after its current request.
+    """
+    pages = queue.Queue()
+    # One slot per page that's been fetched but not yet handed to the caller.
+    slots = threading.Semaphore(depth)
+    stop = threading.Event()
+
+    def fetch():
+        try:
+            token = None
+            while True:
+                # Take the slot before making the request, so no more than depth pages are ever in hand.
+                while not slots.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                response = func(NextToken=token, **kwargs) if token else func(**kwargs)
+                if not response:
+                    return
+                pages.put(("page", response))
+                token = response.get("NextToken")
+                if not token:
+                    return
+        except Exception as e:
+            pages.put(("error", e))
+        finally:
+            pages.put(("done", None))
+
+    # Run the fetcher in a copy of this context, so metric scopes and identity maps follow it.
+    fetcher = threading.Thread(target=contextvars.copy_context().run, args=(fetch,), daemon=True)
+    fetcher.start()
+    try:
+        while True:
+            kind, payload = pages.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise payload
+            slots.release()
+            yield payload
+    finally:
+        stop.set()
+
+def _build_condition(CE):
+    # The resource layer only fills in placeholders at the top level of a request,
+    # so conditions nested inside TransactItems have to be built by hand.
+    built = ConditionExpressionBuilder().build_expression(CE)
+    params = {"ConditionExpression": built.condition_expression}
+    if built.attribute_name_placeholders:
+        params["ExpressionAttributeNames"] = built.attribute_name_placeholders
+    if built.attribute_value_placeholders:
+        params["ExpressionAttributeValues"] = built.attribute_value_placeholders
+    return params
+
+def ddb_resource():
+    # Set DDB_ENDPOINT_URL to point everything at DynamoDB Local or a similar stand-in.
+    return boto3.resource('dynamodb', endpoint_url=os.environ.get("DDB_ENDPOINT_URL") or None)
+
+def ddb_client():
+    # A plain client, without the python <-> DynamoDB type translation the resource's client does.
+    return boto3.client('dynamodb', endpoint_url=os.environ.get("DDB_ENDPOINT_URL") or None)
+
+_BACKEND = None
+
+def set_backend(backend):
+    '''
+    Points every ORM class at backend instead of DynamoDB: anything with a Table(name) method and a
+    meta.client that has the client-level calls, like a sneks.ddb.memory.MemoryDynamoDB or a boto3
+    DynamoDB resource.  None goes back to ddb_resource().
+    '''
+    global _BACKEND
+    _BACKEND = backend
+
+@contextlib.contextmanager
+def use_backend(backend):
+    previous = _BACKEND
+    set_backend(backend)
+    try:
+        yield backend
+    finally:
+        set_backend(previous)
+
+def ddb_backend():
+    return _BACKEND if _BACKEND is not None else ddb_resource()
+
 def record_ddb_capacity(capacity_used, action):
+    # Capacity recorded this way isn't tied to any particular table or call; see sneks.ddb.metrics for the details.
     try:
         action = action.upper()
-        if action not in ["READ","WRITE"]:
+        if action == "READ":
+            REGISTRY.record(read=capacity_used)
+        elif action == "WRITE":
+            REGISTRY.record(write=capacity_used)
+        elif action == "READ_SAVED":
+            REGISTRY.record_saved_read(capacity_used)
+        else:
             _TRACE("Invalid action '{}' provided.".format(action))
-            return
-        env_key = "DDB_{}_CAPACITY_USED".format(action)
-        if not os.environ.get(env_key, None):
-            os.environ[env_key] = "0"
-        cap_so_far = float(os.environ[env_key])
-        cap_so_far += capacity_used
-        os.environ[env_key] = str(cap_so_far)
     except:
         traceback.print_exc()
 
@@ -87,39 +381,68 @@ def record_read_capacity(capacity_used):
 def record_write_capacity(capacity_used):
     return record_ddb_capacity(capacity_used, "WRITE")
 
+def record_saved_read_capacity(capacity_saved):
+    # Reads that were answered from an item cache instead of DynamoDB.
+    return record_ddb_capacity(capacity_saved, "READ_SAVED")
+
 def record_capacity_from_results(results):
     record_capacity_from_response(results)
 
-def record_capacity_from_response(response, name=None):
+def record_capacity_from_response(response, name=None, latency=None, table=None):
     try:
-        if response.get("ConsumedCapacity"):
-            tcu = response["ConsumedCapacity"].get("CapacityUnits", 0)
-            rcu = response["ConsumedCapacity"].get("ReadCapacityUnits", 0)
-            wcu = response["ConsumedCapacity"].get("WriteCapacityUnits", 0)
-            if rcu or wcu:
-                record_read_capacity(rcu)
-                record_write_capacity(wcu)
-            elif name in DDB_READ_CALLS:
-                record_read_capacity(tcu)
-            elif name in DDB_WRITE_CALLS:
-                record_write_capacity(tcu)
-            else:
-                _TRACE("Unable to figure out what to do with the capacity info.")
-        else:
+        if not response.get("ConsumedCapacity"):
             _TRACE("ConsumedCapacity not found in response.")
+        if name in DDB_READ_CALLS:
+            kind = "READ"
+        elif name in DDB_WRITE_CALLS:
+            kind = "WRITE"
+        else:
+            kind = None
+        REGISTRY.record_response(response, operation=name, kind=kind, latency=latency, table=table)
     except:
         traceback.print_exc()
 
 class SamTable(object):
-    def __init__(self, table):
+    def __init__(self, table, backend=None):
         self.table = table
+        # The backend the table came from (None for ddb_resource()), so classes can tell when it's changed.
+        self.backend = backend
 
     def _do_stuff(self, *args, _innerfuncname=None, **kwargs):
         if "ReturnConsumedCapacity" not in kwargs:
             kwargs["ReturnConsumedCapacity"] = "INDEXES"
-        _innerfunc = getattr(self.table, _innerfuncname)
-        response = _innerfunc(*args, **kwargs)
-        record_capacity_from_response(response, name=_innerfuncname)
+        if _innerfuncname in DDB_CLIENT_CALLS:
+            # The resource's client still does the python <-> DynamoDB type translation for us.
+            _innerfunc = getattr(self.table.meta.client, _innerfuncname)
+        else:
+            _innerfunc = getattr(self.table, _innerfuncname)
+        table_name = getattr(self.table, "name", None)
+        limiter = ratelimit.limiter_for(table_name)
+        kind = "READ" if _innerfuncname in DDB_READ_CALLS else "WRITE"
+        attempt = 0
+        while True:
+            reserved = limiter.acquire(kind) if limiter else 0
+            start = time.time()
+            try:
+                response = _innerfunc(*args, **kwargs)
+                break
+            except BaseException as e:
+                if limiter:
+                    limiter.refund(kind, reserved)
+                if not ratelimit.is_throttle(e):
+                    raise
+                REGISTRY.record_throttle(table=table_name, operation=_innerfuncname)
+                if attempt + 1 >= ratelimit.THROTTLE_MAX_ATTEMPTS:
+                    raise
+                attempt += 1
+                if limiter:
+                    limiter.throttled(kind)
+                _TRACE("{} on {} was throttled, retrying after {} attempt(s).".format(_innerfuncname, table_name, attempt))
+                ratelimit.backoff(attempt)
+        latency = time.time()-start
+        if limiter:
+            limiter.settle(kind, reserved, consumed_capacity_units(response) if response.get("ConsumedCapacity") else None)
+        record_capacity_from_response(response, name=_innerfuncname, latency=latency, table=table_name)
         return response
 
     def __getattr__(self, name):
@@ -136,6 +459,14 @@ class BaseDynamoObject(dict):
     """
     _SCHEMA_CACHE = None
     _TABLE_CACHE = None
+    _KEY_METADATA = None
+    _ITEM_CACHE = None
+    # Set this to sign NextTokens, so callers can't hand back a key they made up themselves.
+    _NEXTTOKEN_SECRET = None
+    # Set this to have get_item/query/scan go through the low-level client and sneks.ddb.wire's single-pass decoder.
+    # Classes that override _decode_item still get their own conversion, just without the single pass.
+    _WIRE_READS = False
+    _WIRE_TABLE_CACHE = None
     _CLASSNAME = None
     _REQUIRED_ATTRS = []
     _COMPOUND_ATTRS = {}
@@ -148,6 +479,11 @@ class BaseDynamoObject(dict):
             return d
         return cls(d)
 
+    @classmethod
+    def _from_ddb(cls, item):
+        # Builds an object from an item that was just read out of the table.
+        return cls(item)
+
     @classmethod
     def objectify(cls, d):
         return cls._from_dict(d)
@@ -157,42 +493,92 @@ class BaseDynamoObject(dict):
 
     @classmethod
     def _encode_nexttoken(cls, key):
-        # TODO: replace the json step with something that'll work for any input
-        # Convert to a string
-        # This won't work for a lot of valid keys due to the json serialization step
-        key = _fix_types(key)
-        key = json.dumps(key)
-        # base64 encode it to make it safer to handle
-        key = base64.urlsafe_b64encode(key.encode("utf-8")).decode("utf-8")
-        # strip the padding, as we can easily re-add it later
-        key = key.replace("=","")
-        return key
+        return nexttoken.encode(key, secret=cls._NEXTTOKEN_SECRET)
 
     @classmethod
     def _decode_nexttoken(cls, key):
-        # TODO: replace the json step with something that'll work for any input
-        # re-add the padding
-        key = key + "=" * ((-1*len(key))%16)
-        # convert if back from base64-encoded bytes to the underlying string
-        key = base64.urlsafe_b64decode(key.encode("utf-8")).decode("utf-8")
-        # load the string back into a dict
-        # This won't work for a lot of valid keys due to the json serialization step
-        key = json.loads(key)
-        key = ensure_ddbsafe(key)
-        return key
+        return nexttoken.decode(key, secret=cls._NEXTTOKEN_SECRET)
+
+    @classmethod
+    def _identity_key(cls, key):
+        return (cls.CLASS_NAME(), cls.TABLE_NAME()) + cls._key_tuple(key)
+
+    @classmethod
+    def _materialize(cls, item, register=True, decoded=False, partial=False, use_identity_map=True):
+        '''
+        Turns a raw item from DynamoDB into an object.  If an identity map is open and already has
+        an object for this item, that object is returned instead.  Otherwise the new object is added
+        to the map, unless register is False (for things like index queries that may not return whole items).
+        decoded means the item came from sneks.ddb.wire and its types are already fixed.
+        partial means the item may be missing attributes (see DynamoObject._fill_in).
+        use_identity_map=False always builds a new object and leaves the map alone, for refreshing the mapped one.
+        '''
+        identity = current_identity_map() if use_identity_map else None
+        if identity is None:
+            obj = cls._from_ddb(item if decoded else cls._decode_item(item))
+            if partial:
+                obj._partial = True
+            return obj
+        identity_key = cls._identity_key(item)
+        obj = identity.get(identity_key)
+        if obj is None:
+            obj = cls._from_ddb(item if decoded else cls._decode_item(item))
+            if partial:
+                obj._partial = True
+            if register:
+                obj = identity.add(identity_key, obj)
+        return obj
+
+    @classmethod
+    def _decode_item(cls, item):
+        # Raw item from boto3 to the values objects hold.  Subclasses that know their fields' types can do less work.
+        return _fix_types(item)
+
+    @classmethod
+    def _generic_decoding(cls):
+        # Whether this class uses the plain _fix_types conversion, which sneks.ddb.wire can do while reading the item.
+        # Anything else has to see items the way the resource layer hands them out, so it decodes the same either way.
+        return getattr(cls._decode_item, "__func__", None) is BaseDynamoObject._decode_item.__func__
+
+    @classmethod
+    def _encode_item(cls, item):
+        return ensure_ddbsafe(item)
 
     @classmethod
-    def _parse_items(cls, response):
+    def _parse_items(cls, response, register=True, decoded=False, partial=False):
         items = []
         for item in response.get("Items",[]):
-            items.append(cls(dict(_fix_types(item))))
+            items.append(cls._materialize(item, register=register, decoded=decoded, partial=partial))
         return items
 
+    @classmethod
+    def _projection_params(cls, attrs, names=None):
+        '''
+        ProjectionExpression and ExpressionAttributeNames for a Projection list.  The keys and the version
+        always come along, so the object can still be fetched in full or updated in place later.
+        '''
+        attrs = list(attrs) + [k for k in cls._HASH_AND_RANGE_KEYS() + (VERSION_KEY,) if k and k not in attrs]
+        names = dict(names or {})
+        placeholders = []
+        for i, attr in enumerate(attrs):
+            names["#p{}".format(i)] = attr
+            placeholders.append("#p{}".format(i))
+        return ", ".join(placeholders), names
+
+    @classmethod
+    def _returns_partial_items(cls, params):
+        if params.get("ProjectionExpression") or params.get("AttributesToGet"):
+            return True
+        if params.get("IndexName"):
+            index = cls.KEY_METADATA().indexes.get(params["IndexName"])
+            return not index or index.projection != "ALL"
+        return False
+
     @classmethod
     def _preprocess_search_params(cls, **kwargs):
         params = dict(kwargs)
         if "ReturnConsumedCapacity" not in params:
-            params["ReturnConsumedCapacity"] = "TOTAL"
+            params["ReturnConsumedCapacity"] = "INDEXES"
         if params.get("ShufflePages", None):
             del params["ShufflePages"]
         if params.get("PageSize", None):
@@ -201,11 +587,14 @@ class BaseDynamoObject(dict):
             del params["PageSize"]
         if params.get("MaxResults", None):
             if params["MaxResults"] > 0 and not params.get("Limit", None):
-                # This is an arbitrary padding factor in case the user is using some sort of server-side filtering.
-                # Limit sets the number of items evaluated, so the number returned may be smaller.
-                # TODO: Either properly document this, or make it less janktastic.
-                params["Limit"] = 5*params["MaxResults"]
+                # Limit sets the number of items evaluated, so with a filter the number returned may be smaller.
+                # Size it from how selective this sort of search has been before (see sneks.ddb.selectivity).
+                params["Limit"] = selectivity.TRACKER.limit_for(cls._search_shape(params), params["MaxResults"])
             del params["MaxResults"]
+        if params.get("Projection", None):
+            params["ProjectionExpression"], params["ExpressionAttributeNames"] = cls._projection_params(params["Projection"], params.get("ExpressionAttributeNames"))
+        if "Projection" in params:
+            del params["Projection"]
         if params.get("NextToken", None) and not params.get("ExclusiveStartKey", None):
             params["ExclusiveStartKey"] = cls._decode_nexttoken(params["NextToken"])
         if "NextToken" in params:
@@ -237,10 +626,10 @@ class BaseDynamoObject(dict):
         return params
 
     @classmethod
-    def _postprocess_search_results(cls, results):
+    def _postprocess_search_results(cls, results, register=True, decoded=False, partial=False):
         # record_read_capacity_from_results(results)
         response = {
-            "Items":cls._parse_items(results),
+            "Items":cls._parse_items(results, register=register, decoded=decoded, partial=partial),
             "Count":results.get("Count",0),
             "ScannedCount":results.get("ScannedCount",0),
             "NextToken":None,
@@ -258,8 +647,23 @@ class BaseDynamoObject(dict):
             logger.error("Nice try, kiddo.")
             raise RuntimeError("Invalid search operation '{}' specified.".format(func_name))
         params = cls._preprocess_search_params(**kwargs)
-        results = getattr(cls.TABLE(),func_name)(**params)
-        return cls._postprocess_search_results(results)
+        wire_table = cls.WIRE_TABLE()
+        results = cls._audited_search(wire_table or cls.TABLE(), func_name, params)
+        return cls._postprocess_search_results(results, register=returns_whole_items(params), decoded=wire_table is not None and cls._generic_decoding(), partial=cls._returns_partial_items(params))
+
+    @classmethod
+    def _search_shape(cls, params):
+        return selectivity.search_shape(cls.TABLE_NAME(), params)
+
+    @classmethod
+    def _audited_search(cls, table, func_name, params, operation=None):
+        # One page of a search, with what it found recorded for Limit sizing and scan auditing (see sneks.ddb.audit).
+        start = time.perf_counter()
+        results = getattr(table, func_name)(**params)
+        latency = time.perf_counter() - start
+        selectivity.TRACKER.observe(cls._search_shape(params), results.get("Count",0), results.get("ScannedCount",0))
+        audit.AUDITOR.observe(operation or func_name, cls.TABLE_NAME(), params, results, latency=latency)
+        return results
 
     @staticmethod
     def _autopaginate_search(func, **kwargs):
@@ -270,25 +674,25 @@ class BaseDynamoObject(dict):
             max_results = kwargs.get("MaxResults", max_results)
         elif "Limit" in kwargs:
             max_results = kwargs.get("Limit", max_results)
+        prefetch = kwargs.pop("Prefetch", None)
         item_count = 0
-        finished = False
         shuffle_pages = kwargs.get("ShufflePages", False)
-        response = func(**kwargs)
-        while response and not finished:
-            items = response.get("Items")
-            if shuffle_pages:
-                random.shuffle(items)
-            for item in items:
-                if finished:
-                    break
-                item_count += 1
-                if max_results > 0 and item_count >= max_results:
-                    finished = True
-                yield item
-            if response.get("NextToken") and not finished:
-                response = func(NextToken=response.get("NextToken"), **kwargs)
-            else:
-                response = None
+        if prefetch and prefetch > 0:
+            pages = _prefetch_pages(func, prefetch, **kwargs)
+        else:
+            pages = _fetch_pages(func, **kwargs)
+        try:
+            for response in pages:
+                items = response.get("Items")
+                if shuffle_pages:
+                    random.shuffle(items)
+                for item in items:
+                    item_count += 1
+                    yield item
+                    if max_results > 0 and item_count >= max_results:
+                        return
+        finally:
+            pages.close()
 
     @classmethod
     def scan(cls, **kwargs):
@@ -298,46 +702,393 @@ class BaseDynamoObject(dict):
     def query(cls, **kwargs):
         return cls._scanquery("query", **kwargs)
 
+    @classmethod
+    def _parallel_scan(cls, Segments, Workers=None, ProgressCallback=None, **kwargs):
+        """
+        Runs a DynamoDB parallel scan, one worker thread per segment (up to Workers at a time),
+        and yields the items as they arrive.  Pages are handed over through a bounded queue,
+        so the workers can only get a little ahead of the consumer.
+        """
+        max_results = kwargs.get("MaxResults", kwargs.get("Limit", -1))
+        shuffle_pages = kwargs.get("ShufflePages", False)
+        workers = min(Workers if Workers else Segments, Segments)
+        pages = queue.Queue(maxsize=PAGES_BUFFERED_PER_WORKER*workers)
+        stop = threading.Event()
+
+        def scan_segment(segment):
+            progress = {
+                "Segment": segment,
+                "TotalSegments": Segments,
+                "Pages": 0,
+                "Count": 0,
+                "ScannedCount": 0,
+                "ConsumedCapacity": 0.0,
+                "Finished": False
+            }
+            try:
+                params = dict(kwargs, Segment=segment, TotalSegments=Segments)
+                response = cls.scan(**params)
+                while response and not stop.is_set():
+                    progress["Pages"] += 1
+                    progress["Count"] += response.get("Count", 0)
+                    progress["ScannedCount"] += response.get("ScannedCount", 0)
+                    progress["ConsumedCapacity"] += consumed_capacity_units(response["RawResponse"])
+                    progress["Finished"] = not response.get("NextToken")
+                    logger.info("Scan segment {Segment}/{TotalSegments}: {Pages} pages, {Count} items, {ScannedCount} scanned, {ConsumedCapacity} capacity units".format(**progress))
+                    if ProgressCallback:
+                        ProgressCallback(dict(progress))
+                    if not _put_unless_stopped(pages, ("page", response["Items"]), stop):
+                        return
+                    if response.get("NextToken") and not stop.is_set():
+                        response = cls.scan(NextToken=response.get("NextToken"), **params)
+                    else:
+                        response = None
+            except Exception as e:
+                _put_unless_stopped(pages, ("error", e), stop)
+            finally:
+                _put_unless_stopped(pages, ("done", None), stop)
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            for segment in range(Segments):
+                # Run each worker in a copy of this context, so metric scopes and identity maps follow it.
+                executor.submit(contextvars.copy_context().run, scan_segment, segment)
+            item_count = 0
+            remaining = Segments
+            while remaining:
+                kind, payload = pages.get()
+                if kind == "done":
+                    remaining -= 1
+                elif kind == "error":
+                    raise payload
+                else:
+                    if shuffle_pages:
+                        random.shuffle(payload)
+                    for item in payload:
+                        item_count += 1
+                        yield item
+                        if max_results > 0 and item_count >= max_results:
+                            return
+        finally:
+            stop.set()
+            # Wait out any page a worker is in the middle of, so nothing's left running against the table once this returns.
+            executor.shutdown(wait=True, cancel_futures=True)
+
     @classmethod
     def scan_all(cls, **kwargs):
+        '''
+        Generator over every item matched by a scan.
+
+        Pass Segments=N to run it as a parallel scan of N segments, with Workers=M threads
+        (default N) doing the scanning.  ProgressCallback, if given, is called with a dict of
+        per-segment stats (pages, counts, consumed capacity) after every page.
+
+        Pass Prefetch=k to have a background thread fetch up to k pages ahead while you iterate.
+        (Parallel scans already buffer pages per worker, so it's ignored there.)
+        '''
+        segments = kwargs.pop("Segments", None)
+        if segments and segments > 1:
+            kwargs.pop("Prefetch", None)
+            return cls._parallel_scan(segments, **kwargs)
+        kwargs.pop("Workers", None)
+        kwargs.pop("ProgressCallback", None)
         return cls._autopaginate_search(cls.scan, **kwargs)
 
     @classmethod
     def query_all(cls, **kwargs):
+        '''
+        Generator over every item matched by a query.
+        Pass Prefetch=k to have a background thread fetch up to k pages ahead while you iterate.
+        '''
         return cls._autopaginate_search(cls.query, **kwargs)
 
+    @classmethod
+    def _column_search(cls, func_name, attrs, Arrays="array", **kwargs):
+        if kwargs.get("ProjectionExpression") or kwargs.get("Select"):
+            raise RuntimeError("Column searches build their own projection, so ProjectionExpression and Select can't be given.")
+        builder = columns.ColumnBuilder(attrs, Arrays=Arrays, MaxRows=kwargs.get("MaxResults"))
+        params = cls._preprocess_search_params(**kwargs)
+        params["ProjectionExpression"], params["ExpressionAttributeNames"] = columns.projection(attrs, params.get("ExpressionAttributeNames"))
+        table = cls.TABLE()
+        while True:
+            results = cls._audited_search(table, func_name, params)
+            if not builder.add_items(results.get("Items", [])) or not results.get("LastEvaluatedKey"):
+                break
+            params["ExclusiveStartKey"] = results["LastEvaluatedKey"]
+        return builder.result()
+
+    @classmethod
+    def scan_columns(cls, attrs, Arrays="array", **kwargs):
+        '''
+        Scans every page and returns just attrs, as a dict of attribute name to column, with one entry per item
+        in each.  Only attrs are fetched (with a ProjectionExpression), and no objects are built along the way.
+        Numeric columns are array('d')s, or numpy arrays with Arrays="numpy"; see sneks.ddb.columns for the details.
+        Takes the same arguments as scan(), with MaxResults capping the number of rows.
+        '''
+        return cls._column_search("scan", attrs, Arrays=Arrays, **kwargs)
+
+    @classmethod
+    def query_columns(cls, attrs, Arrays="array", **kwargs):
+        '''
+        query() counterpart of scan_columns().
+        '''
+        return cls._column_search("query", attrs, Arrays=Arrays, **kwargs)
+
+    @classmethod
+    def _plan(cls, **kwargs):
+        return planner.plan(cls.TABLE_NAME(), cls.KEY_METADATA(), cls.SCHEMA(), kwargs)
+
+    @classmethod
+    def explain(cls, **kwargs):
+        '''
+        How find() would run a search, without running it: whether it's a query or a scan, on which index,
+        which conditions go into the key and which into the filter, and why each index was or wasn't picked.
+        '''
+        plan = cls._plan(**kwargs)
+        del plan["Params"]
+        return plan
+
+    @classmethod
+    def find(cls, **kwargs):
+        '''
+        Searches by attribute, e.g. find(email="x") or find(owner="x", created=["gt", since]), without needing to know
+        the table's keys or indexes: it queries the table or the best matching index, and only falls back to a
+        filtered scan when none of them match.  Other arguments are passed along to query()/scan() as usual.
+        See sneks.ddb.planner for how the choice is made, and explain() to see it.
+        '''
+        plan = cls._plan(**kwargs)
+        return getattr(cls, plan["Operation"])(**plan["Params"])
+
+    @classmethod
+    def find_all(cls, **kwargs):
+        '''
+        Generator over every item matched by find().
+        '''
+        plan = cls._plan(**kwargs)
+        return getattr(cls, plan["Operation"] + "_all")(**plan["Params"])
+
     @classmethod
     def count(cls, **kwargs):
         kwargs["Select"] = "COUNT"
         params = cls._preprocess_search_params(**kwargs)
-        results = cls.TABLE().query(**params)
+        results = cls._audited_search(cls.TABLE(), "query", params, operation="count")
         return cls._postprocess_search_results(results)
 
     @classmethod
-    def count_all(cls, **kwargs):
-        response = cls.count(**kwargs)
-        item_count = 0
-        scanned_count = 0
+    def _count_search(cls, func_name, **kwargs):
+        # Runs a Select=COUNT scan or query through to the last page and adds up what it saw.
+        kwargs["Select"] = "COUNT"
+        totals = {
+            "Count": 0,
+            "ScannedCount": 0,
+            "ConsumedCapacity": 0.0
+        }
+        response = cls._scanquery(func_name, **kwargs)
         while response:
-            item_count += response.get("Count",0)
-            scanned_count += response.get("ScannedCount",0)
+            totals["Count"] += response.get("Count",0)
+            totals["ScannedCount"] += response.get("ScannedCount",0)
+            totals["ConsumedCapacity"] += consumed_capacity_units(response["RawResponse"])
             if response.get("NextToken"):
-                response = cls.count(NextToken=response.get("NextToken"), **kwargs)
+                response = cls._scanquery(func_name, NextToken=response.get("NextToken"), **kwargs)
             else:
                 response = None
-        return {
-            "Count": item_count,
-            "ScannedCount": scanned_count
+        return totals
+
+    @classmethod
+    def count_all(cls, Segments=None, HashKeys=None, Workers=None, SampleFraction=None, **kwargs):
+        '''
+        Counts everything matched by a query, following pagination to the end.
+
+        Pass Segments=N to count the whole table (or index) with a parallel scan of N segments instead,
+        or HashKeys=[...] to run one query per hash key in parallel and add them up.  Workers caps
+        the number of threads (default: one per segment/hash key).
+
+        With Segments, SampleFraction=f only scans a random f of the segments and scales the totals up
+        to match, which is a lot cheaper and usually close enough for a table whose keys are well spread.
+        The result has Approximate=True when that happens.
+        '''
+        kwargs.pop("Prefetch", None)
+        if Segments and HashKeys is not None:
+            raise RuntimeError("Specify either Segments or HashKeys for count_all, not both.")
+        if not Segments and HashKeys is None:
+            return cls._count_search("query", **kwargs)
+        func_name = "scan" if Segments else "query"
+        if Segments:
+            segments = list(range(Segments))
+            if SampleFraction and SampleFraction < 1:
+                segments = random.sample(segments, max(1, int(round(Segments * SampleFraction))))
+            tasks = [dict(kwargs, Segment=segment, TotalSegments=Segments) for segment in segments]
+        else:
+            tasks = [dict(kwargs, HashKey=hash_key) for hash_key in HashKeys]
+        totals = {
+            "Count": 0,
+            "ScannedCount": 0,
+            "ConsumedCapacity": 0.0
         }
+        if not tasks:
+            return totals
+        workers = min(Workers if Workers else len(tasks), len(tasks))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, cls._count_search, func_name, **params) for params in tasks]
+            for future in futures:
+                result = future.result()
+                for k in totals:
+                    totals[k] += result[k]
+        if Segments and len(tasks) < Segments:
+            scale = Segments / len(tasks)
+            totals["Count"] = int(round(totals["Count"] * scale))
+            totals["ScannedCount"] = int(round(totals["ScannedCount"] * scale))
+            totals["Approximate"] = True
+            totals["SegmentsCounted"] = len(tasks)
+        return totals
+
+    @classmethod
+    def export_table(cls, directory, Segments=4, Workers=None, ProgressCallback=None, **kwargs):
+        '''
+        Exports every item in the table into directory as gzipped NDJSON, one file per scan segment,
+        running the segments on up to Workers threads (default: one per segment).  The export can be
+        resumed by running it again into the same directory with the same number of segments.
+        ProgressCallback, if given, gets the running totals (items, capacity, throughput) after every page.
+        Any other kwargs (FilterExpression, ConsistentRead, ...) go to every scan call.
+        See sneks.ddb.bulk for the file layout.
+        '''
+        serialize = lambda item: _export_line(cls._decode_item(item))
+        return bulk.export_segments(cls._scan_items, directory, Segments, Workers=Workers, serialize=serialize, ProgressCallback=ProgressCallback, **kwargs)
+
+    @classmethod
+    def _scan_items(cls, **kwargs):
+        # One page of a scan with the raw items in it, for going through a whole table without building
+        # an object for (or registering in an identity map) every item in it.
+        params = cls._preprocess_search_params(**kwargs)
+        results = cls._audited_search(cls.TABLE(), "scan", params)
+        response = {
+            "Items": results.get("Items", []),
+            "Count": results.get("Count", 0),
+            "ScannedCount": results.get("ScannedCount", 0),
+            "NextToken": None,
+            "RawResponse": results
+        }
+        if results.get("LastEvaluatedKey", None):
+            response["NextToken"] = cls._encode_nexttoken(results["LastEvaluatedKey"])
+        return response
 
     @classmethod
     def load(cls, **kwargs):
-        obj = cls.TABLE().get_item(Key=kwargs).get("Item", {})
+        '''
+        Loads the item with the given key, or returns None if there isn't one.
+        Pass Projection=[attribute names] to fetch only those (plus the keys and version), which gives a
+        partial object that fetches the rest the first time something it doesn't have is asked for.
+        '''
+        projection = kwargs.pop("Projection", None)
+        return cls._load(kwargs, Projection=projection)
+
+    @classmethod
+    def _load(cls, key, use_cache=True, Projection=None):
+        # use_cache=False skips the identity map as well as the item cache, and always returns a new object.
+        key = ensure_ddbsafe(key)
+        identity = current_identity_map()
+        if identity is not None and use_cache:
+            obj = identity.get(cls._identity_key(key))
+            if obj is not None:
+                return obj
+        cache = cls._ITEM_CACHE
+        if cache and use_cache:
+            obj = cache.get(cls._cache_key(key))
+            if obj:
+                return cls._materialize(obj)
+        params = {"Key": key}
+        if Projection:
+            params["ProjectionExpression"], params["ExpressionAttributeNames"] = cls._projection_params(Projection)
+            # Only whole items go in the cache.
+            cache = None
+        partial = bool(Projection)
+        wire_table = cls.WIRE_TABLE() if not cache else None
+        if wire_table:
+            obj = wire_table.get_item(**params).get("Item")
+            return cls._materialize(obj, register=not partial, decoded=cls._generic_decoding(), partial=partial, use_identity_map=use_cache) if obj else None
+        obj = cls.TABLE().get_item(**params).get("Item", {})
+        if cache:
+            if obj:
+                cache.put(cls._cache_key(key), obj)
+            else:
+                cache.invalidate(cls._cache_key(key))
         if obj:
-            obj = _fix_types(obj)
-            return cls(obj)
+            return cls._materialize(obj, register=not partial, partial=partial, use_identity_map=use_cache)
         return None
 
+    @classmethod
+    def enable_item_cache(cls, max_items=1000, max_bytes=16*1024*1024, ttl=300):
+        '''
+        Turns on a read-through LRU cache under load() for this class (and its subclasses).
+        save(), delete() and reload() keep it up to date for writes made through this process.
+
+        :param max_items: Most items to hold at once.
+        :param max_bytes: Most total (approximate DynamoDB) item bytes to hold at once.
+        :param ttl: Seconds before a cached item has to be fetched again.
+        :rtype: ItemCache
+        '''
+        cls._ITEM_CACHE = ItemCache(max_items=max_items, max_bytes=max_bytes, ttl=ttl, on_hit=record_saved_read_capacity)
+        return cls._ITEM_CACHE
+
+    @classmethod
+    def disable_item_cache(cls):
+        cls._ITEM_CACHE = None
+
+    @classmethod
+    def item_cache_stats(cls):
+        return cls._ITEM_CACHE.stats() if cls._ITEM_CACHE else None
+
+    @classmethod
+    def _cache_key(cls, key):
+        # Subclasses may share a cache while living in different tables.
+        return (cls.TABLE_NAME(),) + cls._key_tuple(key)
+
+    @classmethod
+    def _cache_item(cls, item):
+        # Takes an item as it was written, and caches it the way it would be read, so loads get the same types whether they hit the cache or not.
+        if cls._ITEM_CACHE:
+            cls._ITEM_CACHE.put(cls._cache_key(item), wire.as_read(item))
+
+    @classmethod
+    def _uncache_item(cls, key):
+        if cls._ITEM_CACHE:
+            cls._ITEM_CACHE.invalidate(cls._cache_key(ensure_ddbsafe(key)))
+
+    @classmethod
+    def _key_tuple(cls, d):
+        hashname, rangename = cls._HASH_AND_RANGE_KEYS()
+        return (d.get(hashname), d.get(rangename) if rangename else None)
+
+    @classmethod
+    def batch_load(cls, keys, ConsistentRead=False):
+        '''
+        Loads a bunch of items using BatchGetItem, BATCH_GET_LIMIT keys per request.
+
+        :param keys: List of key dicts, the same as you'd pass to load() one at a time.
+        :rtype: List of objects in the same order as keys, with None wherever the item doesn't exist.
+        '''
+        table_name = cls.TABLE_NAME()
+        keys = [ensure_ddbsafe(k) for k in keys]
+        key_tuples = [cls._key_tuple(k) for k in keys]
+        found = {}
+        identity = current_identity_map()
+        if identity is not None:
+            for t, k in zip(key_tuples, keys):
+                obj = identity.get(cls._identity_key(k))
+                if obj is not None:
+                    found[t] = obj
+        # BatchGetItem rejects requests containing the same key twice.
+        unique_keys = list({t:k for t, k in zip(key_tuples, keys) if t not in found}.values())
+        fetched = {}
+        for i in range(0, len(unique_keys), BATCH_GET_LIMIT):
+            request = {"Keys": unique_keys[i:i+BATCH_GET_LIMIT]}
+            if ConsistentRead:
+                request["ConsistentRead"] = True
+            for response in _batch_with_retries(cls.TABLE().batch_get_item, {table_name: request}, "UnprocessedKeys"):
+                for item in response.get("Responses", {}).get(table_name, []):
+                    fetched[cls._key_tuple(item)] = item
+        return [found[t] if t in found else cls._materialize(fetched[t]) if t in fetched else None for t in key_tuples]
+
     @classmethod
     def SCHEMA(cls, use_cache=True):
         if cls._SCHEMA_CACHE and use_cache:
@@ -361,39 +1112,56 @@ class BaseDynamoObject(dict):
 
     @classmethod
     def TABLE(cls):
-        if not cls._TABLE_CACHE:
-            cls._TABLE_CACHE = SamTable(boto3.resource('dynamodb').Table(cls.TABLE_NAME()))
+        if not cls._TABLE_CACHE or cls._TABLE_CACHE.backend is not _BACKEND:
+            cls._TABLE_CACHE = SamTable(ddb_backend().Table(cls.TABLE_NAME()), backend=_BACKEND)
         return cls._TABLE_CACHE
 
+    @classmethod
+    def WIRE_TABLE(cls):
+        '''
+        The table for reads that skip the resource layer (see sneks.ddb.wire), if _WIRE_READS is set.
+        Other backends (see set_backend) take python values rather than AttributeValues, so they always get None.
+        '''
+        if not cls._WIRE_READS or _BACKEND is not None:
+            return None
+        # Kept per class (not inherited), since how items get decoded depends on the class.
+        table = cls.__dict__.get("_WIRE_TABLE_CACHE")
+        if not table:
+            table = SamTable(wire.WireTable(ddb_client(), cls.TABLE_NAME(), decode_items=cls._generic_decoding()))
+            cls._WIRE_TABLE_CACHE = table
+        return table
+
     @classmethod
     def create_table(cls):
-        boto3.client("dynamodb").create_table(**cls._SCHEMA())
+        ddb_backend().meta.client.create_table(**cls._SCHEMA())
+
+    @classmethod
+    def KEY_METADATA(cls):
+        '''
+        Key names for the table and its indexes, resolved from the schema the first time they're needed.
+        Kept per class (not inherited), and thrown away by _clear_cf_cache.
+
+        :rtype: sneks.ddb.schema.KeyMetadata
+        '''
+        metadata = cls.__dict__.get("_KEY_METADATA")
+        if metadata is None:
+            metadata = key_metadata(cls._SCHEMA(), cls._REQUIRED_ATTRS)
+            cls._KEY_METADATA = metadata
+        return metadata
 
     @classmethod
     def _get_required_attributes(cls):
-        attrs = []
-        hashkn, rangekn = cls._HASH_AND_RANGE_KEYS()
-        if hashkn:
-            attrs.append(hashkn)
-        if rangekn:
-            attrs.append(rangekn)
-        attrs.extend(cls._REQUIRED_ATTRS)
-        return attrs
+        return list(cls.KEY_METADATA().required)
 
     @classmethod
     def _HASH_AND_RANGE_KEYS(cls, index_name=None):
-        schema = cls._SCHEMA()
-        key_schema = schema['KeySchema']
+        metadata = cls.KEY_METADATA()
         if index_name:
-            gsis = schema.get("GlobalSecondaryIndexes", [])
-            matches = [gsi for gsi in gsis if gsi["IndexName"] == index_name]
-            if len(matches) == 0:
+            index = metadata.indexes.get(index_name)
+            if not index:
                 raise RuntimeError("No index with the name '{index_name}' found!".format(index_name=index_name))
-            key_schema = matches[0]["KeySchema"]
-        hash = [h['AttributeName'] for h in key_schema if h['KeyType']=='HASH'][0]
-        ranges = [r['AttributeName'] for r in key_schema if r['KeyType']=='RANGE']
-        range = ranges[0] if ranges else None
-        return hash, range
+            return index.hash, index.range
+        return metadata.hash, metadata.range
 
     @classmethod
     def _get_class_relation_map(cls, obj):
@@ -419,8 +1187,44 @@ class DynamoObject(BaseDynamoObject):
     :param kwargs: Keys for an object, and any attributes to attach to that object.
     :rtype: DynamoObject
     '''
+    # Unpickling sets items before it restores the rest of the state (and never calls __init__), so these need class-level defaults.
+    _in_db = False
+    _partial = False
+    _changed_keys = None
+    _removed_keys = None
+
     def __init__(self, mapping={}, **kwargs):
         super().__init__(mapping, **kwargs)
+        # Whether this object was read from (or has been written to) the table.
+        self._in_db = False
+        # Keys that have been set or deleted since then, so save() can send just those.
+        self._changed_keys = set()
+        self._removed_keys = set()
+        # Whether this was read with a projection (or from an index that doesn't have every attribute).
+        self._partial = False
+
+    @classmethod
+    def _from_ddb(cls, item):
+        obj = cls(item)
+        obj._mark_clean()
+        return obj
+
+    def _mark_clean(self):
+        self._in_db = True
+        self._changed_keys = set()
+        self._removed_keys = set()
+
+    def _mark_changed(self, key):
+        if self._changed_keys is None:
+            self._changed_keys, self._removed_keys = set(), set()
+        self._changed_keys.add(key)
+        self._removed_keys.discard(key)
+
+    def _mark_removed(self, key):
+        if self._changed_keys is None:
+            self._changed_keys, self._removed_keys = set(), set()
+        self._removed_keys.add(key)
+        self._changed_keys.discard(key)
 
     def __getitem__(self, key):
         if key in self._META_ITEMS:
@@ -428,6 +1232,10 @@ class DynamoObject(BaseDynamoObject):
         try:
             return dict.__getitem__(self, key)
         except:
+            if self._partial:
+                self._fill_in()
+                if dict.__contains__(self, key):
+                    return dict.__getitem__(self, key)
             if key in self._DEFAULT_ITEMS:
                 _default = self._DEFAULT_ITEMS[key]
                 return _default() if callable(_default) else _default
@@ -439,6 +1247,60 @@ class DynamoObject(BaseDynamoObject):
             # raise RuntimeError("Setting an explicit value for a meta-item ('{}') is not allowed.".format(key))
             return
         dict.__setitem__(self, key, val)
+        self._mark_changed(key)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._mark_removed(key)
+
+    def get(self, key, default=None):
+        if self._partial and key not in self:
+            self._fill_in()
+        if key in self:
+            return dict.__getitem__(self, key)
+        return default
+
+    def update(self, *args, **kwargs):
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self.get(key)
+
+    def pop(self, key, *args):
+        if key in self:
+            self._mark_removed(key)
+        return dict.pop(self, key, *args)
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self._mark_removed(key)
+        return key, value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        for key in self:
+            self._mark_removed(key)
+        dict.clear(self)
+
+    def _fill_in(self):
+        '''
+        Fetches the rest of a partial object, in a single GetItem.  Attributes it already has, or that
+        have been deleted since it was read, keep their local values.
+        '''
+        self._partial = False
+        # use_cache=False also keeps this object (which may be in the identity map) from coming straight back.
+        full = self.__class__._load(self._get_key_dict(), use_cache=False)
+        if full is None:
+            return
+        for k, v in dict.items(full):
+            if k not in self._removed_keys and not dict.__contains__(self, k):
+                dict.__setitem__(self, k, v)
 
     def _my_hash_and_range(self):
         hash_keyname, range_keyname = self.__class__._HASH_AND_RANGE_KEYS()
@@ -456,8 +1318,11 @@ class DynamoObject(BaseDynamoObject):
                 keys[k] = dictionary[k]
         return keys
 
-    def save(self, force=False, save_if_missing=True, save_if_existing=True):
-        _TRACE("DynamoObject.save reached")
+    def _presave(self):
+        # Hook for subclasses that need to fill in or validate things before anything gets written.
+        pass
+
+    def _save_condition(self, force=False, save_if_missing=True, save_if_existing=True):
         if not save_if_missing and not save_if_existing:
             raise RuntimeError("At least one of save_if_missing and save_if_existing must be true.")
 
@@ -477,43 +1342,372 @@ class DynamoObject(BaseDynamoObject):
         else:
             # If we're here, we know that create_condition=True
             CE = create_condition
+        return old_version, CE
+
+    def _register_identity(self):
+        identity = current_identity_map()
+        if identity is not None:
+            identity.add(self.__class__._identity_key(ensure_ddbsafe(self._get_key_dict())), self)
+
+    @classmethod
+    def _forget_identity(cls, key):
+        identity = current_identity_map()
+        if identity is not None:
+            identity.discard(cls._identity_key(ensure_ddbsafe(key)))
+
+    def _can_update_in_place(self):
+        if not self._in_db:
+            return False
+        # Changing the key means writing a different item entirely.
+        key_names = [k for k in self.__class__._HASH_AND_RANGE_KEYS() if k]
+        return not any(k in self._changed_keys or k in self._removed_keys for k in key_names)
+
+    def save(self, force=False, save_if_missing=True, save_if_existing=True, partial=True):
+        '''
+        Writes the object to the table, guarded by a check on its __version__.
+
+        Objects that were loaded from the table only send the attributes that were set or deleted since,
+        plus any list, dict or set attributes (which may have been changed in place), using UpdateItem,
+        unless partial=False.  New objects, or ones whose key changed, are always written
+        out in full with PutItem.  Objects read with a projection can only be saved the first way.
+        '''
+        _TRACE("DynamoObject.save reached")
+        update_in_place = partial and save_if_existing and self._can_update_in_place()
+        if self._partial and not update_in_place:
+            raise RuntimeError("Can't write out a partial object (one read with a projection) in full; reload() it first.")
+        self._presave()
+        old_version, CE = self._save_condition(force=force, save_if_missing=save_if_missing, save_if_existing=save_if_existing)
+        if update_in_place and CE is None and not self._partial:
+            # Forcing it with both flags set is an unconditional put of the whole thing, whatever's in the table.
+            update_in_place = False
         try:
             self[VERSION_KEY] = old_version + 1
-            if CE:
+            if update_in_place:
+                # A partial object that's vanished can't be written back in full.
+                self._store_changes(CE, fallback_CE=CE if save_if_missing and not self._partial else None)
+            elif CE:
                 self._store(CE)
             else:
                 self._store()
+            self._mark_clean()
+            self._register_identity()
             return self
         except ClientError as e:
             self[VERSION_KEY] = old_version
+            # Whatever's cached is probably what beat us to it, so stop trusting it.
+            self.__class__._uncache_item(self._get_key_dict())
             raise e
 
+    @classmethod
+    def _check_unique_keys(cls, objs):
+        key_tuples = set()
+        for obj in objs:
+            key_tuple = cls._key_tuple(obj)
+            if key_tuple in key_tuples:
+                raise RuntimeError("The same key appears more than once: {}".format(obj._get_key_dict()))
+            key_tuples.add(key_tuple)
+
+    @classmethod
+    def save_many(cls, objs, mode="transact", force=False, save_if_missing=True, save_if_existing=True):
+        '''
+        Saves a bunch of objects using as few round trips as possible.
+
+        mode="batch" uses BatchWriteItem, BATCH_WRITE_LIMIT items per request.  These writes are unconditional,
+        the same as save(force=True), so whatever's in the table gets overwritten.
+
+        mode="transact" uses TransactWriteItems, TRANSACT_WRITE_LIMIT items per transaction, with the same
+        __version__ conditions that save() would use.  Each transaction succeeds or fails as a whole.
+
+        Either way, each object's version is bumped when it's written and rolled back if its write fails.
+        Objects in batches that were written before a failure keep their new versions, as do the ones
+        DynamoDB did process in a batch whose retries ran out.
+
+        :param objs: Objects to save.  They must all live in this class's table.
+        :rtype: List of the saved objects.
+        '''
+        if mode not in ["batch","transact"]:
+            raise RuntimeError("Invalid save mode '{}' specified.".format(mode))
+        objs = list(objs)
+        cls._check_unique_keys(objs)
+        if any(getattr(obj, "_partial", False) for obj in objs):
+            raise RuntimeError("Can't write out partial objects (ones read with a projection) in full; reload() them first.")
+        for obj in objs:
+            obj._presave()
+        table_name = cls.TABLE_NAME()
+        limit = BATCH_WRITE_LIMIT if mode == "batch" else TRANSACT_WRITE_LIMIT
+        def finish(saved):
+            for obj, request in saved:
+                obj._mark_clean()
+                obj._register_identity()
+                cls._cache_item(request["PutRequest"]["Item"] if mode == "batch" else request["Put"]["Item"])
+
+        for i in range(0, len(objs), limit):
+            chunk = objs[i:i+limit]
+            old_versions = []
+            requests = []
+            # What the last batch response left unprocessed; None until one comes back.
+            unprocessed = None
+            try:
+                for obj in chunk:
+                    if mode == "batch":
+                        old_version, CE = obj._save_condition(force=True)
+                    else:
+                        old_version, CE = obj._save_condition(force=force, save_if_missing=save_if_missing, save_if_existing=save_if_existing)
+                    old_versions.append(old_version)
+                    obj[VERSION_KEY] = old_version + 1
+                    put = {"Item": obj._item_to_store()}
+                    if mode == "batch":
+                        requests.append({"PutRequest": put})
+                    else:
+                        put["TableName"] = table_name
+                        if CE:
+                            put.update(_build_condition(CE))
+                        requests.append({"Put": put})
+                if mode == "batch":
+                    for response in _batch_with_retries(cls.TABLE().batch_write_item, {table_name: requests}, "UnprocessedItems"):
+                        unprocessed = response.get("UnprocessedItems", {}).get(table_name, [])
+                else:
+                    cls.TABLE().transact_write_items(TransactItems=requests)
+            except Exception as e:
+                saved = []
+                if unprocessed is not None:
+                    # The retries gave up, but everything except what was still unprocessed did get written.
+                    left = {cls._key_tuple(request["PutRequest"]["Item"]) for request in unprocessed}
+                    saved = [(obj, request) for obj, request in zip(chunk, requests) if cls._key_tuple(request["PutRequest"]["Item"]) not in left]
+                saved_ids = {id(obj) for obj, _ in saved}
+                for obj, old_version in zip(chunk, old_versions):
+                    if id(obj) not in saved_ids:
+                        obj[VERSION_KEY] = old_version
+                finish(saved)
+                raise e
+            finish(zip(chunk, requests))
+        return objs
+
+    @classmethod
+    def delete_many(cls, objs):
+        '''
+        Deletes a bunch of objects using BatchWriteItem, BATCH_WRITE_LIMIT per request.
+        Like delete() without a condition, this is unconditional.
+
+        :param objs: Objects (or key dicts) to delete.
+        '''
+        objs = list(objs)
+        cls._check_unique_keys(objs)
+        table_name = cls.TABLE_NAME()
+        hashname, rangename = cls._HASH_AND_RANGE_KEYS()
+        for i in range(0, len(objs), BATCH_WRITE_LIMIT):
+            requests = [{"DeleteRequest": {"Key": ensure_ddbsafe({k:obj[k] for k in (hashname, rangename) if k})}} for obj in objs[i:i+BATCH_WRITE_LIMIT]]
+            for response in _batch_with_retries(cls.TABLE().batch_write_item, {table_name: requests}, "UnprocessedItems"):
+                pass
+            for request in requests:
+                cls._uncache_item(request["DeleteRequest"]["Key"])
+                cls._forget_identity(request["DeleteRequest"]["Key"])
+
+    @classmethod
+    def _import_item(cls, record):
+        obj = cls.objectify(record)
+        obj._presave()
+        # Items coming back from an export keep their versions, anything else starts out as a first save would.
+        if VERSION_KEY not in obj:
+            obj[VERSION_KEY] = 0
+        item = obj._item_to_store()
+        return cls._key_tuple(item), item
+
+    @classmethod
+    def _import_batch(cls, items):
+        table_name = cls.TABLE_NAME()
+        capacity = 0.0
+        for response in _batch_with_retries(cls.TABLE().batch_write_item, {table_name: [{"PutRequest": {"Item": item}} for item in items]}, "UnprocessedItems"):
+            capacity += consumed_capacity_units(response)
+        for item in items:
+            cls._uncache_item(item)
+            cls._forget_identity(item)
+        return capacity
+
+    @classmethod
+    def import_table(cls, path, Format=None, Workers=4, CheckpointPath=None, DeadLetterPath=None, ProgressCallback=None):
+        '''
+        Loads every record in an NDJSON or CSV file (gzipped if it ends in .gz) into the table, using
+        BatchWriteItem on Workers threads.  Each record goes through objectify(), _presave() (so
+        StructuredObject generators and validators apply) and the same conversion save() does.
+        Like save_many(mode="batch"), the writes are unconditional, and since batches are written in parallel,
+        there's no telling which copy wins if the file has the same key more than once.
+
+        Records that can't be converted or written are appended to a dead-letter file (path + ".rejects.ndjson"
+        by default), and progress is checkpointed by byte offset (path + ".checkpoint.json" by default), so
+        running the same import again resumes it.  ProgressCallback, if given, gets the running totals.
+        Files from export_table can be imported directly, though sets and binary values come back as lists
+        and base64 strings.  See sneks.ddb.bulk for the details.
+        '''
+        return bulk.import_records(path, cls._import_item, cls._import_batch, batch_size=BATCH_WRITE_LIMIT, Format=Format, Workers=Workers, CheckpointPath=CheckpointPath, DeadLetterPath=DeadLetterPath, ProgressCallback=ProgressCallback)
+
     def modify(self, force=False):
         return self.save(force=force, save_if_existing=True, save_if_missing=False)
 
     def create(self, force=False):
         return self.save(force=force, save_if_existing=False, save_if_missing=True)
 
-    def _store(self, CE=None):
-        _TRACE("DynamoObject._store reached")
-        dict_to_save = copy.deepcopy(self)
+    def _check_required(self):
         required = self._get_required_attributes()
-        missing = [r for r in required if not dict_to_save.get(r, None)]
+        missing = [r for r in required if not dict.get(self, r, None)]
         if missing:
             raise RuntimeError('The following attributes are missing and must be added before saving: '+', '.join(missing))
-        dict_to_save = ensure_ddbsafe(dict_to_save)
+
+    def _item_to_store(self):
+        self._check_required()
+        # This builds a brand new structure, so there's no need to copy first.
+        return self._encode_item(self)
+
+    def _changed_attributes(self):
+        # Lists, dicts and sets can be changed in place through any number of routes (values(), items(),
+        # a reference kept from earlier...) without going through __setitem__, so they're always sent.
+        containers = {k for k, v in dict.items(self) if isinstance(v, (dict, list, set))}
+        return sorted((self._changed_keys | containers) & set(dict.keys(self)))
+
+    def _update_params(self):
+        changed = self._changed_attributes()
+        removed = sorted(k for k in self._removed_keys if k not in self)
+        values = self._encode_item({k:dict.__getitem__(self, k) for k in changed})
+        # Placeholders use their own prefix so they can't collide with the ones boto3 generates for the condition.
+        names = {}
+        attribute_values = {}
+        sets = []
+        removes = []
+        for i, k in enumerate(changed):
+            names["#u{}".format(i)] = k
+            attribute_values[":u{}".format(i)] = values[k]
+            sets.append("#u{i} = :u{i}".format(i=i))
+        for i, k in enumerate(removed, len(changed)):
+            names["#u{}".format(i)] = k
+            removes.append("#u{}".format(i))
+        expression = "SET " + ", ".join(sets)
+        if removes:
+            expression += " REMOVE " + ", ".join(removes)
+        return {
+            "UpdateExpression": expression,
+            "ExpressionAttributeNames": names,
+            "ExpressionAttributeValues": attribute_values
+        }
+
+    def _store_changes(self, CE=None, fallback_CE=None):
+        '''
+        Sends only the changed attributes with UpdateItem, under the same condition save() would put the item with,
+        plus the item having to exist (updating one that doesn't would leave behind just the changed attributes).
+        If the item turns out not to exist at all and fallback_CE is given, falls back to writing it out in full.
+        '''
+        _TRACE("DynamoObject._store_changes reached")
+        self._check_required()
+        hashname, _ = self.__class__._HASH_AND_RANGE_KEYS()
+        CE = Attr(hashname).exists() & CE if CE else Attr(hashname).exists()
+        try:
+            self.__class__.TABLE().update_item(
+                Key=ensure_ddbsafe(self._get_key_dict()),
+                ConditionExpression=CE,
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
+                **self._update_params()
+            )
+        except ClientError as e:
+            missing = e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException" and not e.response.get("Item")
+            if not (missing and fallback_CE):
+                raise e
+            _TRACE("Item no longer exists, so writing it out in full.")
+            self._store(fallback_CE)
+            return self
+        # Only part of the item was sent, so there's nothing complete to refresh the cache with.
+        self.__class__._uncache_item(self._get_key_dict())
+        _TRACE("DynamoObject._store_changes returning")
+        return self
+
+    def _store(self, CE=None):
+        _TRACE("DynamoObject._store reached")
+        dict_to_save = self._item_to_store()
         if CE:
             self.__class__.TABLE().put_item(Item=dict_to_save, ConditionExpression=CE)
         else:
             self.__class__.TABLE().put_item(Item=dict_to_save)
+        self.__class__._cache_item(dict_to_save)
         _TRACE("DynamoObject._store returning")
         return self
 
     def delete(self, CE=None):
         if CE:
-            return self.__class__.TABLE().delete_item(Key=self._get_key_dict(), ConditionExpression=CE)
+            response = self.__class__.TABLE().delete_item(Key=ensure_ddbsafe(self._get_key_dict()), ConditionExpression=CE)
         else:
-            return self.__class__.TABLE().delete_item(Key=self._get_key_dict())
+            response = self.__class__.TABLE().delete_item(Key=ensure_ddbsafe(self._get_key_dict()))
+        self.__class__._uncache_item(self._get_key_dict())
+        self.__class__._forget_identity(self._get_key_dict())
+        # Saving it again has to write the whole thing back.
+        self._in_db = False
+        return response
+
+    @classmethod
+    def _atomic_update(cls, obj, Key, attr, expression, values):
+        '''
+        Applies expression to one attribute in a single UpdateItem, bumping the version along with it,
+        without reading the item first or checking the version.  The item has to exist already.
+        #a is attr, and values are the expression's :placeholders.  If obj is given, the attribute's new value
+        gets merged into it without marking it as changed.  Returns the attribute's new value.
+
+        The object's __version__ is deliberately left alone: the object hasn't seen whatever else may have
+        been written since it was read, so a later save() has to fail the version check rather than quietly
+        write back stale attributes.  reload() it first to save it again.
+        '''
+        if obj is None and Key is None:
+            raise RuntimeError("A key is needed when this is called on the class.")
+        key = ensure_ddbsafe(Key if Key is not None else obj._get_key_dict())
+        hashname, _ = cls._HASH_AND_RANGE_KEYS()
+        attribute_values = cls._encode_item(values)
+        attribute_values[":one"] = 1
+        response = cls.TABLE().update_item(
+            Key=key,
+            UpdateExpression=expression,
+            ConditionExpression="attribute_exists(#k)",
+            ExpressionAttributeNames={"#a": attr, "#v": VERSION_KEY, "#k": hashname},
+            ExpressionAttributeValues=attribute_values,
+            ReturnValues="UPDATED_NEW"
+        )
+        attributes = cls._decode_item(response.get("Attributes", {}))
+        cls._uncache_item(key)
+        if obj is not None and attr in attributes:
+            dict.__setitem__(obj, attr, attributes[attr])
+            obj._changed_keys.discard(attr)
+            obj._removed_keys.discard(attr)
+        return attributes.get(attr)
+
+    @_hybridmethod
+    def increment(cls, obj, attr, n=1, Key=None):
+        '''
+        Adds n to a number attribute (which starts at 0 if it isn't there yet), and returns the new value.
+        Call it on an object, or on the class with Key={...}.  Like the other in-place updates (append,
+        add_to_set and set_if_absent), it's one UpdateItem that doesn't check the version, so concurrent
+        calls never conflict with each other, and the result is merged into the object without marking it changed.
+        The object keeps its old version, so it has to be reloaded before it can be saved again.
+        '''
+        return cls._atomic_update(obj, Key, attr, "ADD #a :n, #v :one", {":n": n})
+
+    @_hybridmethod
+    def append(cls, obj, attr, values, Key=None):
+        '''
+        Appends values to the end of a list attribute (creating it if need be), and returns the new list.
+        '''
+        return cls._atomic_update(obj, Key, attr, "SET #a = list_append(if_not_exists(#a, :empty), :values) ADD #v :one", {":values": list(values), ":empty": []})
+
+    @_hybridmethod
+    def add_to_set(cls, obj, attr, values, Key=None):
+        '''
+        Adds values to a set attribute (creating it if need be), and returns the new set.
+        '''
+        values = set(values)
+        if not values:
+            raise RuntimeError("DynamoDB doesn't allow empty sets, so there has to be at least one value to add.")
+        return cls._atomic_update(obj, Key, attr, "ADD #a :values, #v :one", {":values": values})
+
+    @_hybridmethod
+    def set_if_absent(cls, obj, attr, value, Key=None):
+        '''
+        Sets an attribute only if it isn't there already, and returns whichever value it ends up with.
+        '''
+        return cls._atomic_update(obj, Key, attr, "SET #a = if_not_exists(#a, :value) ADD #v :one", {":value": value})
 
     # def load(self):
     #     new_me = self.__class__.TABLE().get_item(Key=self._get_key_dict()).get("Item", {})
@@ -523,11 +1717,13 @@ class DynamoObject(BaseDynamoObject):
         '''
         Reloads the item's attributes from DynamoDB, replacing whatever's currently in the object.
         '''
-        new_me = self.load()
-        for k in list(self.keys()):
-            if k not in new_me:
-                del self[k]
-        self.update(new_me)
+        new_me = self._load(self._get_key_dict(), use_cache=False)
+        if new_me is None:
+            raise RuntimeError("Item {} no longer exists.".format(self._get_key_dict()))
+        dict.clear(self)
+        dict.update(self, new_me)
+        self._mark_clean()
+        self._partial = False
         return self
 
 class CFObject(DynamoObject):
@@ -603,6 +1799,8 @@ class CFObject(DynamoObject):
     def _clear_cf_cache(cls):
         setattr(cls, "_CF_TEMPLATE", None)
         setattr(cls, "_CF_RESOURCES", {})
+        setattr(cls, "_SCHEMA_CACHE", None)
+        setattr(cls, "_KEY_METADATA", None)
 
     @classmethod
     def _SCHEMA(cls):
@@ -638,6 +1836,19 @@ class CFObject(DynamoObject):
             _CLASSNAME = cls.CLASS_NAME()
         return LazyObject
 
+def table_object_class(table_name):
+    '''
+    Returns a DynamoObject class for an existing table, with the schema read from DescribeTable.
+    Handy for scripts that just need to move items in or out of a table that isn't modelled anywhere.
+    '''
+    class TableObject(DynamoObject):
+        _CLASSNAME = "table:" + table_name
+
+        @classmethod
+        def _SCHEMA(cls):
+            return ddb_backend().meta.client.describe_table(TableName=table_name)["Table"]
+    return TableObject
+
 class DataField(object):
     def __init__(self, key, **kwargs):
         self.key = key
@@ -695,6 +1906,32 @@ class DataField(object):
 class StructuredObject(DynamoObject):
     _HIDDEN_KEYS = [VERSION_KEY]
     _DATA_FIELDS = []
+    _FIELD_CODEC = None
+
+    @classmethod
+    def _field_codec(cls):
+        '''
+        The item conversion for this class's _DATA_FIELDS, compiled the first time it's needed.
+        Kept per class (not inherited), the same as KEY_METADATA.
+        '''
+        codec = cls.__dict__.get("_FIELD_CODEC")
+        if codec is None:
+            codec = _FieldCodec(cls._DATA_FIELDS)
+            cls._FIELD_CODEC = codec
+        return codec
+
+    @classmethod
+    def _decode_item(cls, item):
+        # Without any declared fields there's nothing to go on, so fall back to converting everything.
+        if not cls._DATA_FIELDS:
+            return super()._decode_item(item)
+        return cls._field_codec().decode(item)
+
+    @classmethod
+    def _encode_item(cls, item):
+        if not cls._DATA_FIELDS:
+            return super()._encode_item(item)
+        return cls._field_codec().encode(item)
 
     @classmethod
     def skema(cls):
@@ -718,7 +1955,7 @@ class StructuredObject(DynamoObject):
         obj = {k:skeme(k).preprocessor(raw_obj[k]) for k in raw_obj}
         return cls(obj)
 
-    def save(self, *args, **kwargs):
+    def _presave(self):
         for k in self.all_keys():
             skeme = self.skeme(k)
             if skeme.value_generator and not self.get(k):
@@ -726,7 +1963,7 @@ class StructuredObject(DynamoObject):
             v = self.get(k)
             if not skeme.validator(v):
                 raise RuntimeError('Invalid value provided for key "{}"!'.format(k))
-        return super().save(*args, **kwargs)
+        super()._presave()
 
     def data_form(self, immutable=False):
         keys = self.skema_keys()
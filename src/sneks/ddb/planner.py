@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+'''
+Picks how to run a search given as plain attribute conditions, like find(email="x", status="active"):
+a query on the table or whichever index has a key matching the conditions, or a filtered scan if none does.
+
+A condition is either a value (equality) or a list of a boto3 condition method name and its arguments,
+the same as RangeKey takes elsewhere: created=["between", a, b], name=["begins_with", "sn"].
+Anything that isn't part of the chosen key becomes part of the FilterExpression.  A search that says
+for itself how it runs (HashKey, RangeKey or KeyConditionExpression for a query, or Segment and
+TotalSegments for one segment of a scan) is run that way, with every condition going into the filter.
+
+Candidates are ranked by how much of their key the conditions cover (hash and range beats hash alone),
+then the table before indexes (it has every attribute and allows consistent reads), then indexes that
+project every attribute before those that don't.  An index can't be used if it doesn't project every
+attribute the filter needs, and global indexes can't be used with ConsistentRead.
+'''
+
+from boto3.dynamodb.conditions import Attr, Key
+
+# Condition methods a key condition can use; "eq" is the only one allowed on a hash key.
+KEY_OPERATORS = ["eq", "lt", "lte", "gt", "gte", "between", "begins_with"]
+FILTER_OPERATORS = KEY_OPERATORS + ["ne", "is_in", "contains", "exists", "not_exists", "attribute_type", "size"]
+
+# Keyword arguments to search functions that aren't attribute conditions.
+SEARCH_PARAMS = {
+    "IndexName", "Select", "Limit", "ConsistentRead", "ScanIndexForward", "ExclusiveStartKey", "ReturnConsumedCapacity",
+    "ProjectionExpression", "FilterExpression", "ExpressionAttributeNames", "ExpressionAttributeValues", "AttributesToGet",
+    "MaxResults", "PageSize", "NextToken", "ShufflePages", "Projection", "Prefetch", "Segments", "Workers", "ProgressCallback",
+    "HashKey", "RangeKey", "KeyConditionExpression", "Segment", "TotalSegments",
+}
+# Parameters that already decide the operation: a key condition makes it a query, a scan segment a scan.
+QUERY_PARAMS = ("HashKey", "RangeKey", "KeyConditionExpression")
+SCAN_PARAMS = ("Segment", "TotalSegments")
+
+def split_conditions(kwargs):
+    '''
+    Splits search kwargs into attribute conditions and everything else.
+
+    :rtype: (conditions, params)
+    '''
+    conditions = {}
+    params = {}
+    for k, v in kwargs.items():
+        if k in SEARCH_PARAMS:
+            params[k] = v
+        else:
+            conditions[k] = v
+    return conditions, params
+
+def parse_condition(value):
+    '''
+    :rtype: (operator, args)
+    '''
+    if isinstance(value, (list, tuple)) and value and isinstance(value[0], str) and value[0] in FILTER_OPERATORS:
+        return value[0], tuple(value[1:])
+    return "eq", (value,)
+
+def _describe(name, operator, args):
+    return "{} {}".format(name, operator) if operator in ("exists", "not_exists") else "{} {} {}".format(name, operator, ", ".join(repr(a) for a in args))
+
+class Candidate(object):
+    def __init__(self, index_name, hash, range, kind=None, projection="ALL", projected=None):
+        self.index_name = index_name
+        self.hash = hash
+        self.range = range
+        self.kind = kind
+        self.projection = projection
+        # Every attribute the index has, or None if it has them all.
+        self.projected = projected
+
+    def label(self):
+        return self.index_name or "table"
+
+    def assess(self, conditions, consistent_read=False):
+        '''
+        Returns (rank, reason), where rank is None if this candidate can't serve the search.
+        '''
+        if self.kind == "GSI" and consistent_read:
+            return None, "global indexes don't support ConsistentRead"
+        if self.hash not in conditions:
+            return None, "no condition on hash key '{}'".format(self.hash)
+        if conditions[self.hash][0] != "eq":
+            return None, "hash key '{}' needs an equality condition".format(self.hash)
+        range_used = bool(self.range and self.range in conditions and conditions[self.range][0] in KEY_OPERATORS)
+        if self.projected is not None:
+            missing = sorted(name for name in conditions if name not in self.projected)
+            if missing:
+                return None, "doesn't project {}".format(", ".join(missing))
+        rank = (1 if range_used else 0, 1 if self.index_name is None else 0, 1 if self.projection == "ALL" else 0)
+        if range_used:
+            reason = "hash key '{}' and range key '{}' both have conditions".format(self.hash, self.range)
+        else:
+            reason = "hash key '{}' has an equality condition".format(self.hash)
+        return rank, reason
+
+def candidates(metadata, schema):
+    '''
+    The table and each of its indexes, from a KeyMetadata and the schema it came from.
+    '''
+    table_keys = {metadata.hash, metadata.range} - {None}
+    result = [Candidate(None, metadata.hash, metadata.range)]
+    for listname in ("GlobalSecondaryIndexes", "LocalSecondaryIndexes"):
+        for index in schema.get(listname, []):
+            name = index["IndexName"]
+            keys = metadata.indexes[name]
+            projected = None
+            if keys.projection != "ALL":
+                projected = table_keys | ({keys.hash, keys.range} - {None})
+                if keys.projection == "INCLUDE":
+                    projected |= set(index.get("Projection", {}).get("NonKeyAttributes", []))
+            result.append(Candidate(name, keys.hash, keys.range, kind=keys.kind, projection=keys.projection, projected=projected))
+    return result
+
+def _and(conditions):
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+def plan(table_name, metadata, schema, kwargs):
+    '''
+    Works out how to run a search.
+
+    :param kwargs: Attribute conditions mixed with ordinary search parameters (see SEARCH_PARAMS).
+    :rtype: dict with Operation ("query" or "scan"), Params (to pass to query/scan), and what explain() shows.
+    '''
+    raw_conditions, params = split_conditions(kwargs)
+    conditions = {name: parse_condition(value) for name, value in raw_conditions.items()}
+    considered = []
+    best = None
+    given = [k for k in QUERY_PARAMS + SCAN_PARAMS if k in params]
+    if given:
+        # Every condition just goes into the filter of the search the caller spelled out.
+        considered.append({"Index": params.get("IndexName") or "table", "Usable": True, "Reason": "{} given".format(", ".join(given))})
+    for candidate in ([] if given else candidates(metadata, schema)):
+        if params.get("IndexName") and candidate.index_name != params["IndexName"]:
+            continue
+        rank, reason = candidate.assess(conditions, consistent_read=params.get("ConsistentRead", False))
+        considered.append({"Index": candidate.label(), "Usable": rank is not None, "Reason": reason})
+        if rank is not None and (best is None or rank > best[0]):
+            best = (rank, candidate)
+
+    key_conditions = []
+    filter_conditions = []
+    key_names = set()
+    if best:
+        candidate = best[1]
+        key_names = {candidate.hash}
+        if best[0][0]:
+            key_names.add(candidate.range)
+    for name, (operator, args) in conditions.items():
+        if name in key_names:
+            key_conditions.append((name, operator, args, getattr(Key(name), operator)(*args)))
+        else:
+            filter_conditions.append((name, operator, args, getattr(Attr(name), operator)(*args)))
+
+    filters = [c[3] for c in filter_conditions]
+    if params.get("FilterExpression") is not None:
+        filters.insert(0, params["FilterExpression"])
+    if filters:
+        params["FilterExpression"] = _and(filters)
+    if best:
+        operation = "query"
+        params["KeyConditionExpression"] = _and(c[3] for c in key_conditions)
+        if best[1].index_name:
+            params["IndexName"] = best[1].index_name
+    elif given:
+        operation = "query" if any(k in params for k in QUERY_PARAMS) else "scan"
+    else:
+        operation = "scan"
+    return {
+        "Operation": operation,
+        "TableName": table_name,
+        "IndexName": best[1].index_name if best else params.get("IndexName"),
+        "KeyConditions": [_describe(*c[:3]) for c in key_conditions],
+        "FilterConditions": [_describe(*c[:3]) for c in filter_conditions],
+        "Candidates": considered,
+        "Params": params,
+    }
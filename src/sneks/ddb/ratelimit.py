@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+'''
+Client-side throughput limiting for DynamoDB tables.
+
+Call configure() with a table's read/write capacity budget (in capacity units per second), and every
+call SamTable makes against that table will draw from a token bucket shared by all threads in the process.
+Since the cost of a call isn't known until DynamoDB reports its ConsumedCapacity, each call reserves
+a running estimate up front and the difference gets settled once the response comes back.
+Budgets are compared against the total reported CapacityUnits, so they should cover any indexes too.
+
+Throttling errors get retried with jittered exponential backoff whether or not a budget is configured,
+and each one is counted in sneks.ddb.metrics.REGISTRY.  Calls that fail get their reservation back.
+'''
+
+import random
+import threading
+import time
+
+THROTTLE_ERROR_CODES = ("ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded")
+THROTTLE_MAX_ATTEMPTS = 8
+THROTTLE_BACKOFF_BASE = 0.05
+THROTTLE_BACKOFF_CAP = 20.0
+
+# How quickly the per-call cost estimate follows what DynamoDB actually reports.
+ESTIMATE_WEIGHT = 0.2
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+class TokenBucket(object):
+    '''
+    A token bucket that can go into debt: reserve() always succeeds, and returns how long
+    the caller should sleep before the request it's paying for would be within the rate.
+    '''
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, units):
+        with self.lock:
+            self._refill()
+            self.tokens -= units
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def adjust(self, units):
+        # Positive units charge the bucket more, negative units refund it.
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - units)
+
+    def drain(self):
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0)
+
+class TableLimiter(object):
+    def __init__(self, table_name, read_capacity=None, write_capacity=None, burst_seconds=1.0, clock=time.monotonic):
+        self.table_name = table_name
+        self.buckets = {}
+        if read_capacity:
+            self.buckets["READ"] = TokenBucket(read_capacity, read_capacity * burst_seconds, clock=clock)
+        if write_capacity:
+            self.buckets["WRITE"] = TokenBucket(write_capacity, write_capacity * burst_seconds, clock=clock)
+        self.estimates = {"READ": 1.0, "WRITE": 1.0}
+        self.counters = {"Calls": 0, "Throttles": 0, "SecondsWaited": 0.0}
+        self.lock = threading.Lock()
+
+    def acquire(self, kind):
+        '''
+        Blocks until a call of this kind ("READ" or "WRITE") fits in the budget,
+        and returns the number of units reserved for it.
+        '''
+        bucket = self.buckets.get(kind)
+        if not bucket:
+            return 0
+        units = self.estimates[kind]
+        wait = bucket.reserve(units)
+        with self.lock:
+            self.counters["Calls"] += 1
+            self.counters["SecondsWaited"] += wait
+        if wait > 0:
+            time.sleep(wait)
+        return units
+
+    def settle(self, kind, reserved, consumed):
+        # consumed is None when the response didn't say.
+        bucket = self.buckets.get(kind)
+        if not bucket or consumed is None:
+            return
+        bucket.adjust(consumed - reserved)
+        with self.lock:
+            self.estimates[kind] += ESTIMATE_WEIGHT * (consumed - self.estimates[kind])
+
+    def refund(self, kind, reserved):
+        # For calls that failed without saying what they cost, which mustn't skew the estimate.
+        bucket = self.buckets.get(kind)
+        if bucket:
+            bucket.adjust(-reserved)
+
+    def throttled(self, kind):
+        # DynamoDB disagrees with us about how much room there is, so stop bursting.
+        bucket = self.buckets.get(kind)
+        if bucket:
+            bucket.drain()
+        with self.lock:
+            self.counters["Throttles"] += 1
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["EstimatedUnitsPerCall"] = dict(self.estimates)
+        stats["Budget"] = {kind: bucket.rate for kind, bucket in self.buckets.items()}
+        return stats
+
+def configure(table_name, read_capacity=None, write_capacity=None, burst_seconds=1.0):
+    '''
+    Limits calls against table_name to read_capacity RCU/s and write_capacity WCU/s (either may be None
+    for no limit), allowing bursts of up to burst_seconds worth of budget.  Replaces any earlier limiter.
+    '''
+    limiter = TableLimiter(table_name, read_capacity=read_capacity, write_capacity=write_capacity, burst_seconds=burst_seconds)
+    with _LIMITERS_LOCK:
+        _LIMITERS[table_name] = limiter
+    return limiter
+
+def remove(table_name):
+    with _LIMITERS_LOCK:
+        _LIMITERS.pop(table_name, None)
+
+def limiter_for(table_name):
+    return _LIMITERS.get(table_name)
+
+def stats():
+    with _LIMITERS_LOCK:
+        limiters = dict(_LIMITERS)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
+
+def is_throttle(error):
+    response = getattr(error, "response", None) or {}
+    return response.get("Error", {}).get("Code") in THROTTLE_ERROR_CODES
+
+def backoff(attempt):
+    # "Full jitter", so a pile of throttled threads don't all come back at the same moment.
+    time.sleep(random.uniform(0, min(THROTTLE_BACKOFF_CAP, THROTTLE_BACKOFF_BASE * 2**attempt)))
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+import collections
+
+# Everything the ORMs need to know about a table's keys, worked out once per class from its schema.
+KeyMetadata = collections.namedtuple("KeyMetadata", ["hash", "range", "attribute_types", "required", "indexes"])
+
+# kind is "GSI" or "LSI"; projection is the index's ProjectionType.
+IndexKeys = collections.namedtuple("IndexKeys", ["hash", "range", "kind", "projection"])
+
+def _hash_and_range(key_schema):
+    hash = [h['AttributeName'] for h in key_schema if h['KeyType']=='HASH'][0]
+    ranges = [r['AttributeName'] for r in key_schema if r['KeyType']=='RANGE']
+    range = ranges[0] if ranges else None
+    return hash, range
+
+def key_metadata(schema, required_attrs=()):
+    '''
+    Resolves the key names for a table and each of its indexes.
+
+    :param schema: A dict in the form client.create_table(**schema) takes.
+    :param required_attrs: Extra attributes (beyond the table's keys) that must be present to save an item.
+    :rtype: KeyMetadata
+    '''
+    hash, range = _hash_and_range(schema['KeySchema'])
+    attribute_types = {a['AttributeName']:a['AttributeType'] for a in schema.get('AttributeDefinitions', [])}
+    indexes = {}
+    for kind, listname in [("GSI", "GlobalSecondaryIndexes"), ("LSI", "LocalSecondaryIndexes")]:
+        for index in schema.get(listname, []):
+            index_hash, index_range = _hash_and_range(index['KeySchema'])
+            projection = index.get('Projection', {}).get('ProjectionType', 'ALL')
+            indexes[index['IndexName']] = IndexKeys(index_hash, index_range, kind, projection)
+    required = tuple([k for k in (hash, range) if k] + list(required_attrs))
+    return KeyMetadata(hash, range, attribute_types, required, indexes)
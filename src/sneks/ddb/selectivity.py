@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+'''
+Learns how selective each search's filter is (Count / ScannedCount, as an exponentially weighted average),
+so that a search asking for MaxResults items can set a Limit likely to get them in about one round trip.
+
+Searches are grouped by shape: the table, the index, and the structure of the FilterExpression with
+its values left out, so "status = 'x'" and "status = 'y'" learn together.
+TRACKER.snapshot() shows what's been learned so far.
+'''
+
+from boto3.dynamodb.conditions import AttributeBase, ConditionBase
+import math
+import threading
+
+# Used until a shape has been seen at least once.
+DEFAULT_LIMIT_FACTOR = 5
+# Extra room on top of the learned ratio, since it's only an estimate.
+LIMIT_HEADROOM = 1.25
+# Never assume fewer than this fraction of scanned items will match.
+MIN_RATIO = 0.01
+
+def _condition_shape(value):
+    if isinstance(value, ConditionBase):
+        expr = value.get_expression()
+        return "{}({})".format(expr["operator"], ",".join(_condition_shape(v) for v in expr["values"]))
+    if isinstance(value, AttributeBase):
+        return value.name
+    return "?"
+
+def filter_shape(expression):
+    '''
+    The structure of a FilterExpression without its values, as a string.
+    String expressions already keep their values in ExpressionAttributeValues, so they're used as-is.
+    '''
+    if expression is None or isinstance(expression, str):
+        return expression
+    return _condition_shape(expression)
+
+def search_shape(table_name, params):
+    return (table_name, params.get("IndexName"), filter_shape(params.get("FilterExpression")))
+
+class SelectivityTracker(object):
+    def __init__(self, weight=0.3):
+        self.weight = weight
+        self.shapes = {}
+        self.lock = threading.Lock()
+
+    def observe(self, shape, count, scanned_count):
+        if not scanned_count:
+            return
+        ratio = float(count) / scanned_count
+        with self.lock:
+            stats = self.shapes.get(shape)
+            if stats is None:
+                self.shapes[shape] = {"Ratio": ratio, "Pages": 1, "Count": count, "ScannedCount": scanned_count}
+                return
+            stats["Ratio"] += self.weight * (ratio - stats["Ratio"])
+            stats["Pages"] += 1
+            stats["Count"] += count
+            stats["ScannedCount"] += scanned_count
+
+    def ratio(self, shape):
+        if shape[2] is None:
+            # Without a filter, everything scanned comes back.
+            return 1.0
+        stats = self.shapes.get(shape)
+        return stats["Ratio"] if stats else None
+
+    def limit_for(self, shape, max_results):
+        ratio = self.ratio(shape)
+        if ratio is None:
+            return DEFAULT_LIMIT_FACTOR * max_results
+        if ratio >= 1:
+            return max_results
+        return int(math.ceil(max_results * LIMIT_HEADROOM / max(ratio, MIN_RATIO)))
+
+    def snapshot(self):
+        with self.lock:
+            return {"|".join(str(part or "") for part in shape): dict(stats) for shape, stats in self.shapes.items()}
+
+    def reset(self):
+        with self.lock:
+            self.shapes.clear()
+
+TRACKER = SelectivityTracker()
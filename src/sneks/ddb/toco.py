@@ -14,6 +14,10 @@ import logging
 import os
 import traceback
 
+from sneks.ddb import nexttoken
+from sneks.ddb.schema import key_metadata
+from sneks.ddb.identity import current_identity_map, returns_whole_items
+
 VERSION_KEY = 'version_toco_'
 
 JSON_CLASS = '_class_toco'
@@ -170,6 +174,9 @@ class BaseTocoObject(object):
     """
     _SCHEMA_CACHE = None
     _TABLE_CACHE = None
+    _KEY_METADATA = None
+    # Set this to sign NextTokens, so callers can't hand back a key they made up themselves.
+    _NEXTTOKEN_SECRET = None
     _CLASSNAME = None
     _REQUIRED_ATTRS = []
     _COMPOUND_ATTRS = {}
@@ -184,36 +191,41 @@ class BaseTocoObject(object):
 
     @classmethod
     def _encode_nexttoken(cls, key):
-        # TODO: replace the json step with something that'll work for any input
-        # Convert to a string
-        # This won't work for a lot of valid keys due to the json serialization step
-        key = json.dumps(key)
-        # base64 encode it to make it safer to handle
-        key = base64.urlsafe_b64encode(key.encode("utf-8")).decode("utf-8")
-        # strip the padding, as we can easily re-add it later
-        key = key.replace("=","")
-        return key
+        return nexttoken.encode(key, secret=cls._NEXTTOKEN_SECRET)
 
     @classmethod
     def _decode_nexttoken(cls, key):
-        # TODO: replace the json step with something that'll work for any input
-        # re-add the padding
-        key = key + "=" * ((-1*len(key))%16)
-        # convert if back from base64-encoded bytes to the underlying string
-        key = base64.urlsafe_b64decode(key.encode("utf-8")).decode("utf-8")
-        # load the string back into a dict
-        # This won't work for a lot of valid keys due to the json serialization step
-        key = json.loads(key)
-        return key
-
-    @classmethod
-    def _parse_items(cls, response):
+        return nexttoken.decode(key, secret=cls._NEXTTOKEN_SECRET)
+
+    @classmethod
+    def _key_tuple(cls, d):
+        hashname, rangename = cls._HASH_AND_RANGE_KEYS()
+        return (d.get(hashname), d.get(rangename) if rangename else None)
+
+    @classmethod
+    def _identity_key(cls, key):
+        return (cls.CLASS_NAME(), cls.TABLE_NAME()) + cls._key_tuple(key)
+
+    @classmethod
+    def _materialize(cls, item, register=True):
+        identity = current_identity_map()
+        if identity is not None:
+            obj = identity.get(cls._identity_key(item))
+            if obj is not None:
+                return obj
+        params = dict(item)
+        params["_in_db"] = True
+        params["_attempt_load"] = False
+        obj = cls(**params)
+        if identity is not None and register:
+            obj = identity.add(cls._identity_key(item), obj)
+        return obj
+
+    @classmethod
+    def _parse_items(cls, response, register=True):
         items = []
         for item in response.get("Items",[]):
-            params = dict(item)
-            params["_in_db"] = True
-            params["_attempt_load"] = False
-            items.append(cls(**params))
+            items.append(cls._materialize(item, register=register))
         return items
 
     @classmethod
@@ -250,9 +262,9 @@ class BaseTocoObject(object):
         return params
 
     @classmethod
-    def _postprocess_search_results(cls, results):
+    def _postprocess_search_results(cls, results, register=True):
         response = {
-            "Items":cls._parse_items(results),
+            "Items":cls._parse_items(results, register=register),
             "NextToken":None,
             "RawResponse":results
         }
@@ -264,18 +276,27 @@ class BaseTocoObject(object):
     def scan(cls, **kwargs):
         params = cls._preprocess_search_params(**kwargs)
         results = cls.TABLE().scan(**params)
-        return cls._postprocess_search_results(results)
+        return cls._postprocess_search_results(results, register=returns_whole_items(params))
 
     @classmethod
     def query(cls, **kwargs):
         params = cls._preprocess_search_params(**kwargs)
         results = cls.TABLE().query(**params)
-        return cls._postprocess_search_results(results)
+        return cls._postprocess_search_results(results, register=returns_whole_items(params))
 
     @classmethod
     def load(cls, **kwargs):
+        identity = current_identity_map()
+        if identity is not None:
+            obj = identity.get(cls._identity_key(kwargs))
+            if obj is not None:
+                # Anything beyond the key gets applied the same way the constructor would.
+                obj._update_attrs_changed(**kwargs)
+                return obj
         obj = cls(_attempt_load=True, **kwargs)
         if obj._in_db:
+            if identity is not None:
+                obj = identity.add(cls._identity_key(kwargs), obj)
             return obj
         return None
 
@@ -310,31 +331,33 @@ class BaseTocoObject(object):
     def create_table(cls):
         boto3.client("dynamodb").create_table(**cls._SCHEMA())
 
+    @classmethod
+    def KEY_METADATA(cls):
+        '''
+        Key names for the table and its indexes, resolved from the schema the first time they're needed.
+        Kept per class (not inherited), and thrown away by _clear_cf_cache.
+
+        :rtype: sneks.ddb.schema.KeyMetadata
+        '''
+        metadata = cls.__dict__.get("_KEY_METADATA")
+        if metadata is None:
+            metadata = key_metadata(cls._SCHEMA(), cls._REQUIRED_ATTRS)
+            cls._KEY_METADATA = metadata
+        return metadata
+
     @classmethod
     def _get_required_attributes(cls):
-        attrs = []
-        hashkn, rangekn = cls._HASH_AND_RANGE_KEYS()
-        if hashkn:
-            attrs.append(hashkn)
-        if rangekn:
-            attrs.append(rangekn)
-        attrs.extend(cls._REQUIRED_ATTRS)
-        return attrs
+        return list(cls.KEY_METADATA().required)
 
     @classmethod
     def _HASH_AND_RANGE_KEYS(cls, index_name=None):
-        schema = cls._SCHEMA()
-        key_schema = schema['KeySchema']
+        metadata = cls.KEY_METADATA()
         if index_name:
-            gsis = schema.get("GlobalSecondaryIndexes", [])
-            matches = [gsi for gsi in gsis if gsi["IndexName"] == index_name]
-            if len(matches) == 0:
+            index = metadata.indexes.get(index_name)
+            if not index:
                 raise RuntimeError("No index with the name '{index_name}' found!".format(index_name=index_name))
-            key_schema = matches[0]["KeySchema"]
-        hash = [h['AttributeName'] for h in key_schema if h['KeyType']=='HASH'][0]
-        ranges = [r['AttributeName'] for r in key_schema if r['KeyType']=='RANGE']
-        range = ranges[0] if ranges else None
-        return hash, range
+            return index.hash, index.range
+        return metadata.hash, metadata.range
 
     @classmethod
     def _get_class_relation_map(cls, obj):
@@ -585,9 +608,14 @@ class TocoObject(BaseTocoObject):
 
     def _delete(self, CE=None):
         if CE:
-            return self.__class__.TABLE().delete_item(Key=self._get_key_dict(), ConditionExpression=CE)
+            response = self.__class__.TABLE().delete_item(Key=self._get_key_dict(), ConditionExpression=CE)
         else:
-            return self.__class__.TABLE().delete_item(Key=self._get_key_dict())
+            response = self.__class__.TABLE().delete_item(Key=self._get_key_dict())
+        identity = current_identity_map()
+        if identity is not None:
+            identity.discard(self.__class__._identity_key(self._get_key_dict()))
+        self._in_db = False
+        return response
 
     def _load(self):
         b = blob()
@@ -675,6 +703,8 @@ class CFObject(TocoObject):
     def _clear_cf_cache(cls):
         setattr(cls, "_CF_TEMPLATE", None)
         setattr(cls, "_CF_RESOURCES", {})
+        setattr(cls, "_SCHEMA_CACHE", None)
+        setattr(cls, "_KEY_METADATA", None)
 
     @classmethod
     def _SCHEMA(cls):
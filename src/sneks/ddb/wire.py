@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+'''
+A faster way to read items: call the low-level DynamoDB client directly, and turn the AttributeValues it
+returns ({"S": ...}, {"N": ...}, ...) straight into the values the ORM hands out, in one pass.
+
+The boto3 resource layer deserializes every value into Decimals, Binary and so on with TypeDeserializer,
+and then the ORM walks the whole item again with _fix_types to turn Decimals into floats and
+"datetime:..." strings into datetimes.  decode_item() does both at once, and gives exactly the same result.
+
+WireTable takes the same arguments the resource layer's Table does for get_item, query and scan
+(condition objects, python values), and returns items already decoded (or, with decode_items=False,
+deserialized exactly as the resource layer would, for callers that do their own conversion).  LastEvaluatedKey comes back
+deserialized the normal way, so NextTokens stay exact.
+'''
+
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+from boto3.dynamodb.types import Binary, TypeDeserializer, TypeSerializer
+from datetime import datetime
+from decimal import Decimal
+import types
+
+# The same format orm.DATETIME_FORMAT uses for datetimes stored as strings.
+DATETIME_FORMAT = "datetime:%Y-%m-%dT%H:%M:%S.%fZ"
+_DATETIME_PREFIX = "datetime:"
+# What DATETIME_FORMAT produces: "datetime:" + 26 characters of ISO timestamp + "Z".
+_DATETIME_LENGTH = len(_DATETIME_PREFIX) + 27
+
+_SERIALIZER = TypeSerializer()
+_DESERIALIZER = TypeDeserializer()
+
+def decode_string(s):
+    # Strings in DATETIME_FORMAT become datetimes, the same as _fix_types does it; anything else is left alone.
+    if not s.startswith(_DATETIME_PREFIX):
+        return s
+    if len(s) == _DATETIME_LENGTH and s[-1] == "Z" and s[-8] == ".":
+        # Much quicker than strptime for the format we write ourselves.
+        try:
+            return datetime.fromisoformat(s[len(_DATETIME_PREFIX):-1])
+        except ValueError:
+            pass
+    try:
+        return datetime.strptime(s, DATETIME_FORMAT)
+    except ValueError:
+        return s
+
+def decode_value(value):
+    '''
+    One AttributeValue to the python value the ORM uses: numbers become floats, datetime strings become
+    datetimes, and everything else is what TypeDeserializer would give (sets are left alone, as _fix_types does).
+    '''
+    # Single-key dicts, so this is the quickest way to get at the type and value.
+    for tag, v in value.items():
+        if tag == "S":
+            return decode_string(v)
+        if tag == "N":
+            return float(v)
+        if tag == "M":
+            return {k: decode_value(e) for k, e in v.items()}
+        if tag == "L":
+            return [decode_value(e) for e in v]
+        if tag == "BOOL":
+            return v
+        if tag == "NULL":
+            return None
+        if tag == "SS":
+            return set(v)
+        if tag == "NS":
+            return set(Decimal(n) for n in v)
+        if tag == "B":
+            return Binary(v)
+        if tag == "BS":
+            return set(Binary(b) for b in v)
+        raise TypeError("Unknown DynamoDB type {}.".format(tag))
+    raise TypeError("Empty AttributeValue.")
+
+def decode_item(item):
+    return {k: decode_value(v) for k, v in item.items()}
+
+def deserialize_item(item):
+    # The resource layer's exact translation, for keys that have to survive a round trip.
+    return {k: _DESERIALIZER.deserialize(v) for k, v in item.items()}
+
+def serialize_item(item):
+    return {k: _SERIALIZER.serialize(v) for k, v in item.items()}
+
+def as_read(item):
+    # An item that's about to be written, the way the resource layer will give it back when it's read (ints as Decimals, bytes as Binary).
+    return {k: _DESERIALIZER.deserialize(_SERIALIZER.serialize(v)) for k, v in item.items()}
+
+class WireTable(object):
+    '''
+    The read half of a boto3 Table, on top of a plain low-level client (not a resource's meta.client,
+    which translates types itself).  Items in responses are decoded with decode_item, so they must not
+    be run through _fix_types again, unless decode_items is False, in which case they get deserialize_item.
+    '''
+    def __init__(self, client, name, decode_items=True):
+        self.client = client
+        self.name = name
+        self.decode_items = decode_items
+        self._decode_item = decode_item if decode_items else deserialize_item
+        # SamTable looks for the client here, the same as on a resource Table.
+        self.meta = types.SimpleNamespace(client=client)
+
+    def _params(self, params):
+        params = dict(params)
+        params["TableName"] = self.name
+        builder = ConditionExpressionBuilder()
+        names = dict(params.get("ExpressionAttributeNames") or {})
+        values = dict(params.get("ExpressionAttributeValues") or {})
+        for name, is_key_condition in [("KeyConditionExpression", True), ("FilterExpression", False)]:
+            if isinstance(params.get(name), ConditionBase):
+                built = builder.build_expression(params[name], is_key_condition=is_key_condition)
+                params[name] = built.condition_expression
+                names.update(built.attribute_name_placeholders)
+                values.update(built.attribute_value_placeholders)
+        if names:
+            params["ExpressionAttributeNames"] = names
+        if values:
+            params["ExpressionAttributeValues"] = serialize_item(values)
+        for name in ("Key", "ExclusiveStartKey"):
+            if params.get(name):
+                params[name] = serialize_item(params[name])
+        return params
+
+    def _decode(self, response):
+        if "Item" in response:
+            response["Item"] = self._decode_item(response["Item"])
+        if "Items" in response:
+            response["Items"] = [self._decode_item(item) for item in response["Items"]]
+        if "LastEvaluatedKey" in response:
+            response["LastEvaluatedKey"] = deserialize_item(response["LastEvaluatedKey"])
+        return response
+
+    def get_item(self, **params):
+        return self._decode(self.client.get_item(**self._params(params)))
+
+    def query(self, **params):
+        return self._decode(self.client.query(**self._params(params)))
+
+    def scan(self, **params):
+        return self._decode(self.client.scan(**self._params(params)))
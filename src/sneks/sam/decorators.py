@@ -6,6 +6,8 @@ from functools import update_wrapper
 from sneks.sam import ui_stuff, response_core
 from sneks import snekjson
 from sneks.sam.exceptions import HTTP400, HTTP404, HTTP500
+from sneks.ddb.identity import identity_map
+from sneks.ddb import audit, metrics
 
 returns_html = ui_stuff.loader_for
 
@@ -100,20 +102,50 @@ def require_passphrase(passphrase):
 
 def add_ddb_capacity_args(func):
     def newfunc(event, *args, **kwargs):
-        os.environ["DDB_READ_CAPACITY_USED"] = "0"
-        os.environ["DDB_WRITE_CAPACITY_USED"] = "0"
-        response = func(event, *args, **kwargs)
+        with metrics.REGISTRY.scope() as scope, audit.AUDITOR.scope() as audit_scope:
+            response = func(event, *args, **kwargs)
         if ui_stuff.is_response(response):
             return response
         elif isinstance(response, dict):
-            response["_ddb_read_capacity_used"] = float(os.environ["DDB_READ_CAPACITY_USED"])
-            response["_ddb_write_capacity_used"] = float(os.environ["DDB_WRITE_CAPACITY_USED"])
+            totals = scope.totals()
+            response["_ddb_read_capacity_used"] = totals["ReadCapacity"]
+            response["_ddb_write_capacity_used"] = totals["WriteCapacity"]
             response["_ddb_capacity_used"] = response["_ddb_read_capacity_used"] + response["_ddb_write_capacity_used"]
             response["_ddb_cost"] = response["_ddb_read_capacity_used"] * 0.25/1000000 + response["_ddb_write_capacity_used"] * 1.25/1000000
-            print("RCUs: {}".format(os.environ["DDB_READ_CAPACITY_USED"]))
-            print("WCUs: {}".format(os.environ["DDB_WRITE_CAPACITY_USED"]))
-            os.environ["DDB_READ_CAPACITY_USED"] = "0"
-            os.environ["DDB_WRITE_CAPACITY_USED"] = "0"
+            response["_ddb_read_capacity_saved"] = totals["ReadCapacitySaved"]
+            print("RCUs: {}".format(totals["ReadCapacity"]))
+            print("WCUs: {}".format(totals["WriteCapacity"]))
+            print("RCUs saved by caching: {}".format(totals["ReadCapacitySaved"]))
+            # Call sites and search shapes are for the logs, not for whoever made the request.
+            for entry in audit_scope.report(offenders_only=True):
+                print("Scanned {ScannedCount} items to return {Count} ({Ratio:.1f}x): {Operation} on {TableName} at {CallSite}".format(**entry))
         return response
     update_wrapper(newfunc, func)
     return newfunc
+
+def emit_ddb_metrics(namespace=metrics.EMF_NAMESPACE):
+    """
+    Prints the DynamoDB usage from each call as CloudWatch embedded metric format log lines.
+    """
+    def midfunc(func):
+        def newfunc(*args, **kwargs):
+            with metrics.REGISTRY.scope() as scope:
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    for line in scope.to_emf(namespace=namespace):
+                        print(line)
+        update_wrapper(newfunc, func)
+        return newfunc
+    return midfunc
+
+def ddb_identity_map(func):
+    """
+    Runs the function inside a DynamoDB identity map, so loading the same item
+    more than once during a request returns the same object without refetching it.
+    """
+    def newfunc(*args, **kwargs):
+        with identity_map():
+            return func(*args, **kwargs)
+    update_wrapper(newfunc, func)
+    return newfunc
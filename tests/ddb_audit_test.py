@@ -0,0 +1,64 @@
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import unittest
+from boto3.dynamodb.conditions import Attr
+from sneks.ddb import audit, orm
+from sneks.ddb.memory import MemoryDynamoDB
+
+class Event(orm.DynamoObject):
+    @classmethod
+    def _SCHEMA(cls):
+        return {
+            "TableName": "events",
+            "KeySchema": [{"AttributeName": "source", "KeyType": "HASH"}, {"AttributeName": "n", "KeyType": "RANGE"}],
+            "AttributeDefinitions": [{"AttributeName": "source", "AttributeType": "S"}, {"AttributeName": "n", "AttributeType": "N"}]
+        }
+
+class TestScanAudit(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MemoryDynamoDB()
+        orm.set_backend(self.db)
+        Event.create_table()
+        Event.save_many([Event(source="s{}".format(i % 2), n=i, kind="rare" if i % 500 == 0 else "common") for i in range(1, 2001)], mode="batch")
+        audit.AUDITOR.reset()
+
+    def tearDown(self):
+        orm.set_backend(None)
+
+    def test_offender_logged_once(self):
+        with self.assertLogs("sneks.ddb.audit", level="WARNING") as logs:
+            for kind in ["rare", "other"]:
+                with audit.AUDITOR.scope() as scope:
+                    found = list(Event.scan_all(FilterExpression=Attr("kind").eq(kind)))
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("ddb_audit_test.py", logs.output[0])
+        self.assertEqual(len(found), 0)
+        [entry] = audit.AUDITOR.report()
+        self.assertEqual((entry["Operation"], entry["Filter"], entry["KeyCondition"]), ("scan", "=(kind,?)", None))
+        self.assertEqual((entry["Count"], entry["ScannedCount"]), (4, 4000))
+        self.assertEqual(entry["Ratio"], 1000)
+        self.assertGreater(entry["ConsumedCapacity"], 0)
+        self.assertEqual(entry["Latency"]["Count"], entry["Pages"])
+        # The scope only saw the second search.
+        self.assertEqual(scope.report()[0]["ScannedCount"], 2000)
+
+    def test_queries_and_counts(self):
+        list(Event.query_all(HashKey="s1", PageSize=100))
+        Event.count(HashKey="s0", FilterExpression=Attr("kind").eq("common"))
+        report = audit.AUDITOR.report()
+        self.assertEqual(sorted(e["Operation"] for e in report), ["count", "query"])
+        query = [e for e in report if e["Operation"] == "query"][0]
+        self.assertEqual((query["Pages"], query["Ratio"], query["KeyCondition"]), (10, 1.0, "=(source,?)"))
+        self.assertEqual(audit.AUDITOR.report(offenders_only=True), [])
+
+    def test_merge_reports(self):
+        list(Event.scan_all(FilterExpression=Attr("kind").eq("rare")))
+        report = audit.AUDITOR.report()
+        merged = audit.merge_reports([report, report])
+        self.assertEqual(len(merged), 1)
+        self.assertEqual((merged[0]["Count"], merged[0]["ScannedCount"], merged[0]["Ratio"]), (8, 4000, 500))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import unittest
+from unittest import mock
+from sneks.ddb import orm
+from sneks.ddb.memory import MemoryDynamoDB
+
+class Part(orm.DynamoObject):
+    @classmethod
+    def _SCHEMA(cls):
+        return {
+            "TableName": "parts",
+            "KeySchema": [{"AttributeName": "bin", "KeyType": "HASH"}, {"AttributeName": "n", "KeyType": "RANGE"}],
+            "AttributeDefinitions": [{"AttributeName": "bin", "AttributeType": "S"}, {"AttributeName": "n", "AttributeType": "N"}]
+        }
+
+class TestBatchLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MemoryDynamoDB()
+        orm.set_backend(self.db)
+        Part.create_table()
+        Part.save_many([Part(bin="b", n=i, name="part {}".format(i)) for i in range(1, 301)], mode="batch")
+        self.requests = []
+        get = self.db.batch_get_item
+
+        def recording(RequestItems, **kwargs):
+            self.requests.append([dict(k) for k in RequestItems["parts"]["Keys"]])
+            return get(RequestItems=RequestItems, **kwargs)
+
+        patch = mock.patch.object(self.db, "batch_get_item", recording)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        orm.set_backend(None)
+
+    def test_misses(self):
+        loaded = Part.batch_load([{"bin": "b", "n": 5}, {"bin": "b", "n": 999}, {"bin": "other", "n": 5}, {"bin": "b", "n": 300}])
+        self.assertEqual([p and (p["n"], p["name"]) for p in loaded], [(5, "part 5"), None, None, (300, "part 300")])
+        self.assertEqual(Part.batch_load([]), [])
+
+    def test_duplicate_keys(self):
+        loaded = Part.batch_load([{"bin": "b", "n": 7}, {"bin": "b", "n": 8}, {"bin": "b", "n": 7}])
+        self.assertEqual([p["n"] for p in loaded], [7, 8, 7])
+        # BatchGetItem rejects a request with the same key in it twice, so it's only asked for once.
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(len(self.requests[0]), 2)
+
+    def test_chunking(self):
+        keys = [{"bin": "b", "n": i} for i in range(1, 251)]
+        loaded = Part.batch_load(keys)
+        self.assertEqual([p["n"] for p in loaded], list(range(1, 251)))
+        self.assertEqual([len(r) for r in self.requests], [orm.BATCH_GET_LIMIT, orm.BATCH_GET_LIMIT, 50])
+
+    def test_unprocessed_keys(self):
+        get = self.db.batch_get_item
+        held_back = []
+
+        def partial(RequestItems, **kwargs):
+            # The first request only gets half its keys, and hands the rest back as unprocessed.
+            keys = RequestItems["parts"]["Keys"]
+            if held_back:
+                return get(RequestItems=RequestItems, **kwargs)
+            held_back.extend(keys[len(keys) // 2:])
+            response = get(RequestItems={"parts": dict(RequestItems["parts"], Keys=keys[:len(keys) // 2])}, **kwargs)
+            response["UnprocessedKeys"] = {"parts": dict(RequestItems["parts"], Keys=held_back)}
+            return response
+
+        with mock.patch.object(self.db, "batch_get_item", partial), mock.patch.object(orm, "BATCH_BACKOFF_BASE", 0):
+            loaded = Part.batch_load([{"bin": "b", "n": i} for i in range(1, 11)], ConsistentRead=True)
+        self.assertEqual([p["n"] for p in loaded], list(range(1, 11)))
+        self.assertEqual(len(held_back), 5)
+        self.assertEqual(self.db.calls["BatchGetItem"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
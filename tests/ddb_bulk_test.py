@@ -0,0 +1,177 @@
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from sneks.ddb import bulk, orm
+from sneks.ddb.identity import identity_map
+from sneks.ddb.memory import MemoryDynamoDB
+
+class FakeScan(object):
+    '''Three pages of three items per segment, optionally failing once partway through one segment.'''
+    def __init__(self, fail_segment=None, fail_page=None):
+        self.fail_segment = fail_segment
+        self.fail_page = fail_page
+
+    def __call__(self, Segment, TotalSegments, NextToken=None):
+        page = int(NextToken) if NextToken else 0
+        if Segment == self.fail_segment and page == self.fail_page:
+            self.fail_segment = None
+            raise RuntimeError("boom")
+        return {
+            "Items": [{"segment": Segment, "n": page * 3 + i} for i in range(3)],
+            "ScannedCount": 3,
+            "NextToken": str(page + 1) if page < 2 else None,
+            "RawResponse": {"ConsumedCapacity": {"CapacityUnits": 0.5}}
+        }
+
+def read_export(directory, segments):
+    items = []
+    for segment in range(segments):
+        with gzip.open(os.path.join(directory, bulk.segment_filename(segment, segments)), "rt") as f:
+            items.extend(json.loads(line) for line in f)
+    return items
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_export(self):
+        totals = bulk.export_segments(FakeScan(), self.directory, 3, Workers=2)
+        self.assertEqual(totals["Items"], 27)
+        self.assertEqual(totals["ConsumedCapacity"], 4.5)
+        self.assertEqual(len(read_export(self.directory, 3)), 27)
+
+    def test_resume(self):
+        scan = FakeScan(fail_segment=1, fail_page=2)
+        with self.assertRaises(RuntimeError):
+            bulk.export_segments(scan, self.directory, 3, Workers=1)
+        checkpoint = bulk.Checkpoint(os.path.join(self.directory, bulk.CHECKPOINT_FILE), 3)
+        self.assertEqual(checkpoint.segment(1)["Items"], 6)
+        bulk.export_segments(scan, self.directory, 3)
+        items = read_export(self.directory, 3)
+        self.assertEqual(sorted((i["segment"], i["n"]) for i in items), [(s, n) for s in range(3) for n in range(9)])
+        with self.assertRaises(RuntimeError):
+            bulk.export_segments(scan, self.directory, 4)
+
+class TestImport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_read_csv(self):
+        path = self.write("in.csv", 'id,note\na,"two\nlines"\nb,x\nc\n')
+        records = list(bulk.read_records(path))
+        self.assertEqual([r for _, r, e in records if not e], [{"id": "a", "note": "two\nlines"}, {"id": "b", "note": "x"}])
+        self.assertIsNotNone(records[2][2])
+        resumed = list(bulk.read_records(path, offset=records[0][0]))
+        self.assertEqual(resumed[0][1], {"id": "b", "note": "x"})
+
+    def test_import(self):
+        lines = [json.dumps({"id": i, "ok": i != 7}) for i in range(60)]
+        lines.insert(30, "{not json")
+        path = self.write("in.ndjson", "\n".join(lines) + "\n")
+        written = []
+
+        def map_record(record):
+            if not record["ok"]:
+                raise RuntimeError("not ok")
+            return record["id"], record
+
+        def write_batch(items):
+            written.extend(items)
+            return 1.0
+
+        totals = bulk.import_records(path, map_record, write_batch, batch_size=25, Workers=2)
+        self.assertEqual(totals["Items"], 59)
+        self.assertEqual(totals["Rejected"], 2)
+        self.assertEqual(sorted(i["id"] for i in written), [i for i in range(60) if i != 7])
+        with open(path + ".rejects.ndjson") as f:
+            self.assertEqual(len(f.readlines()), 2)
+        with open(path + ".checkpoint.json") as f:
+            self.assertEqual(json.load(f)["Offset"], os.path.getsize(path))
+        # Everything's checkpointed, so running it again does nothing.
+        self.assertEqual(bulk.import_records(path, map_record, write_batch)["Items"], 0)
+
+    def test_failed_batch(self):
+        path = self.write("in.ndjson", "\n".join(json.dumps({"id": i}) for i in range(10)) + "\n")
+
+        def write_batch(items):
+            if items[0]["id"] == 5:
+                raise RuntimeError("nope")
+            return 0.0
+
+        totals = bulk.import_records(path, lambda r: (r["id"], r), write_batch, batch_size=5, Workers=1)
+        self.assertEqual((totals["Items"], totals["Rejected"]), (5, 5))
+
+    def test_reject_behind_unwritten_batch(self):
+        path = self.write("in.ndjson", '{"id": "a"}\n{"id": "b"}\nnot json\n{"id": "c"}\n')
+        checkpoint_path = path + ".checkpoint.json"
+
+        class Crash(BaseException):
+            pass
+
+        def crash(items):
+            raise Crash()
+
+        with self.assertRaises(Crash):
+            bulk.import_records(path, lambda r: (r["id"], r), crash, Workers=1)
+        # a and b were never written, so the checkpoint can't have moved past them to the bad line.
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                self.assertEqual(json.load(f)["Offset"], 0)
+        written = []
+        totals = bulk.import_records(path, lambda r: (r["id"], r), lambda items: written.extend(items), Workers=1)
+        self.assertEqual([i["id"] for i in written], ["a", "b", "c"])
+        self.assertEqual(totals["Rejected"], 1)
+        with open(checkpoint_path) as f:
+            self.assertEqual(json.load(f)["Offset"], os.path.getsize(path))
+
+class Record(orm.DynamoObject):
+    @classmethod
+    def _SCHEMA(cls):
+        return {
+            "TableName": "records",
+            "KeySchema": [{"AttributeName": "id", "KeyType": "HASH"}],
+            "AttributeDefinitions": [{"AttributeName": "id", "AttributeType": "S"}]
+        }
+
+class TestTableExport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        orm.set_backend(MemoryDynamoDB())
+        Record.create_table()
+        Record.save_many([Record(id="r{}".format(i), n=i, sizes={1, 2}, tags={"t"}) for i in range(40)], mode="batch")
+
+    def tearDown(self):
+        orm.set_backend(None)
+        shutil.rmtree(self.directory)
+
+    def test_raw_items(self):
+        with identity_map() as identity, mock.patch.object(Record, "_materialize", side_effect=AssertionError("built an object")):
+            totals = Record.export_table(self.directory, Segments=2)
+            self.assertEqual(len(identity), 0)
+        self.assertEqual(totals["Items"], 40)
+        items = sorted(read_export(self.directory, 2), key=lambda i: i["n"])
+        self.assertEqual(items[7], {"id": "r7", "n": 7.0, "sizes": [1.0, 2.0], "tags": ["t"], orm.VERSION_KEY: 0.0})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import unittest
+from decimal import Decimal
+from sneks.ddb import cache, orm
+from sneks.ddb.memory import MemoryDynamoDB
+
+class TestItemCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        c = cache.ItemCache(max_items=2)
+        c.put("a", {"id": "a"})
+        c.put("b", {"id": "b"})
+        c.get("a")
+        c.put("c", {"id": "c"})
+        self.assertIsNone(c.get("b"))
+        self.assertEqual(c.get("a"), {"id": "a"})
+        self.assertEqual(c.stats()["Evictions"], 1)
+
+    def test_byte_limit(self):
+        c = cache.ItemCache(max_bytes=50)
+        c.put("a", {"data": "x" * 30})
+        c.put("b", {"data": "y" * 30})
+        self.assertIsNone(c.get("a"))
+        c.put("huge", {"data": "z" * 100})
+        self.assertIsNone(c.get("huge"))
+        self.assertLessEqual(c.stats()["Bytes"], 50)
+
+    def test_ttl(self):
+        c = cache.ItemCache(ttl=-1)
+        c.put("a", {"id": "a"})
+        self.assertIsNone(c.get("a"))
+        self.assertEqual(c.stats()["Expirations"], 1)
+
+    def test_hit_accounting(self):
+        saved = []
+        c = cache.ItemCache(on_hit=saved.append)
+        c.put("a", {"id": "a", "n": Decimal("12.5")})
+        c.get("a")
+        c.get("missing")
+        stats = c.stats()
+        self.assertEqual((stats["Hits"], stats["Misses"]), (1, 1))
+        self.assertEqual(saved, [cache.RCU_PER_READ_UNIT])
+
+    def test_item_size(self):
+        self.assertEqual(cache.item_size({"ab": "cde"}), 5)
+        self.assertEqual(cache.item_size({"n": Decimal("123")}), 1 + 3)
+
+class Doc(orm.DynamoObject):
+    @classmethod
+    def _SCHEMA(cls):
+        return {
+            "TableName": "docs",
+            "KeySchema": [{"AttributeName": "id", "KeyType": "HASH"}],
+            "AttributeDefinitions": [{"AttributeName": "id", "AttributeType": "S"}]
+        }
+
+class TestOrmItemCache(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MemoryDynamoDB()
+        orm.set_backend(self.db)
+        Doc.create_table()
+        Doc.enable_item_cache()
+        self.table = self.db.Table("docs")
+
+    def tearDown(self):
+        Doc.disable_item_cache()
+        orm.set_backend(None)
+
+    def sneak(self, **item):
+        # A write the cache doesn't know about.
+        self.table.put_item(Item=dict(item, **{orm.VERSION_KEY: 9}))
+
+    def test_no_shared_state(self):
+        Doc(id="a", tags={"x"}, items=["i"], meta={"k": "v"}).save()
+        a = Doc.load(id="a")
+        a["tags"].add("LEAK")
+        a["items"].append("LEAK")
+        a["meta"]["LEAK"] = 1
+        b = Doc.load(id="a")
+        self.assertEqual((b["tags"], b["items"], b["meta"]), ({"x"}, ["i"], {"k": "v"}))
+
+    def test_cached_and_uncached_types(self):
+        item = {"id": "a", "n": 5, "f": 1.5, "b": b"xy", "ns": {1, 2}, "bs": {b"z"}, "nested": {"l": [3, b"q"]}}
+        for save in [lambda: Doc(**item).save(), lambda: Doc.save_many([Doc(**item)], mode="batch"), lambda: Doc.save_many([Doc(**item)])]:
+            save()
+            cached = Doc.load(id="a")
+            self.assertNotIn("GetItem", self.db.calls)
+            Doc.disable_item_cache()
+            uncached = Doc.load(id="a")
+            Doc.enable_item_cache()
+            self.assertEqual(dict(cached), dict(uncached))
+            self.assertEqual({k: type(v) for k, v in cached.items()}, {k: type(v) for k, v in uncached.items()})
+            self.assertEqual([type(v) for v in cached["nested"]["l"] + list(cached["ns"]) + list(cached["bs"])], [type(v) for v in uncached["nested"]["l"] + list(uncached["ns"]) + list(uncached["bs"])])
+            self.table.delete_item(Key={"id": "a"})
+            self.db.calls.clear()
+
+    def test_save_and_reload_refresh(self):
+        Doc(id="a", title="saved").save()
+        self.sneak(id="a", title="elsewhere")
+        self.assertEqual(Doc.load(id="a")["title"], "saved")
+        self.assertNotIn("GetItem", self.db.calls)
+        doc = Doc.load(id="a").reload()
+        self.assertEqual(doc["title"], "elsewhere")
+        self.assertEqual(Doc.load(id="a")["title"], "elsewhere")
+        self.assertEqual(self.db.calls["GetItem"], 1)
+
+    def test_in_place_save_and_increment_invalidate(self):
+        Doc(id="a", title="first", views=0).save()
+        doc = Doc.load(id="a")
+        doc["title"] = "second"
+        doc.save()
+        self.assertEqual(Doc.load(id="a")["title"], "second")
+        Doc.increment("views", Key={"id": "a"})
+        self.assertEqual(Doc.load(id="a")["views"], 1)
+
+    def test_delete_invalidates(self):
+        Doc(id="a").save()
+        Doc.load(id="a").delete()
+        self.assertIsNone(Doc.load(id="a"))
+        Doc.save_many([Doc(id="b"), Doc(id="c")], mode="batch")
+        Doc.delete_many([{"id": "b"}])
+        self.assertIsNone(Doc.load(id="b"))
+
+    def test_save_many_refreshes(self):
+        Doc(id="a", title="first").save()
+        Doc.save_many([Doc(id="a", title="batch")], mode="batch")
+        self.sneak(id="a", title="elsewhere")
+        self.assertEqual(Doc.load(id="a")["title"], "batch")
+        self.assertNotIn("GetItem", self.db.calls)
+
+if __name__ == '__main__':
+    unittest.main()
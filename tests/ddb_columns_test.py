@@ -0,0 +1,78 @@
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import unittest
+from array import array
+from boto3.dynamodb.conditions import Attr
+from datetime import datetime
+import math
+from sneks.ddb import columns, orm
+from sneks.ddb.memory import MemoryDynamoDB
+
+class Reading(orm.DynamoObject):
+    @classmethod
+    def _SCHEMA(cls):
+        return {
+            "TableName": "readings",
+            "KeySchema": [{"AttributeName": "sensor", "KeyType": "HASH"}, {"AttributeName": "t", "KeyType": "RANGE"}],
+            "AttributeDefinitions": [{"AttributeName": "sensor", "AttributeType": "S"}, {"AttributeName": "t", "AttributeType": "N"}]
+        }
+
+class TestColumnBuilder(unittest.TestCase):
+
+    def test_types(self):
+        builder = columns.ColumnBuilder(["n", "s", "mixed", "nested.x", "never"])
+        builder.add_items([
+            {"s": "a", "nested": {"x": 1}},
+            {"n": 1, "s": "datetime:2020-01-02T03:04:05.000006Z", "mixed": 2},
+            {"n": 2.5, "mixed": "two", "nested": "not a map"}
+        ])
+        result = builder.result()
+        self.assertIsInstance(result["n"], array)
+        self.assertTrue(math.isnan(result["n"][0]))
+        self.assertEqual(list(result["n"])[1:], [1.0, 2.5])
+        self.assertEqual(result["s"], ["a", datetime(2020, 1, 2, 3, 4, 5, 6), None])
+        self.assertEqual(result["mixed"], [None, 2.0, "two"])
+        self.assertTrue(math.isnan(result["nested.x"][2]))
+        self.assertEqual(result["never"], [None, None, None])
+
+    def test_projection(self):
+        expression, names = columns.projection(["a", "b.c"], {"#n0": "x"})
+        self.assertEqual(expression, "#c0_0, #c1_0.#c1_1")
+        self.assertEqual(names, {"#n0": "x", "#c0_0": "a", "#c1_0": "b", "#c1_1": "c"})
+
+    @unittest.skipIf(columns.numpy is None, "numpy isn't installed")
+    def test_numpy(self):
+        builder = columns.ColumnBuilder(["n"], Arrays="numpy")
+        builder.add_items([{"n": 1}, {"n": 2}])
+        self.assertEqual(builder.result()["n"].sum(), 3.0)
+
+class TestColumnSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MemoryDynamoDB()
+        orm.set_backend(self.db)
+        Reading.create_table()
+        Reading.save_many([Reading(sensor="s1", t=t, value=t * 1.5, label="l{}".format(t), junk="x" * 100) for t in range(1, 301)], mode="batch")
+
+    def tearDown(self):
+        orm.set_backend(None)
+
+    def test_query_columns(self):
+        result = Reading.query_columns(["t", "value", "label"], HashKey="s1", PageSize=50)
+        self.assertEqual(sorted(result), ["label", "t", "value"])
+        self.assertEqual(len(result["t"]), 300)
+        self.assertEqual(sum(result["value"]), sum(t * 1.5 for t in range(1, 301)))
+        self.assertEqual(result["label"][:2], ["l1", "l2"])
+        self.assertEqual(self.db.calls["Query"], 6)
+
+    def test_scan_columns(self):
+        result = Reading.scan_columns(["value"], FilterExpression=Attr("t").lte(10))
+        self.assertEqual(list(result["value"]), [t * 1.5 for t in range(1, 11)])
+        result = Reading.scan_columns(["t"], MaxResults=7)
+        self.assertEqual(len(result["t"]), 7)
+        with self.assertRaises(RuntimeError):
+            Reading.scan_columns(["t"], ProjectionExpression="t")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import unittest
+from unittest import mock
+from boto3.dynamodb.conditions import Attr
+from sneks.ddb import orm
+from sneks.ddb.memory import MemoryDynamoDB
+
+class Visit(orm.DynamoObject):
+    @classmethod
+    def _SCHEMA(cls):
+        return {
+            "TableName": "visits",
+            "KeySchema": [{"AttributeName": "page", "KeyType": "HASH"}, {"AttributeName": "n", "KeyType": "RANGE"}],
+            "AttributeDefinitions": [{"AttributeName": "page", "AttributeType": "S"}, {"AttributeName": "n", "AttributeType": "N"}]
+        }
+
+PAGES = {"home": 120, "about": 30, "blog": 75}
+
+class TestCountAll(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MemoryDynamoDB()
+        orm.set_backend(self.db)
+        Visit.create_table()
+        Visit.save_many([Visit(page=page, n=i, bot=i % 3 == 0) for page, count in PAGES.items() for i in range(1, count + 1)], mode="batch")
+
+    def tearDown(self):
+        orm.set_backend(None)
+
+    def test_query(self):
+        totals = Visit.count_all(HashKey="home", PageSize=50)
+        self.assertEqual((totals["Count"], totals["ScannedCount"]), (120, 120))
+        self.assertGreater(totals["ConsumedCapacity"], 0)
+        self.assertEqual(self.db.calls["Query"], 3)
+        totals = Visit.count_all(HashKey="home", FilterExpression=Attr("bot").eq(True))
+        self.assertEqual((totals["Count"], totals["ScannedCount"]), (40, 120))
+
+    def test_hash_keys(self):
+        totals = Visit.count_all(HashKeys=list(PAGES), Workers=2)
+        self.assertEqual(totals["Count"], sum(PAGES.values()))
+        self.assertNotIn("Approximate", totals)
+        self.assertEqual(self.db.calls["Query"], 3)
+        self.assertEqual(Visit.count_all(HashKeys=[])["Count"], 0)
+
+    def test_segments(self):
+        for workers in [None, 1]:
+            totals = Visit.count_all(Segments=4, Workers=workers, FilterExpression=Attr("bot").eq(False))
+            self.assertEqual((totals["Count"], totals["ScannedCount"]), (150, 225))
+            self.assertNotIn("Approximate", totals)
+
+    def test_sample_fraction(self):
+        segment_counts = [Visit.scan(Segment=s, TotalSegments=4, Select="COUNT")["Count"] for s in range(4)]
+        with mock.patch("sneks.ddb.orm.random.sample", lambda population, k: population[:k]):
+            totals = Visit.count_all(Segments=4, SampleFraction=0.5)
+        self.assertTrue(totals["Approximate"])
+        self.assertEqual(totals["SegmentsCounted"], 2)
+        self.assertEqual(totals["Count"], (segment_counts[0] + segment_counts[1]) * 2)
+        # A fraction of 1 or more counts everything.
+        self.assertNotIn("Approximate", Visit.count_all(Segments=4, SampleFraction=1))
+
+    def test_both_modes(self):
+        with self.assertRaises(RuntimeError):
+            Visit.count_all(Segments=2, HashKeys=["home"])
+
+if __name__ == '__main__':
+    unittest.main()
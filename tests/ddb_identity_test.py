@@ -0,0 +1,84 @@
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import unittest
+from sneks.ddb import orm, toco
+from sneks.ddb.identity import identity_map
+from sneks.ddb.memory import MemoryDynamoDB
+
+SCHEMA = {
+    "TableName": "widgets",
+    "KeySchema": [{"AttributeName": "id", "KeyType": "HASH"}],
+    "AttributeDefinitions": [{"AttributeName": "id", "AttributeType": "S"}]
+}
+
+class Widget(orm.DynamoObject):
+    @classmethod
+    def _SCHEMA(cls):
+        return SCHEMA
+
+class TocoWidget(toco.TocoObject):
+    @classmethod
+    def _SCHEMA(cls):
+        return SCHEMA
+
+class TestIdentityMap(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MemoryDynamoDB()
+        orm.set_backend(self.db)
+        Widget.create_table()
+        self.table = self.db.Table("widgets")
+        for i in range(3):
+            self.table.put_item(Item={"id": "w{}".format(i), "name": "widget {}".format(i), orm.VERSION_KEY: 0})
+
+    def tearDown(self):
+        orm.set_backend(None)
+        TocoWidget._TABLE_CACHE = None
+
+    def test_load(self):
+        with identity_map():
+            a = Widget.load(id="w0")
+            self.assertIs(Widget.load(id="w0"), a)
+            self.assertEqual(self.db.calls["GetItem"], 1)
+        self.assertIsNot(Widget.load(id="w0"), a)
+
+    def test_query_reuse(self):
+        with identity_map():
+            a = Widget.load(id="w1")
+            a["name"] = "local"
+            found = {w["id"]: w for w in Widget.scan_all()}
+            self.assertIs(found["w1"], a)
+            self.assertEqual(found["w1"]["name"], "local")
+            self.assertIs(Widget.load(id="w2"), found["w2"])
+
+    def test_save_registers(self):
+        with identity_map():
+            new = Widget(id="new", name="fresh").save()
+            self.assertIs(Widget.load(id="new"), new)
+            self.assertNotIn("GetItem", self.db.calls)
+
+    def test_delete(self):
+        with identity_map():
+            a = Widget.load(id="w0")
+            a.delete()
+            self.assertIsNone(Widget.load(id="w0"))
+
+    def test_reload(self):
+        with identity_map():
+            a = Widget.load(id="w0")
+            self.table.put_item(Item={"id": "w0", "name": "changed", orm.VERSION_KEY: 1})
+            self.assertIs(a.reload(), a)
+            self.assertEqual(a, {"id": "w0", "name": "changed", orm.VERSION_KEY: 1})
+            self.assertIs(Widget.load(id="w0"), a)
+
+    def test_toco_delete(self):
+        TocoWidget._TABLE_CACHE = self.table
+        with identity_map():
+            a = TocoWidget.load(id="w0")
+            self.assertIs(TocoWidget.load(id="w0"), a)
+            a._delete()
+            self.assertIsNone(TocoWidget.load(id="w0"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import unittest
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.types import Binary
+from decimal import Decimal
+from sneks.ddb import orm
+from sneks.ddb.identity import identity_map
+from sneks.ddb.memory import MemoryDynamoDB
+
+class Thing(orm.DynamoObject):
+    @classmethod
+    def _SCHEMA(cls):
+        return {
+            "TableName": "things",
+            "KeySchema": [{"AttributeName": "owner", "KeyType": "HASH"}, {"AttributeName": "n", "KeyType": "RANGE"}],
+            "AttributeDefinitions": [
+                {"AttributeName": "owner", "AttributeType": "S"},
+                {"AttributeName": "n", "AttributeType": "N"},
+                {"AttributeName": "color", "AttributeType": "S"}
+            ],
+            "GlobalSecondaryIndexes": [{
+                "IndexName": "by-color",
+                "KeySchema": [{"AttributeName": "color", "KeyType": "HASH"}],
+                "Projection": {"ProjectionType": "KEYS_ONLY"}
+            }]
+        }
+
+class TestMemoryBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MemoryDynamoDB()
+        orm.set_backend(self.db)
+        Thing.create_table()
+
+    def tearDown(self):
+        orm.set_backend(None)
+
+    def add_things(self, owner, count, **attrs):
+        # Range keys start at 1, since a key of 0 counts as missing.
+        return Thing.save_many([Thing(owner=owner, n=i, **attrs) for i in range(1, count + 1)], mode="batch")
+
+    def test_save_load_update(self):
+        thing = Thing(owner="a", n=1, name="first", tags={"x"})
+        thing.save()
+        loaded = Thing.load(owner="a", n=1)
+        self.assertEqual(loaded["name"], "first")
+        self.assertEqual(loaded[orm.VERSION_KEY], 0)
+        loaded["name"] = "second"
+        del loaded["tags"]
+        loaded.save()
+        raw = self.db.Table("things").get_item(Key={"owner": "a", "n": 1})["Item"]
+        self.assertEqual(raw, {"owner": "a", "n": 1, "name": "second", orm.VERSION_KEY: 1})
+
+    def test_version_conflict(self):
+        Thing(owner="a", n=1).save()
+        first = Thing.load(owner="a", n=1)
+        second = Thing.load(owner="a", n=1)
+        first["x"] = 1
+        first.save()
+        second["x"] = 2
+        with self.assertRaises(ClientError) as context:
+            second.save()
+        self.assertEqual(context.exception.response["Error"]["Code"], "ConditionalCheckFailedException")
+        self.assertEqual(context.exception.response["Item"]["x"], 1)
+        with self.assertRaises(ClientError):
+            Thing(owner="a", n=1).create()
+
+    def test_delete(self):
+        thing = Thing(owner="a", n=1)
+        thing.save()
+        thing.delete()
+        self.assertIsNone(Thing.load(owner="a", n=1))
+        with self.assertRaises(ClientError):
+            thing.delete(CE=Attr("owner").exists())
+
+    def test_query_pagination(self):
+        self.add_things("a", 30)
+        self.add_things("b", 5)
+        page = Thing.query(HashKey="a", Limit=7)
+        self.assertEqual([t["n"] for t in page["Items"]], list(range(1, 8)))
+        self.assertIsNotNone(page["NextToken"])
+        self.assertEqual([t["n"] for t in Thing.query_all(HashKey="a")], list(range(1, 31)))
+        self.assertEqual([t["n"] for t in Thing.query_all(HashKey="a", RangeKey=["between", 10, 12])], [10, 11, 12])
+        self.assertEqual([t["n"] for t in Thing.query_all(HashKey="a", ScanIndexForward=False, MaxResults=3)], [30, 29, 28])
+        self.assertEqual(Thing.count(HashKey="b")["Count"], 5)
+
+    def test_scan_filter_and_segments(self):
+        self.add_things("a", 20, color="red")
+        self.add_things("b", 20, color="blue")
+        page = Thing.scan(FilterExpression=Attr("color").eq("red"), Limit=10)
+        self.assertEqual(page["ScannedCount"], 10)
+        self.assertEqual(len(list(Thing.scan_all(FilterExpression=Attr("color").eq("red")))), 20)
+        self.assertEqual(len(list(Thing.scan_all(Segments=4))), 40)
+
+    def test_index_query(self):
+        self.add_things("a", 3, color="red")
+        self.add_things("b", 2, color="red")
+        Thing(owner="c", n=1).save()
+        items = Thing.query(IndexName="by-color", HashKey="red")["RawResponse"]["Items"]
+        self.assertEqual(len(items), 5)
+        # KEYS_ONLY indexes just have the table and index keys.
+        self.assertEqual(set(items[0].keys()), {"owner", "n", "color"})
+        self.assertEqual(len(list(Thing.scan_all(IndexName="by-color"))), 5)
+
+    def test_batch_load_and_delete(self):
+        things = self.add_things("a", 150)
+        loaded = Thing.batch_load([{"owner": "a", "n": i} for i in (3, 200, 150)])
+        self.assertEqual([t and t["n"] for t in loaded], [3, None, 150])
+        Thing.delete_many(things[:100])
+        self.assertEqual(Thing.count(HashKey="a")["Count"], 50)
+
+    def test_transaction(self):
+        Thing.save_many([Thing(owner="a", n=1), Thing(owner="a", n=2)])
+        stale = Thing(owner="a", n=3)
+        stale.save()
+        stale[orm.VERSION_KEY] = 5
+        with self.assertRaises(ClientError) as context:
+            Thing.save_many([Thing(owner="a", n=4), stale])
+        reasons = context.exception.response["CancellationReasons"]
+        self.assertEqual([r["Code"] for r in reasons], ["None", "ConditionalCheckFailed"])
+        self.assertIsNone(Thing.load(owner="a", n=4))
+
+    def test_projection(self):
+        Thing(owner="a", n=1, color="red", name="first", size=3).save()
+        thing = Thing.load(owner="a", n=1, Projection=["name"])
+        self.assertEqual(dict(thing), {"owner": "a", "n": 1, "name": "first", orm.VERSION_KEY: 0})
+        thing["name"] = "second"
+        gets = self.db.calls["GetItem"]
+        self.assertEqual(thing["size"], 3)
+        self.assertEqual(self.db.calls["GetItem"], gets + 1)
+        self.assertEqual(thing["name"], "second")
+        self.assertFalse(thing._partial)
+
+        things = Thing.query(HashKey="a", Projection=["name"])["Items"]
+        self.assertTrue(things[0]._partial)
+        things[0]["name"] = "third"
+        things[0].save()
+        self.assertEqual(Thing.load(owner="a", n=1)["size"], 3)
+        with self.assertRaises(RuntimeError):
+            things[0].save(partial=False)
+        with self.assertRaises(RuntimeError):
+            Thing.save_many(things)
+        # KEYS_ONLY index results are partial too.
+        self.assertTrue(Thing.query(IndexName="by-color", HashKey="red")["Items"][0]._partial)
+
+    def test_projection_in_identity_map(self):
+        Thing(owner="a", n=1, name="first", extra="e").save()
+        with identity_map():
+            thing = Thing.load(owner="a", n=1, Projection=["name"])
+            thing["name"] = "second"
+            # Saving registers the still-partial object, which mustn't stop it filling itself in.
+            thing.save()
+            self.assertIs(Thing.load(owner="a", n=1), thing)
+            self.assertEqual(thing["extra"], "e")
+            self.assertEqual(thing["name"], "second")
+
+    def test_atomic_updates(self):
+        thing = Thing(owner="a", n=1, views=1)
+        thing.save()
+        self.assertEqual(thing.increment("views", 2), 3)
+        self.assertEqual(Thing.increment("views", Key={"owner": "a", "n": 1}), 4)
+        self.assertEqual(thing["views"], 3)
+        self.assertEqual(thing.append("log", ["x"]), ["x"])
+        self.assertEqual(thing.add_to_set("tags", ["t1", "t2"]), {"t1", "t2"})
+        self.assertEqual(thing.set_if_absent("log", ["y"]), ["x"])
+        self.assertEqual(thing.set_if_absent("owner_name", "someone"), "someone")
+        self.assertEqual(thing[orm.VERSION_KEY], 0)
+        self.assertFalse(thing._changed_keys)
+        # The object didn't see the other increment, so it has to be reloaded before it can be saved.
+        thing["other"] = 1
+        for partial in [True, False]:
+            with self.assertRaises(ClientError):
+                thing.save(partial=partial)
+        thing.reload()
+        thing["other"] = 1
+        thing.save()
+        stored = Thing.load(owner="a", n=1)
+        self.assertEqual((stored["views"], stored["log"], stored["other"], stored[orm.VERSION_KEY]), (4, ["x"], 1, 7))
+        with self.assertRaises(ClientError):
+            Thing.increment("views", Key={"owner": "missing", "n": 1})
+        with self.assertRaises(RuntimeError):
+            Thing.increment("views")
+
+    def test_consumed_capacity(self):
+        table = self.db.Table("things")
+        response = table.put_item(Item={"owner": "a", "n": 1, "color": "red", "big": "x" * 3000}, ReturnConsumedCapacity="INDEXES")
+        capacity = response["ConsumedCapacity"]
+        self.assertEqual(capacity["Table"]["CapacityUnits"], 3)
+        self.assertEqual(capacity["GlobalSecondaryIndexes"]["by-color"]["CapacityUnits"], 1)
+        self.assertEqual(capacity["CapacityUnits"], 4)
+        response = table.get_item(Key={"owner": "a", "n": 1}, ReturnConsumedCapacity="TOTAL")
+        self.assertEqual(response["ConsumedCapacity"]["CapacityUnits"], 0.5)
+        response = table.get_item(Key={"owner": "a", "n": 1}, ConsistentRead=True, ReturnConsumedCapacity="TOTAL")
+        self.assertEqual(response["ConsumedCapacity"]["CapacityUnits"], 1)
+
+    def test_update_expressions(self):
+        table = self.db.Table("things")
+        table.put_item(Item={"owner": "a", "n": 1, "count": 1, "l": [1], "s": {"x"}})
+        response = table.update_item(
+            Key={"owner": "a", "n": 1},
+            UpdateExpression="SET #c = #c + :one, l = list_append(l, :l), m = if_not_exists(m, :m) ADD s :s",
+            ConditionExpression="attribute_exists(#c) AND size(l) < :two",
+            ExpressionAttributeNames={"#c": "count"},
+            ExpressionAttributeValues={":one": 1, ":l": [2], ":m": {"k": "v"}, ":s": {"y"}, ":two": 2},
+            ReturnValues="UPDATED_NEW"
+        )
+        self.assertEqual(response["Attributes"], {"count": Decimal(2), "l": [1, 2], "m": {"k": "v"}, "s": {"x", "y"}})
+        with self.assertRaises(ClientError):
+            table.update_item(Key={"owner": "a", "n": 1}, UpdateExpression="SET n = :one", ExpressionAttributeValues={":one": 1})
+
+    def test_read_types(self):
+        # Whatever was written, numbers come back as Decimals and binary as Binary, like the resource layer.
+        table = self.db.Table("things")
+        table.put_item(Item={"owner": "a", "n": 1, "i": 5, "b": b"xy", "ns": {1, 2}, "bs": {b"z"}, "m": {"l": [3, True]}})
+        table.update_item(Key={"owner": "a", "n": 1}, UpdateExpression="SET j = :j ADD ns :ns", ExpressionAttributeValues={":j": [b"q"], ":ns": {3}})
+        item = table.get_item(Key={"owner": "a", "n": 1})["Item"]
+        self.assertEqual([type(v) for v in (item["n"], item["i"], item["m"]["l"][0], item["m"]["l"][1])], [Decimal, Decimal, Decimal, bool])
+        self.assertEqual({type(v) for v in item["ns"]}, {Decimal})
+        self.assertEqual([type(v) for v in (item["b"], next(iter(item["bs"])), item["j"][0])], [Binary] * 3)
+        self.assertEqual(item["b"], Binary(b"xy"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import json
+import threading
+from sneks.ddb import metrics
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_index_breakdown(self):
+        registry = metrics.MetricsRegistry()
+        registry.record_response({"ConsumedCapacity": {
+            "TableName": "t",
+            "CapacityUnits": 3.0,
+            "Table": {"CapacityUnits": 1.0},
+            "GlobalSecondaryIndexes": {"by-email": {"CapacityUnits": 2.0}}
+        }}, operation="query", kind="READ", latency=0.004)
+        entries = {e["IndexName"]:e for e in registry.snapshot()["Entries"]}
+        self.assertEqual(entries[None]["ReadCapacity"], 1.0)
+        self.assertEqual(entries["by-email"]["ReadCapacity"], 2.0)
+        self.assertEqual(entries[None]["Latency"]["Count"], 1)
+        self.assertEqual(registry.totals()["ReadCapacity"], 3.0)
+        self.assertEqual(entries[None]["CallSite"].split(":")[-1], "test_index_breakdown")
+
+    def test_scope(self):
+        registry = metrics.MetricsRegistry()
+        registry.record(table="t", operation="put_item", write=1.0, calls=1)
+        with registry.scope() as scope:
+            registry.record(table="t", operation="put_item", write=2.0, calls=1)
+        registry.record(table="t", operation="put_item", write=4.0, calls=1)
+        self.assertEqual(scope.totals()["WriteCapacity"], 2.0)
+        self.assertEqual(registry.totals()["WriteCapacity"], 7.0)
+
+    def test_thread_safety(self):
+        registry = metrics.MetricsRegistry()
+        def work():
+            for _ in range(1000):
+                registry.record(table="t", operation="get_item", read=0.5, calls=1)
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(registry.totals()["Calls"], 8000)
+        self.assertEqual(registry.totals()["ReadCapacity"], 4000.0)
+
+    def test_emf(self):
+        registry = metrics.MetricsRegistry()
+        registry.record(table="t", operation="scan", call_site="x.py:1:f", read=5.0, calls=1, latency=0.01)
+        lines = registry.to_emf(namespace="test")
+        self.assertEqual(len(lines), 1)
+        record = json.loads(lines[0])
+        self.assertEqual(record["ReadCapacityUnits"], 5.0)
+        self.assertEqual(record["CallSites"], ["x.py:1:f"])
+        directive = record["_aws"]["CloudWatchMetrics"][0]
+        self.assertEqual(directive["Namespace"], "test")
+        self.assertEqual(directive["Dimensions"], [["TableName", "Operation"]])
+        for metric in directive["Metrics"]:
+            self.assertIn(metric["Name"], record)
+
+if __name__ == '__main__':
+    unittest.main()
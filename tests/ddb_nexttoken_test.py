@@ -0,0 +1,60 @@
+import base64
+import json
+import unittest
+from decimal import Decimal
+from boto3.dynamodb.types import Binary
+from sneks.ddb import nexttoken
+
+class TestNextToken(unittest.TestCase):
+
+    def test_round_trip(self):
+        key = {
+            "id": "user#123",
+            "score": Decimal("12345678901234567890.123456789"),
+            "small": Decimal("1E-30"),
+            "blob": Binary(b"\x00\xff\x10"),
+            "tags": {"a", "b"},
+            "nums": {Decimal("1"), Decimal("2.5")},
+            "bins": {Binary(b"x"), Binary(b"y")},
+            "nested": {"list": [True, False, None, "x" * 300]},
+            # Lengths of 128 and up take more than one varint byte, for values and names alike.
+            "k" * 200: "v" * 20000,
+            "long": Decimal("1" * 150),
+            "big": Binary(b"\x01" * 130)
+        }
+        token = nexttoken.encode(key)
+        self.assertNotIn("=", token)
+        self.assertEqual(nexttoken.decode(token), key)
+
+    def test_smaller_than_json(self):
+        key = {"id": "8c5a4f7e-2b9d-4c1a-9e3f-6a7b8c9d0e1f", "created": Decimal("1700000000123")}
+        legacy = base64.urlsafe_b64encode(json.dumps({"id": key["id"], "created": 1700000000123}).encode("utf-8"))
+        self.assertLess(len(nexttoken.encode(key)), len(legacy.decode("utf-8").rstrip("=")))
+
+    def test_legacy_token(self):
+        token = base64.urlsafe_b64encode(json.dumps({"id": "abc", "n": 1.5}).encode("utf-8")).decode("utf-8").replace("=", "")
+        self.assertEqual(nexttoken.decode(token), {"id": "abc", "n": Decimal("1.5")})
+
+    def test_signed(self):
+        token = nexttoken.encode({"id": "abc"}, secret="hunter2")
+        self.assertEqual(nexttoken.decode(token, secret="hunter2"), {"id": "abc"})
+        with self.assertRaises(RuntimeError):
+            nexttoken.decode(token, secret="wrong")
+        with self.assertRaises(RuntimeError):
+            nexttoken.decode(nexttoken.encode({"id": "abc"}), secret="hunter2")
+
+    def test_tampered(self):
+        token = nexttoken.encode({"id": "abc"})
+        data = bytearray(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        with self.assertRaises(RuntimeError):
+            nexttoken.decode(base64.urlsafe_b64encode(bytes(data[:-1])).decode("ascii"))
+        # A map entry whose name runs past the end.
+        truncated = bytearray(base64.urlsafe_b64decode(nexttoken.encode({"name": "abc"}) + "=="))
+        with self.assertRaises(RuntimeError):
+            nexttoken.decode(base64.urlsafe_b64encode(bytes(truncated[:5])).decode("ascii"))
+        data[0] = 0x7F
+        with self.assertRaises(RuntimeError):
+            nexttoken.decode(base64.urlsafe_b64encode(bytes(data)).decode("ascii"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import unittest
+from datetime import datetime
+from decimal import Decimal
+import json
+from sneks.ddb import orm
+
+class TestEnsureDdbsafe(unittest.TestCase):
+
+    def test_matches_json_round_trip(self):
+        item = {
+            "f": 1.1,
+            "d": Decimal("2.50"),
+            "i": 3,
+            "b": True,
+            "n": None,
+            "s": "snek",
+            "e": "",
+            "when": datetime(2020, 1, 2, 3, 4, 5, 6),
+            "nested": {"l": [1.5, "", {"x": Decimal("7")}], 1: "int key"}
+        }
+        expected = json.loads(json.dumps({
+            "f": 1.1,
+            "d": 2.5,
+            "i": 3,
+            "b": True,
+            "n": None,
+            "s": "snek",
+            "e": None,
+            "when": "datetime:2020-01-02T03:04:05.000006Z",
+            "nested": {"l": [1.5, None, {"x": 7.0}], 1: "int key"}
+        }), parse_float=Decimal)
+        self.assertEqual(orm.ensure_ddbsafe(item), expected)
+        self.assertIsInstance(orm.ensure_ddbsafe(item)["f"], Decimal)
+
+    def test_does_not_modify_input(self):
+        item = {"l": [""], "m": {"f": 1.5}}
+        orm.ensure_ddbsafe(item)
+        self.assertEqual(item, {"l": [""], "m": {"f": 1.5}})
+
+    def test_unsupported_type(self):
+        with self.assertRaises(TypeError):
+            orm.ensure_ddbsafe({"x": object()})
+
+class Event(orm.StructuredObject):
+    _DATA_FIELDS = [
+        orm.DataField("id"),
+        orm.DataField("when", data_type="datetime"),
+        orm.DataField("attendees", data_type="int"),
+        orm.DataField("public", data_type="boolean"),
+        orm.DataField("notes", data_type="textarea")
+    ]
+
+class TestStructuredCodec(unittest.TestCase):
+
+    def test_decode_only_declared_fields(self):
+        raw = {
+            "id": "e1",
+            "when": "datetime:2020-01-02T03:04:05.000006Z",
+            "attendees": Decimal("12"),
+            "public": Decimal("1"),
+            "notes": "datetime:2020-01-02T03:04:05.000006Z",
+            "extra": Decimal("1.5"),
+            "nested": {"l": [Decimal("1")]}
+        }
+        decoded = Event._decode_item(raw)
+        self.assertEqual(decoded["when"], datetime(2020, 1, 2, 3, 4, 5, 6))
+        self.assertEqual((decoded["attendees"], type(decoded["attendees"])), (12, int))
+        self.assertIs(decoded["public"], True)
+        # Text and undeclared fields come back as they were stored.
+        self.assertEqual(decoded["notes"], raw["notes"])
+        self.assertEqual(decoded["extra"], Decimal("1.5"))
+        decoded["nested"]["l"].append(2)
+        self.assertEqual(raw["nested"], {"l": [Decimal("1")]})
+
+    def test_encode(self):
+        event = Event(id="e1", when=datetime(2020, 1, 2, 3, 4, 5, 6), attendees=3.0, public=1, notes="", extra=1.5)
+        self.assertEqual(Event._encode_item(event), {
+            "id": "e1",
+            "when": "datetime:2020-01-02T03:04:05.000006Z",
+            "attendees": 3,
+            "public": True,
+            "notes": None,
+            "extra": Decimal("1.5")
+        })
+        self.assertEqual(Event._decode_item(Event._encode_item(event))["when"], event["when"])
+
+    def test_fallback_without_fields(self):
+        class Unstructured(orm.StructuredObject):
+            pass
+        self.assertEqual(Unstructured._decode_item({"n": Decimal("2")}), {"n": 2.0})
+        self.assertIsInstance(Unstructured._decode_item({"n": Decimal("2")})["n"], float)
+
+if __name__ == '__main__':
+    unittest.main()
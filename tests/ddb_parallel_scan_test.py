@@ -0,0 +1,84 @@
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import threading
+import time
+import unittest
+from sneks.ddb import orm
+from sneks.ddb.memory import MemoryDynamoDB
+
+class Row(orm.DynamoObject):
+    @classmethod
+    def _SCHEMA(cls):
+        return {
+            "TableName": "rows",
+            "KeySchema": [{"AttributeName": "group", "KeyType": "HASH"}, {"AttributeName": "n", "KeyType": "RANGE"}],
+            "AttributeDefinitions": [{"AttributeName": "group", "AttributeType": "S"}, {"AttributeName": "n", "AttributeType": "N"}]
+        }
+
+class BrokenRow(Row):
+    # Segment 1 fails on its second page.
+    @classmethod
+    def scan(cls, **kwargs):
+        if kwargs.get("Segment") == 1 and kwargs.get("NextToken"):
+            raise RuntimeError("segment 1 failed")
+        return super().scan(**kwargs)
+
+class TestParallelScan(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MemoryDynamoDB()
+        orm.set_backend(self.db)
+        Row.create_table()
+        Row.save_many([Row(group="g{}".format(i % 7), n=i) for i in range(1, 201)], mode="batch")
+
+    def tearDown(self):
+        orm.set_backend(None)
+
+    def keys(self, rows):
+        return [(r["group"], int(r["n"])) for r in rows]
+
+    def test_fewer_workers_than_segments(self):
+        rows = self.keys(Row.scan_all(Segments=8, Workers=3, PageSize=10))
+        self.assertEqual(sorted(rows), sorted(self.keys(Row.scan_all())))
+        self.assertEqual(len(set(rows)), 200)
+
+    def test_max_results(self):
+        rows = self.keys(Row.scan_all(Segments=4, PageSize=5, MaxResults=12))
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(len(set(rows)), 12)
+
+    def test_progress_callback(self):
+        reports = []
+        lock = threading.Lock()
+
+        def progress(report):
+            with lock:
+                reports.append(report)
+
+        self.assertEqual(len(list(Row.scan_all(Segments=3, PageSize=20, ProgressCallback=progress))), 200)
+        last = {}
+        for report in reports:
+            self.assertGreater(report["Pages"], last.get(report["Segment"], {}).get("Pages", 0))
+            last[report["Segment"]] = report
+        self.assertEqual(sorted(last), [0, 1, 2])
+        self.assertTrue(all(r["Finished"] and r["TotalSegments"] == 3 for r in last.values()))
+        self.assertEqual(sum(r["Count"] for r in last.values()), 200)
+        self.assertGreater(sum(r["ConsumedCapacity"] for r in last.values()), 0)
+
+    def test_early_close(self):
+        rows = Row.scan_all(Segments=4, PageSize=2)
+        next(rows)
+        rows.close()
+        calls = self.db.calls["Scan"]
+        time.sleep(0.3)
+        # The workers had stopped by the time close() returned, well short of the 100 pages it would take to read everything.
+        self.assertEqual(self.db.calls["Scan"], calls)
+        self.assertLess(calls, 50)
+
+    def test_worker_error(self):
+        with self.assertRaisesRegex(RuntimeError, "segment 1 failed"):
+            list(BrokenRow.scan_all(Segments=3, PageSize=10))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import unittest
+from boto3.dynamodb.conditions import Attr, Key
+from sneks.ddb import orm
+from sneks.ddb.memory import MemoryDynamoDB
+
+class Account(orm.DynamoObject):
+    @classmethod
+    def _SCHEMA(cls):
+        return {
+            "TableName": "accounts",
+            "KeySchema": [{"AttributeName": "tenant", "KeyType": "HASH"}, {"AttributeName": "id", "KeyType": "RANGE"}],
+            "AttributeDefinitions": [
+                {"AttributeName": "tenant", "AttributeType": "S"},
+                {"AttributeName": "id", "AttributeType": "S"},
+                {"AttributeName": "email", "AttributeType": "S"},
+                {"AttributeName": "status", "AttributeType": "S"},
+                {"AttributeName": "created", "AttributeType": "N"}
+            ],
+            "GlobalSecondaryIndexes": [{
+                "IndexName": "by-email",
+                "KeySchema": [{"AttributeName": "email", "KeyType": "HASH"}],
+                "Projection": {"ProjectionType": "ALL"}
+            }, {
+                "IndexName": "by-status",
+                "KeySchema": [{"AttributeName": "status", "KeyType": "HASH"}, {"AttributeName": "created", "KeyType": "RANGE"}],
+                "Projection": {"ProjectionType": "INCLUDE", "NonKeyAttributes": ["plan"]}
+            }],
+            "LocalSecondaryIndexes": [{
+                "IndexName": "by-created",
+                "KeySchema": [{"AttributeName": "tenant", "KeyType": "HASH"}, {"AttributeName": "created", "KeyType": "RANGE"}],
+                "Projection": {"ProjectionType": "ALL"}
+            }]
+        }
+
+class TestPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MemoryDynamoDB()
+        orm.set_backend(self.db)
+        Account.create_table()
+        Account.save_many([
+            Account(tenant="t{}".format(i % 2), id="a{}".format(i), email="a{}@example.com".format(i),
+                    status="active" if i % 3 else "closed", created=i, plan="pro" if i % 4 else "free", name="n{}".format(i))
+            for i in range(1, 31)
+        ], mode="batch")
+
+    def tearDown(self):
+        orm.set_backend(None)
+
+    def test_picks_index(self):
+        plan = Account.explain(email="a7@example.com")
+        self.assertEqual((plan["Operation"], plan["IndexName"]), ("query", "by-email"))
+        self.assertEqual(plan["KeyConditions"], ["email eq 'a7@example.com'"])
+        self.assertEqual([c["Index"] for c in plan["Candidates"] if c["Usable"]], ["by-email"])
+        self.assertEqual([a["id"] for a in Account.find(email="a7@example.com")["Items"]], ["a7"])
+        self.assertEqual(self.db.calls.get("Scan", 0), 0)
+
+    def test_range_and_filter(self):
+        # The table and by-created both match on tenant, but only by-created also covers created.
+        plan = Account.explain(tenant="t1", created=["between", 5, 11], name="n7")
+        self.assertEqual((plan["Operation"], plan["IndexName"]), ("query", "by-created"))
+        self.assertEqual(plan["FilterConditions"], ["name eq 'n7'"])
+        self.assertEqual([a["id"] for a in Account.find_all(tenant="t1", created=["between", 5, 11], name="n7")], ["a7"])
+        # Without a range condition, the table wins the tie.
+        self.assertIsNone(Account.explain(tenant="t1", name="n7")["IndexName"])
+        # A ConsistentRead rules out global indexes.
+        self.assertEqual(Account.explain(email="a7@example.com", ConsistentRead=True)["Operation"], "scan")
+
+    def test_projection(self):
+        found = list(Account.find_all(status="closed", created=["gt", 20], plan="pro"))
+        self.assertEqual(sorted(a["id"] for a in found), ["a21", "a27", "a30"])
+        self.assertEqual(found[0]["name"], "n{}".format(int(found[0]["created"])))
+        # by-status doesn't project name, so it can't filter on it.
+        plan = Account.explain(status="closed", name="n3")
+        self.assertEqual(plan["Operation"], "scan")
+        self.assertIn("doesn't project name", [c["Reason"] for c in plan["Candidates"] if c["Index"] == "by-status"][0])
+
+    def test_scan_fallback(self):
+        plan = Account.explain(plan="free", FilterExpression=Attr("created").lt(10))
+        self.assertEqual((plan["Operation"], plan["IndexName"], plan["KeyConditions"]), ("scan", None, []))
+        self.assertEqual(sorted(a["id"] for a in Account.find_all(plan="free", FilterExpression=Attr("created").lt(10))), ["a4", "a8"])
+        self.assertEqual(self.db.calls.get("Query", 0), 0)
+
+    def test_explicit_search(self):
+        # Key conditions and scan segments given outright are passed through, with every attribute condition as a filter.
+        plan = Account.explain(HashKey="t0", plan="free")
+        self.assertEqual((plan["Operation"], plan["IndexName"], plan["KeyConditions"], plan["FilterConditions"]), ("query", None, [], ["plan eq 'free'"]))
+        self.assertEqual(sorted(a["id"] for a in Account.find_all(HashKey="t0", plan="free")), ["a12", "a16", "a20", "a24", "a28", "a4", "a8"])
+        condition = Key("tenant").eq("t1") & Key("id").begins_with("a1")
+        self.assertEqual(sorted(a["id"] for a in Account.find_all(KeyConditionExpression=condition, status="closed")), ["a15"])
+        segments = [Account.explain(Segment=s, TotalSegments=3, plan="free") for s in range(3)]
+        self.assertEqual(set((p["Operation"], tuple(p["FilterConditions"])) for p in segments), {("scan", ("plan eq 'free'",))})
+        found = [a["id"] for s in range(3) for a in Account.find_all(Segment=s, TotalSegments=3, plan="free")]
+        self.assertEqual(sorted(found), sorted(a["id"] for a in Account.find_all(plan="free")))
+        self.assertEqual(self.db.calls.get("Query", 0), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import threading
+import time
+import unittest
+from sneks.ddb import orm
+from sneks.ddb.identity import identity_map
+from sneks.ddb.memory import MemoryDynamoDB
+
+class Row(orm.DynamoObject):
+    @classmethod
+    def _SCHEMA(cls):
+        return {
+            "TableName": "rows",
+            "KeySchema": [{"AttributeName": "group", "KeyType": "HASH"}, {"AttributeName": "n", "KeyType": "RANGE"}],
+            "AttributeDefinitions": [{"AttributeName": "group", "AttributeType": "S"}, {"AttributeName": "n", "AttributeType": "N"}]
+        }
+
+class FakeSearch(object):
+    # Hands out numbered pages of one item each, recording how many it's been asked for.
+    def __init__(self, pages, fail_at=None):
+        self.pages = pages
+        self.fail_at = fail_at
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, NextToken=None, **kwargs):
+        with self.lock:
+            self.calls += 1
+        page = int(NextToken) if NextToken else 0
+        if page == self.fail_at:
+            raise RuntimeError("page {} failed".format(page))
+        return {"Items": [page], "NextToken": str(page + 1) if page + 1 < self.pages else None}
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+
+class TestPrefetch(unittest.TestCase):
+
+    def test_depth_bound(self):
+        search = FakeSearch(100)
+        pages = orm._prefetch_pages(search, 3)
+        self.assertEqual(next(pages)["Items"], [0])
+        wait_for(lambda: search.calls >= 4)
+        time.sleep(0.1)
+        # The one handed over plus three waiting.
+        self.assertEqual(search.calls, 4)
+        self.assertEqual([p["Items"][0] for p in pages], list(range(1, 100)))
+
+    def test_early_close(self):
+        search = FakeSearch(100)
+        pages = orm._prefetch_pages(search, 2)
+        next(pages)
+        pages.close()
+        time.sleep(0.3)
+        calls = search.calls
+        time.sleep(0.3)
+        self.assertEqual(search.calls, calls)
+        self.assertLessEqual(calls, 4)
+
+    def test_error(self):
+        pages = orm._prefetch_pages(FakeSearch(10, fail_at=3), 2)
+        with self.assertRaisesRegex(RuntimeError, "page 3 failed"):
+            for page in pages:
+                pass
+
+    def test_max_results(self):
+        search = FakeSearch(100)
+        items = list(orm.BaseDynamoObject._autopaginate_search(search, MaxResults=5, Prefetch=2))
+        self.assertEqual(items, [0, 1, 2, 3, 4])
+        time.sleep(0.3)
+        self.assertLessEqual(search.calls, 8)
+
+class TestPrefetchedSearch(unittest.TestCase):
+
+    def setUp(self):
+        orm.set_backend(MemoryDynamoDB())
+        Row.create_table()
+        Row.save_many([Row(group="g", n=i) for i in range(1, 51)], mode="batch")
+
+    def tearDown(self):
+        orm.set_backend(None)
+
+    def test_same_results(self):
+        plain = [r["n"] for r in Row.query_all(HashKey="g", PageSize=7)]
+        prefetched = [r["n"] for r in Row.query_all(HashKey="g", PageSize=7, Prefetch=3)]
+        self.assertEqual(prefetched, plain)
+        self.assertEqual(len([r for r in Row.query_all(HashKey="g", PageSize=7, Prefetch=3, MaxResults=10)]), 10)
+
+    def test_identity_map(self):
+        with identity_map():
+            rows = list(Row.scan_all(PageSize=10, Prefetch=2))
+            self.assertIs(Row.load(group="g", n=rows[0]["n"]), rows[0])
+
+if __name__ == '__main__':
+    unittest.main()
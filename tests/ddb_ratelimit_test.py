@@ -0,0 +1,105 @@
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import unittest
+from unittest import mock
+from botocore.exceptions import ClientError
+from sneks.ddb import orm, ratelimit
+from sneks.ddb.metrics import REGISTRY
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class FakeTable(object):
+    '''Fails its first few get_items with the given error code, then returns an item costing one unit.'''
+    name = "limited"
+
+    def __init__(self, failures, code="ProvisionedThroughputExceededException"):
+        self.failures = failures
+        self.code = code
+        self.calls = 0
+
+    def get_item(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ClientError({"Error": {"Code": self.code}}, "GetItem")
+        return {"Item": {"id": "a"}, "ConsumedCapacity": {"TableName": self.name, "CapacityUnits": 1.0}}
+
+class TestRateLimit(unittest.TestCase):
+
+    def test_bucket_debt(self):
+        clock = FakeClock()
+        bucket = ratelimit.TokenBucket(10, clock=clock)
+        self.assertEqual(bucket.reserve(10), 0)
+        self.assertAlmostEqual(bucket.reserve(5), 0.5)
+        clock.now = 1.5
+        self.assertEqual(bucket.reserve(5), 0)
+        bucket.adjust(-100)
+        self.assertEqual(bucket.tokens, 10)
+
+    def test_settle_tracks_consumption(self):
+        clock = FakeClock()
+        limiter = ratelimit.TableLimiter("t", read_capacity=4, clock=clock)
+        reserved = limiter.acquire("READ")
+        limiter.settle("READ", reserved, 5.0)
+        self.assertAlmostEqual(limiter.buckets["READ"].tokens, -1.0)
+        self.assertGreater(limiter.estimates["READ"], 1.0)
+        # No write budget configured, so writes are never held up.
+        self.assertEqual(limiter.acquire("WRITE"), 0)
+
+    def test_registry(self):
+        limiter = ratelimit.configure("some-table", read_capacity=100)
+        try:
+            self.assertIs(ratelimit.limiter_for("some-table"), limiter)
+            self.assertIn("some-table", ratelimit.stats())
+        finally:
+            ratelimit.remove("some-table")
+        self.assertIsNone(ratelimit.limiter_for("some-table"))
+
+    def test_is_throttle(self):
+        error = ClientError({"Error": {"Code": "ProvisionedThroughputExceededException"}}, "Query")
+        self.assertTrue(ratelimit.is_throttle(error))
+        error = ClientError({"Error": {"Code": "ValidationException"}}, "Query")
+        self.assertFalse(ratelimit.is_throttle(error))
+
+class TestSamTable(unittest.TestCase):
+
+    def setUp(self):
+        self.limiter = ratelimit.TableLimiter(FakeTable.name, read_capacity=1000, clock=FakeClock())
+        patches = [mock.patch.dict(ratelimit._LIMITERS, {FakeTable.name: self.limiter}), mock.patch.object(ratelimit, "THROTTLE_BACKOFF_BASE", 0)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_retry_then_succeed(self):
+        table = FakeTable(2)
+        with REGISTRY.scope() as scope:
+            self.assertEqual(orm.SamTable(table).get_item(Key={"id": "a"})["Item"], {"id": "a"})
+        self.assertEqual(table.calls, 3)
+        self.assertEqual((scope.totals()["Calls"], scope.totals()["Throttles"]), (1, 2))
+        self.assertEqual(self.limiter.stats()["Throttles"], 2)
+        # The throttles drained the bucket, so all that's left is the debt from the one call that worked.
+        self.assertAlmostEqual(self.limiter.buckets["READ"].tokens, -1.0)
+
+    def test_give_up(self):
+        table = FakeTable(ratelimit.THROTTLE_MAX_ATTEMPTS)
+        with REGISTRY.scope() as scope:
+            with self.assertRaises(ClientError):
+                orm.SamTable(table).get_item(Key={"id": "a"})
+        self.assertEqual(table.calls, ratelimit.THROTTLE_MAX_ATTEMPTS)
+        self.assertEqual((scope.totals()["Calls"], scope.totals()["Throttles"]), (0, ratelimit.THROTTLE_MAX_ATTEMPTS))
+
+    def test_other_errors_refund(self):
+        table = FakeTable(1, code="ValidationException")
+        with self.assertRaises(ClientError):
+            orm.SamTable(table).get_item(Key={"id": "a"})
+        self.assertEqual(table.calls, 1)
+        self.assertEqual(self.limiter.buckets["READ"].tokens, 1000)
+        self.assertEqual(self.limiter.estimates["READ"], 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
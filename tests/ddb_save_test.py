@@ -0,0 +1,156 @@
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import pickle
+import unittest
+from unittest import mock
+from botocore.exceptions import ClientError
+from sneks.ddb import orm
+from sneks.ddb.memory import MemoryDynamoDB
+
+class Note(orm.DynamoObject):
+    @classmethod
+    def _SCHEMA(cls):
+        return {
+            "TableName": "notes",
+            "KeySchema": [{"AttributeName": "id", "KeyType": "HASH"}],
+            "AttributeDefinitions": [{"AttributeName": "id", "AttributeType": "S"}]
+        }
+
+class TestSave(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MemoryDynamoDB()
+        orm.set_backend(self.db)
+        Note.create_table()
+        self.table = self.db.Table("notes")
+
+    def tearDown(self):
+        orm.set_backend(None)
+
+    def stored(self, id):
+        return self.table.get_item(Key={"id": id}).get("Item")
+
+    def test_unversioned_item(self):
+        # Written by something other than the ORM, so it has no __version__.
+        for force in [False, True]:
+            self.table.put_item(Item={"id": "a", "title": "old", "body": "kept"})
+            note = Note.load(id="a")
+            note["title"] = "new"
+            note.save(force=force)
+            self.assertEqual(self.stored("a"), {"id": "a", "title": "new", "body": "kept", orm.VERSION_KEY: 0})
+
+    def test_deleted_item(self):
+        Note(id="a", title="first").save()
+        for force in [False, True]:
+            note = Note.load(id="a")
+            self.table.delete_item(Key={"id": "a"})
+            note["title"] = "again"
+            note.save(force=force)
+            self.assertEqual(self.stored("a")["title"], "again")
+        # Only updating an existing item, it's gone, so there's nothing to do.
+        note = Note.load(id="a")
+        self.table.delete_item(Key={"id": "a"})
+        note["title"] = "modified"
+        with self.assertRaises(ClientError):
+            note.modify()
+        self.assertIsNone(self.stored("a"))
+
+    def test_version_conflict(self):
+        Note(id="a", title="first").save()
+        mine = Note.load(id="a")
+        theirs = Note.load(id="a")
+        theirs["title"] = "theirs"
+        theirs.save()
+        mine["title"] = "mine"
+        with self.assertRaises(ClientError):
+            mine.save()
+        mine.save(force=True)
+        self.assertEqual(self.stored("a")["title"], "mine")
+
+    def test_in_place_changes(self):
+        Note(id="a", tags=["x"], meta={"n": 1}, labels={"l"}, gone="g", title="t").save()
+        note = Note.load(id="a")
+        for value in note.values():
+            if isinstance(value, list):
+                value.append("y")
+        for k, value in note.items():
+            if k == "meta":
+                value["m"] = 2
+        held = note["labels"]
+        note.save()
+        held.add("later")
+        note |= {"title": "merged"}
+        note.save()
+        self.assertEqual(self.stored("a"), {"id": "a", "tags": ["x", "y"], "meta": {"n": 1, "m": 2}, "labels": {"l", "later"}, "gone": "g", "title": "merged", orm.VERSION_KEY: 2})
+        key, _ = note.popitem()
+        self.assertIn(key, note._removed_keys)
+
+    def test_pickle(self):
+        Note(id="a", title="t", tags={"x"}).save()
+        note = pickle.loads(pickle.dumps(Note.load(id="a")))
+        self.assertEqual(note, {"id": "a", "title": "t", "tags": {"x"}, orm.VERSION_KEY: 0})
+        self.assertEqual(note._changed_attributes(), ["tags"])
+        note["title"] = "changed"
+        note = pickle.loads(pickle.dumps(note))
+        note.save()
+        self.assertEqual(self.stored("a")["title"], "changed")
+        partial = pickle.loads(pickle.dumps(Note.load(id="a", Projection=["id"])))
+        self.assertEqual(partial["title"], "changed")
+
+class TestSaveMany(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MemoryDynamoDB()
+        orm.set_backend(self.db)
+        Note.create_table()
+        self.table = self.db.Table("notes")
+
+    def tearDown(self):
+        orm.set_backend(None)
+
+    def test_modes(self):
+        for mode in ["batch", "transact"]:
+            notes = Note.save_many([Note(id="{}{}".format(mode, i), n=i) for i in range(30)], mode=mode)
+            self.assertEqual([n[orm.VERSION_KEY] for n in notes], [0] * 30)
+            self.assertEqual(self.table.get_item(Key={"id": mode + "7"})["Item"]["n"], 7)
+        with self.assertRaises(RuntimeError):
+            Note.save_many([Note(id="a"), Note(id="a")])
+
+    def test_transaction_conflict(self):
+        notes = Note.save_many([Note(id="a"), Note(id="b")])
+        stale = Note.load(id="b")
+        Note.load(id="b").save()
+        notes[0]["x"] = 1
+        with self.assertRaises(ClientError):
+            Note.save_many([notes[0], stale])
+        self.assertEqual((notes[0][orm.VERSION_KEY], stale[orm.VERSION_KEY]), (0, 0))
+        self.assertNotIn("x", self.table.get_item(Key={"id": "a"})["Item"])
+
+    def test_batch_partly_unprocessed(self):
+        write = self.db.batch_write_item
+
+        def stuck_on_b(RequestItems, **kwargs):
+            # Writes everything except "b", which keeps coming back unprocessed.
+            stuck = {name: [r for r in requests if r["PutRequest"]["Item"]["id"] == "b"] for name, requests in RequestItems.items()}
+            response = write(RequestItems={name: [r for r in requests if r not in stuck[name]] for name, requests in RequestItems.items()}, **kwargs)
+            response["UnprocessedItems"] = {name: requests for name, requests in stuck.items() if requests}
+            return response
+
+        notes = [Note(id=id) for id in "abc"]
+        with mock.patch.object(self.db, "batch_write_item", stuck_on_b), mock.patch.object(orm, "BATCH_MAX_ATTEMPTS", 2), mock.patch.object(orm, "BATCH_BACKOFF_BASE", 0):
+            with self.assertRaises(RuntimeError):
+                Note.save_many(notes, mode="batch")
+        self.assertEqual([n[orm.VERSION_KEY] for n in notes], [0, -1, 0])
+        self.assertIsNone(self.stored_version("b"))
+        for note in (notes[0], notes[2]):
+            self.assertEqual(note[orm.VERSION_KEY], self.stored_version(note["id"]))
+            note["y"] = 1
+            note.save()
+
+    def stored_version(self, id):
+        item = self.table.get_item(Key={"id": id}).get("Item")
+        return item[orm.VERSION_KEY] if item else None
+
+if __name__ == '__main__':
+    unittest.main()
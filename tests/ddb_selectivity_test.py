@@ -0,0 +1,27 @@
+import unittest
+from boto3.dynamodb.conditions import Attr
+from sneks.ddb import selectivity
+
+class TestSelectivity(unittest.TestCase):
+
+    def test_filter_shape_ignores_values(self):
+        a = selectivity.filter_shape(Attr("status").eq("open") & Attr("age").gt(3))
+        b = selectivity.filter_shape(Attr("status").eq("closed") & Attr("age").gt(10))
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, selectivity.filter_shape(Attr("status").eq("open")))
+
+    def test_limit_from_observed_ratio(self):
+        tracker = selectivity.SelectivityTracker()
+        shape = selectivity.search_shape("table", {"FilterExpression": Attr("status").eq("open")})
+        self.assertEqual(tracker.limit_for(shape, 10), 10 * selectivity.DEFAULT_LIMIT_FACTOR)
+        tracker.observe(shape, 10, 1000)
+        self.assertEqual(tracker.limit_for(shape, 10), int(10 * selectivity.LIMIT_HEADROOM / 0.01))
+        tracker.observe(shape, 0, 0)
+        self.assertEqual(tracker.snapshot()["table||=(status,?)"]["Pages"], 1)
+
+    def test_unfiltered(self):
+        tracker = selectivity.SelectivityTracker()
+        self.assertEqual(tracker.limit_for(selectivity.search_shape("table", {}), 10), 10)
+
+if __name__ == '__main__':
+    unittest.main()
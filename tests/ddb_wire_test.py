@@ -0,0 +1,124 @@
+import os
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+import unittest
+from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.types import Binary, TypeDeserializer, TypeSerializer
+from botocore.stub import ANY, Stubber
+from datetime import datetime
+from decimal import Decimal
+from sneks.ddb import orm, wire
+from sneks.ddb.memory import MemoryDynamoDB
+
+ITEM = {
+    "id": "a",
+    "n": Decimal("12.5"),
+    "big": Decimal("123456789012345678901234567890"),
+    "when": "datetime:2020-01-02T03:04:05.000006Z",
+    "short": "datetime:2020-01-02T03:04:05.5Z",
+    "fake": "datetime:not really",
+    "flag": True,
+    "nothing": None,
+    "blob": Binary(b"\x00\x01"),
+    "strings": {"x", "y"},
+    "numbers": {Decimal("1"), Decimal("2.5")},
+    "nested": {"l": [Decimal("1"), "datetime:2021-05-06T07:08:09.000000Z", {"deep": "x"}]}
+}
+
+def to_wire(item):
+    serializer = TypeSerializer()
+    return {k: serializer.serialize(v) for k, v in item.items()}
+
+class Thing(orm.DynamoObject):
+    _WIRE_READS = True
+
+    @classmethod
+    def _SCHEMA(cls):
+        return {
+            "TableName": "wire-things",
+            "KeySchema": [{"AttributeName": "id", "KeyType": "HASH"}],
+            "AttributeDefinitions": [{"AttributeName": "id", "AttributeType": "S"}]
+        }
+
+class StructuredThing(orm.StructuredObject):
+    _WIRE_READS = True
+    _DATA_FIELDS = [orm.DataField("id"), orm.DataField("count", data_type="int")]
+
+    @classmethod
+    def _SCHEMA(cls):
+        return Thing._SCHEMA()
+
+class TestDecode(unittest.TestCase):
+
+    def test_matches_resource_layer(self):
+        deserializer = TypeDeserializer()
+        expected = orm._fix_types({k: deserializer.deserialize(v) for k, v in to_wire(ITEM).items()})
+        decoded = wire.decode_item(to_wire(ITEM))
+        self.assertEqual(decoded, expected)
+        self.assertEqual(decoded["when"], datetime(2020, 1, 2, 3, 4, 5, 6))
+        self.assertEqual(decoded["short"], datetime(2020, 1, 2, 3, 4, 5, 500000))
+        self.assertEqual(decoded["fake"], "datetime:not really")
+        self.assertIsInstance(decoded["n"], float)
+
+    def test_datetime_format_matches_orm(self):
+        self.assertEqual(wire.DATETIME_FORMAT, orm.DATETIME_FORMAT)
+
+class TestWireReads(unittest.TestCase):
+
+    def setUp(self):
+        self.stubber = Stubber(Thing.WIRE_TABLE().table.client)
+        self.stubber.activate()
+
+    def tearDown(self):
+        self.stubber.deactivate()
+
+    def test_query(self):
+        self.stubber.add_response("query", {
+            "Items": [to_wire(ITEM)],
+            "Count": 1,
+            "ScannedCount": 2,
+            "LastEvaluatedKey": {"id": {"S": "a"}}
+        }, {
+            "TableName": "wire-things",
+            "KeyConditionExpression": "#n0 = :v0",
+            "FilterExpression": "#n1 > :v1",
+            "ExpressionAttributeNames": {"#n0": "id", "#n1": "n"},
+            "ExpressionAttributeValues": {":v0": {"S": "a"}, ":v1": {"N": "1"}},
+            "ReturnConsumedCapacity": ANY
+        })
+        response = Thing.query(HashKey="a", FilterExpression=Attr("n").gt(1))
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(len(response["Items"]), 1)
+        self.assertIsInstance(response["Items"][0], Thing)
+        self.assertEqual(response["Items"][0]["when"], datetime(2020, 1, 2, 3, 4, 5, 6))
+        self.assertEqual(orm.nexttoken.decode(response["NextToken"]), {"id": "a"})
+
+    def test_load(self):
+        self.stubber.add_response("get_item", {"Item": to_wire(ITEM)}, {"TableName": "wire-things", "Key": {"id": {"S": "a"}}, "ReturnConsumedCapacity": ANY})
+        self.stubber.add_response("get_item", {}, {"TableName": "wire-things", "Key": {"id": {"S": "b"}}, "ReturnConsumedCapacity": ANY})
+        self.assertEqual(Thing.load(id="a")["n"], 12.5)
+        self.assertIsNone(Thing.load(id="b"))
+
+    def test_structured(self):
+        # Same types as the resource layer path gives, whichever way the item is read.
+        raw = dict(ITEM, count=Decimal("3"))
+        stubber = Stubber(StructuredThing.WIRE_TABLE().table.client)
+        stubber.add_response("get_item", {"Item": to_wire(raw)}, {"TableName": "wire-things", "Key": {"id": {"S": "a"}}, "ReturnConsumedCapacity": ANY})
+        with stubber:
+            loaded = StructuredThing.load(id="a")
+        self.assertEqual(loaded, StructuredThing._decode_item(raw))
+        self.assertIsInstance(loaded["count"], int)
+        self.assertIsInstance(loaded["n"], Decimal)
+        self.assertIsNot(StructuredThing.WIRE_TABLE(), Thing.WIRE_TABLE())
+
+    def test_other_backends_skip_it(self):
+        with orm.use_backend(MemoryDynamoDB()):
+            self.assertIsNone(Thing.WIRE_TABLE())
+            Thing.create_table()
+            Thing(id="a", n=1).save()
+            self.assertEqual(Thing.load(id="a")["n"], 1.0)
+
+if __name__ == '__main__':
+    unittest.main()